@@ -1,20 +1,48 @@
 """
 Модуль для управления авторизацией
+
+Токен сессии самодостаточен и подписан HMAC-SHA256:
+
+    base64url({"u": username, "exp": expires_at, "jti": id}).base64url(подпись)
+
+Streamlit выдает токен без записи в файл, Dash проверяет подпись и срок
+действия без чтения общего хранилища, поэтому сервисам нужен только общий
+секрет SESSION_SECRET. Проверенные токены кешируются в процессе; список
+отозванных токенов (REVOKED_SESSIONS_FILE) читается только при промахе кеша
+и не чаще, чем меняется файл.
 """
 
+import base64
 import hashlib
-import secrets
-from datetime import datetime, timedelta
+import hmac
 import json
 import os
+import secrets
+import time
 from pathlib import Path
 
 from app.config import USERS
 
-# Путь к файлу с сессиями
-SESSIONS_FILE = Path("app/sessions.json")
 # Время жизни сессии (в часах)
 SESSION_LIFETIME_HOURS = 24
+# Секрет для подписи токенов, должен совпадать у Streamlit и Dash
+SESSION_SECRET = os.getenv("SESSION_SECRET", "").encode()
+if not SESSION_SECRET:
+    # Ключ, выведенный из известных данных, позволил бы подделывать токены
+    raise RuntimeError(
+        "Не задан SESSION_SECRET: укажите одинаковый случайный секрет для Streamlit и Dash"
+    )
+# Файл со списком отозванных токенов {jti: expires_at}
+REVOKED_SESSIONS_FILE = Path(os.getenv("REVOKED_SESSIONS_FILE", "data/revoked_sessions.json"))
+# Через сколько секунд проверенный токен снова сверяется со списком отозванных
+REVOCATION_CHECK_SECONDS = 60
+# Максимальный размер кеша проверенных токенов
+TOKEN_CACHE_SIZE = 10_000
+
+# token -> (username, expires_at, checked_at)
+_token_cache = {}
+# Отозванные токены и время изменения файла, из которого они прочитаны
+_revoked = {"mtime": None, "ids": {}}
 
 
 def hash_password(password: str) -> str:
@@ -22,99 +50,109 @@ def hash_password(password: str) -> str:
     return hashlib.sha256(password.encode()).hexdigest()
 
 
-def generate_session_token() -> str:
-    """Генерирует уникальный токен сессии"""
-    return secrets.token_urlsafe(32)
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
 
 
-def load_sessions() -> dict:
-    """Загружает сессии из файла"""
-    if SESSIONS_FILE.exists():
-        try:
-            with open(SESSIONS_FILE, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception:
-            return {}
-    return {}
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
 
 
-def save_sessions(sessions: dict):
-    """Сохраняет сессии в файл"""
-    SESSIONS_FILE.parent.mkdir(parents=True, exist_ok=True)
-    with open(SESSIONS_FILE, "w", encoding="utf-8") as f:
-        json.dump(sessions, f, indent=2, ensure_ascii=False)
+def _sign(payload: str) -> str:
+    return _b64encode(hmac.new(SESSION_SECRET, payload.encode(), hashlib.sha256).digest())
 
 
 def create_session(username: str) -> str:
-    """Создает новую сессию для пользователя"""
-    sessions = load_sessions()
-    token = generate_session_token()
-    expires_at = (datetime.now() + timedelta(hours=SESSION_LIFETIME_HOURS)).isoformat()
-
-    sessions[token] = {
-        "username": username,
-        "created_at": datetime.now().isoformat(),
-        "expires_at": expires_at,
+    """Создает подписанный токен сессии для пользователя"""
+    claims = {
+        "u": username,
+        "exp": int(time.time() + SESSION_LIFETIME_HOURS * 3600),
+        "jti": secrets.token_urlsafe(12),
     }
-
-    save_sessions(sessions)
-    return token
+    payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode())
+    return f"{payload}.{_sign(payload)}"
+
+
+def _decode_token(token: str):
+    """Проверяет подпись и возвращает данные токена (None для поддельного)"""
+    payload, _, signature = token.partition(".")
+    if not signature or not hmac.compare_digest(signature.encode(), _sign(payload).encode()):
+        return None
+    try:
+        return json.loads(_b64decode(payload))
+    except ValueError:
+        return None
+
+
+def _revoked_ids() -> dict:
+    """Отозванные токены; файл перечитывается только после изменения"""
+    try:
+        mtime = REVOKED_SESSIONS_FILE.stat().st_mtime_ns
+    except OSError:
+        return {}
+    if mtime != _revoked["mtime"]:
+        try:
+            with open(REVOKED_SESSIONS_FILE, "r", encoding="utf-8") as f:
+                ids = json.load(f)
+        except Exception:
+            ids = {}
+        _revoked.update(mtime=mtime, ids=ids)
+    return _revoked["ids"]
 
 
-def validate_session(token: str) -> bool:
-    """Проверяет валидность токена сессии"""
+def _session(token: str):
+    """Возвращает (username, expires_at) для действующего токена или None"""
     if not token:
-        return False
-
-    sessions = load_sessions()
-    if token not in sessions:
-        return False
-
-    session = sessions[token]
-    expires_at = datetime.fromisoformat(session["expires_at"])
-
+        return None
+
+    now = time.time()
+    cached = _token_cache.get(token)
+    if cached is None or now - cached[2] > REVOCATION_CHECK_SECONDS:
+        # Промах кеша: проверяем подпись и список отозванных
+        claims = _decode_token(token)
+        if claims is None or claims.get("jti") in _revoked_ids():
+            _token_cache.pop(token, None)
+            return None
+        if len(_token_cache) >= TOKEN_CACHE_SIZE:
+            _token_cache.clear()
+        cached = (claims.get("u", ""), claims.get("exp", 0), now)
+        _token_cache[token] = cached
+
+    username, expires_at, _ = cached
     # Проверяем срок действия
-    if datetime.now() > expires_at:
-        # Удаляем истекшую сессию
-        del sessions[token]
-        save_sessions(sessions)
-        return False
+    if now > expires_at:
+        _token_cache.pop(token, None)
+        return None
+    return username, expires_at
 
-    return True
+
+def validate_session(token: str) -> bool:
+    """Проверяет валидность токена сессии"""
+    return _session(token) is not None
 
 
 def get_session_username(token: str) -> str:
     """Получает имя пользователя из сессии"""
-    sessions = load_sessions()
-    if token in sessions:
-        return sessions[token].get("username", "")
-    return ""
+    session = _session(token)
+    return session[0] if session else ""
 
 
 def delete_session(token: str):
-    """Удаляет сессию"""
-    sessions = load_sessions()
-    if token in sessions:
-        del sessions[token]
-        save_sessions(sessions)
-
-
-def cleanup_expired_sessions():
-    """Удаляет истекшие сессии"""
-    sessions = load_sessions()
-    now = datetime.now()
-    expired_tokens = []
-
-    for token, session in sessions.items():
-        expires_at = datetime.fromisoformat(session["expires_at"])
-        if now > expires_at:
-            expired_tokens.append(token)
-
-    for token in expired_tokens:
-        del sessions[token]
-
-    if expired_tokens:
-        save_sessions(sessions)
+    """
+    Отзывает токен: добавляет его в список отозванных. Истекшие токены
+    при этом удаляются из списка, отдельная очистка не нужна.
+    """
+    _token_cache.pop(token, None)
+    claims = _decode_token(token) if token else None
+    if claims is None:
+        return
+
+    now = time.time()
+    revoked = {jti: exp for jti, exp in _revoked_ids().items() if exp > now}
+    revoked[claims["jti"]] = claims["exp"]
+    REVOKED_SESSIONS_FILE.parent.mkdir(parents=True, exist_ok=True)
+    with open(REVOKED_SESSIONS_FILE, "w", encoding="utf-8") as f:
+        json.dump(revoked, f)
 
 
 # Предустановленные пользователи (в продакшене лучше хранить в БД)
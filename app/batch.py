@@ -0,0 +1,580 @@
+"""
+Модуль для пакетного расчета метрик без Dash сервера
+
+Файлы читаются потоково (частями по CHUNK_SIZE строк) и сразу сворачиваются
+до частичных агрегатов (месяц -> отсортированный массив client_id), поэтому
+в памяти не хранятся исходные транзакции. Несколько входных файлов
+обрабатываются в отдельных процессах, агрегаты объединяются и могут
+сохраняться для обработки частей выгрузки на разных машинах.
+В приближенном режиме вместо агрегатов строятся скетчи HyperLogLog (app/sketches.py).
+С бюджетом памяти агрегаты, которые в него не помещаются, сбрасываются
+на диск и объединяются внешней сортировкой (app/spill.py).
+"""
+
+import glob
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from app.forecast import extrapolate_series
+from app.metrics import calculate_metrics, calculate_metrics_approx
+from app.periods import DEFAULT_FREQ, START_FREQ
+from app.partials import PARTIALS_SUFFIX, PartialAggregate, load_partials, save_partials
+from app.preprocessing import preprocessing_data_approx
+from app.profiling import stage
+from app.sketches import (
+    DEFAULT_PRECISION,
+    SKETCHES_SUFFIX,
+    PeriodSketches,
+    load_sketches,
+    save_sketches,
+)
+from app.spill import (
+    BYTES_PER_PAIR,
+    MEMORY_BUDGET,
+    SPILL_DIR,
+    ExternalAggregate,
+    estimate_memory,
+    limit_memory,
+    merge_state_list,
+    merge_states,
+    parse_size,
+    spill_directory,
+)
+from app.survival import aggregate_survival_tables
+
+# Размер части файла при потоковом чтении (в строках)
+CHUNK_SIZE = 1_000_000
+# Колонки с множествами клиентов и служебные колонки, которые не выгружаются в результат
+SET_COLUMNS = ["clients", "clients_prev", "clients_prev_year", "clients_intersection_period"]
+# Значение колонки segment для метрик по всей базе
+ALL_SEGMENTS = "all"
+
+
+def expand_inputs(patterns) -> list:
+    """Раскрывает пути и glob-шаблоны во входные файлы"""
+    paths = []
+    for pattern in patterns:
+        matches = glob.glob(pattern, recursive=True)
+        if not matches and os.path.isfile(pattern):
+            matches = [pattern]
+        paths.extend(matches)
+    paths = sorted(set(paths))
+    if not paths:
+        raise FileNotFoundError(f"Не найдено входных файлов: {', '.join(patterns)}")
+    return paths
+
+
+def _file_format(path: str) -> str:
+    name = path.lower()
+    for suffix in (".gz", ".zst", ".bz2", ".xz", ".zip"):
+        if name.endswith(suffix):
+            name = name[: -len(suffix)]
+    if name.endswith((".parquet", ".pq")):
+        return "parquet"
+    if name.endswith((".xls", ".xlsx")):
+        return "excel"
+    return "csv"
+
+
+def iter_chunks(path, columns, chunksize=CHUNK_SIZE):
+    """Читает файл частями, оставляя только нужные колонки"""
+    file_format = _file_format(path)
+    if file_format == "parquet":
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile(path)
+        for batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+    elif file_format == "excel":
+        # Excel не поддерживает потоковое чтение
+        yield pd.read_excel(path, usecols=columns)
+    else:
+        yield from pd.read_csv(path, usecols=columns, chunksize=chunksize)
+
+
+def forecast_metrics(df_metrics, months_forward, freq=DEFAULT_FREQ):
+    """
+    Строит прогноз оттока и притока так же, как дашборд.
+
+    months_forward - горизонт в периодах гранулярности freq.
+    """
+    dates = pd.PeriodIndex(df_metrics["year_month"], freq=freq).to_timestamp()
+    churn = pd.Series(df_metrics["churn_month"].fillna(0).values, index=dates)
+    growth = pd.Series(
+        df_metrics["growth_rate_month"]
+        .replace([np.inf, -np.inf], np.nan)
+        .fillna(0)
+        .values,
+        index=dates,
+    )
+    churn_ext = extrapolate_series(
+        churn, months_forward=months_forward, freq=START_FREQ[freq]
+    )
+    growth_ext = extrapolate_series(
+        growth, months_forward=months_forward, freq=START_FREQ[freq]
+    )
+    if churn_ext is None or growth_ext is None:
+        return pd.DataFrame(
+            columns=["year_month", "churn_month_forecast", "growth_rate_month_forecast"]
+        )
+
+    return pd.DataFrame(
+        {
+            "year_month": churn_ext.index[len(dates):].to_period(freq).astype(str),
+            "churn_month_forecast": churn_ext.values[len(dates):],
+            "growth_rate_month_forecast": growth_ext.values[len(dates):],
+        }
+    )
+
+
+def _finalize(df_metrics, forecast_months, freq):
+    df_metrics = df_metrics.drop(columns=SET_COLUMNS, errors="ignore")
+    df_metrics["year_month"] = df_metrics["year_month"].astype(str)
+    forecast = (
+        forecast_metrics(df_metrics, forecast_months, freq=freq) if forecast_months else None
+    )
+    return df_metrics, forecast
+
+
+def _collect(groups, forecast_months, freq=DEFAULT_FREQ):
+    """
+    Считает метрики для списка сегментов [(segment, func)], где func()
+    возвращает таблицу метрик. Ошибка в отдельном сегменте не прерывает расчет.
+    """
+    metrics_parts, forecast_parts = [], []
+    for segment, func in groups:
+        try:
+            df_metrics, forecast = _finalize(func(), forecast_months, freq)
+        except Exception as e:
+            if segment == ALL_SEGMENTS:
+                raise
+            print(f"Сегмент '{segment}' пропущен: {e}", file=sys.stderr)
+            continue
+        df_metrics.insert(0, "segment", segment)
+        metrics_parts.append(df_metrics)
+        if forecast is not None:
+            forecast.insert(0, "segment", segment)
+            forecast_parts.append(forecast)
+
+    metrics = pd.concat(metrics_parts, ignore_index=True)
+    forecasts = pd.concat(forecast_parts, ignore_index=True) if forecast_parts else None
+    return metrics, forecasts
+
+
+def _read_segments(
+    path, columns, segment_col, chunksize, build, stage_name, limit=None, budget=None
+):
+    """
+    Потоково читает файл и строит состояние build(part) для всей базы
+    и каждого сегмента.
+
+    Частичные агрегаты частей копятся в буфере и объединяются с накопленным
+    состоянием одной сортировкой, когда буфер дорастает до его размера
+    (объединение каждой части пересортировывало бы состояние целиком и
+    давало бы квадратичное время). С limit буфер объединяется и limit
+    (сброс на диск) применяется, когда оценка памяти превышает budget.
+    Скетчи объединяются сразу: их объединение не зависит от объема данных.
+    """
+    states, pending = {}, {}
+    pending_rows = 0
+
+    def merge_pending():
+        for segment, parts in pending.items():
+            if segment in states:
+                parts = [states[segment], *parts]
+            states[segment] = merge_state_list(parts)
+        pending.clear()
+
+    with stage(stage_name) as rec:
+        total_rows = 0
+        for chunk in iter_chunks(path, columns, chunksize):
+            total_rows += len(chunk)
+            parts = [(ALL_SEGMENTS, chunk)]
+            if segment_col:
+                parts += [(str(value), part) for value, part in chunk.groupby(segment_col)]
+            for segment, part in parts:
+                state = build(part)
+                if isinstance(state, PartialAggregate):
+                    pending.setdefault(segment, []).append(state)
+                    pending_rows += state.rows
+                elif segment in states:
+                    states[segment] = merge_states(states[segment], state)
+                else:
+                    states[segment] = state
+
+            if not pending:
+                continue
+            state_memory = sum(estimate_memory(state) for state in states.values())
+            over_budget = (
+                limit is not None
+                and budget is not None
+                and state_memory + pending_rows * BYTES_PER_PAIR > budget
+            )
+            if over_budget or pending_rows * BYTES_PER_PAIR >= state_memory:
+                merge_pending()
+                pending_rows = 0
+                if over_budget:
+                    states = limit(states)
+        merge_pending()
+        if limit:
+            states = limit(states)
+        rec["rows"] = total_rows
+    return states
+
+
+def read_input_partials(
+    path,
+    date_col,
+    client_id_col,
+    segment_col=None,
+    chunksize=CHUNK_SIZE,
+    freq=DEFAULT_FREQ,
+    amount_col=None,
+    memory_budget=None,
+    spill_dir=None,
+):
+    """
+    Потоково читает файл и строит частичные агрегаты по периодам freq
+    (с amount_col - вместе с суммами по клиентам для метрик выручки).
+
+    Возвращает словарь {segment: PartialAggregate}, где ALL_SEGMENTS - вся база.
+    Файлы PARTIALS_SUFFIX (сохраненные агрегаты) загружаются без пересчета
+    и при необходимости сворачиваются в более крупную гранулярность.
+    С memory_budget (в байтах) агрегаты, оценка памяти которых превышает
+    бюджет, сбрасываются в spill_dir и возвращаются как ExternalAggregate
+    (app/spill.py).
+    """
+    limit = None
+    if memory_budget is not None:
+        limit = partial(limit_memory, budget=memory_budget, directory=spill_dir)
+    if path.endswith(PARTIALS_SUFFIX):
+        states = {
+            segment: aggregate.rollup(freq)
+            for segment, aggregate in load_partials(path).items()
+        }
+        return limit(states) if limit else states
+    if path.endswith(SKETCHES_SUFFIX):
+        raise ValueError("Скетчи поддерживаются только в приближенном режиме (--approximate)")
+    columns = [date_col, client_id_col] + [c for c in (segment_col, amount_col) if c]
+    return _read_segments(
+        path,
+        columns,
+        segment_col,
+        chunksize,
+        lambda part: PartialAggregate.from_frame(
+            part, date_col, client_id_col, freq=freq, amount_col=amount_col
+        ),
+        "batch_read_input_partials",
+        limit,
+        memory_budget,
+    )
+
+
+def read_input_sketches(
+    path,
+    date_col,
+    client_id_col,
+    segment_col=None,
+    chunksize=CHUNK_SIZE,
+    precision=DEFAULT_PRECISION,
+):
+    """
+    Потоково читает файл и строит скетчи HyperLogLog по месяцам.
+
+    Возвращает словарь {segment: PeriodSketches}, где ALL_SEGMENTS - вся база.
+    Размер результата не зависит от количества транзакций и клиентов.
+    Файлы SKETCHES_SUFFIX (сохраненные скетчи) загружаются без пересчета.
+    """
+    if path.endswith(PARTIALS_SUFFIX):
+        raise ValueError("Частичные агрегаты поддерживаются только в точном режиме")
+    if path.endswith(SKETCHES_SUFFIX):
+        return load_sketches(path)
+    columns = [date_col, client_id_col] + ([segment_col] if segment_col else [])
+    return _read_segments(
+        path,
+        columns,
+        segment_col,
+        chunksize,
+        lambda part: PeriodSketches.from_frame(part, date_col, client_id_col, p=precision),
+        "batch_read_input_sketches",
+    )
+
+
+def merge_segment_states(items, memory_budget=None, spill_dir=None) -> dict:
+    """
+    Объединяет словари {segment: состояние}, где состояние - PartialAggregate,
+    ExternalAggregate или PeriodSketches. С memory_budget агрегаты сбрасываются
+    на диск, если оценка памяти превышает бюджет.
+    """
+    merged = {}
+    for states in items:
+        for segment, state in states.items():
+            if segment in merged:
+                state = merge_states(merged[segment], state)
+            merged[segment] = state
+        merged = limit_memory(merged, memory_budget, spill_dir)
+    return merged
+
+
+def _segments(states) -> list:
+    return [ALL_SEGMENTS] + sorted(s for s in states if s != ALL_SEGMENTS)
+
+
+def compute_metrics_partials(partials, forecast_months=0):
+    """Считает метрики по частичным агрегатам {segment: PartialAggregate}"""
+
+    def metrics_for(aggregate):
+        return lambda: calculate_metrics(aggregate.to_grouped())
+
+    freq = partials[ALL_SEGMENTS].freq if ALL_SEGMENTS in partials else DEFAULT_FREQ
+    return _collect(
+        [(segment, metrics_for(partials[segment])) for segment in _segments(partials)],
+        forecast_months,
+        freq,
+    )
+
+
+def compute_metrics_approx(sketches, forecast_months=0):
+    """Считает приближенные метрики по скетчам {segment: PeriodSketches}"""
+
+    def metrics_for(segment_sketches):
+        return lambda: calculate_metrics_approx(
+            preprocessing_data_approx(sketches=segment_sketches)
+        )
+
+    return _collect(
+        [(segment, metrics_for(sketches[segment])) for segment in _segments(sketches)],
+        forecast_months,
+    )
+
+
+def _read_func(
+    date_col,
+    client_id_col,
+    segment_col,
+    chunksize,
+    approximate,
+    freq,
+    amount_col,
+    memory_budget=None,
+    spill_dir=None,
+):
+    options = dict(
+        date_col=date_col,
+        client_id_col=client_id_col,
+        segment_col=segment_col,
+        chunksize=chunksize,
+    )
+    if approximate:
+        if freq != DEFAULT_FREQ:
+            raise ValueError("Приближенный режим поддерживает только помесячный расчет")
+        if amount_col:
+            raise ValueError("Приближенный режим не поддерживает метрики выручки")
+        return partial(read_input_sketches, **options)
+    return partial(
+        read_input_partials,
+        freq=freq,
+        amount_col=amount_col,
+        memory_budget=memory_budget,
+        spill_dir=spill_dir,
+        **options,
+    )
+
+
+def compute_survival(partials, memory_budget=None):
+    """
+    Строит кривые выживаемости и время жизни по когортам (app/survival.py)
+    для всей базы и каждого сегмента {segment: PartialAggregate}.
+    """
+    curves_parts, lifetime_parts = [], []
+    for segment in _segments(partials):
+        curves, lifetimes = aggregate_survival_tables(partials[segment], memory_budget)
+        curves.insert(0, "segment", segment)
+        lifetimes.insert(0, "segment", segment)
+        curves_parts.append(curves)
+        lifetime_parts.append(lifetimes)
+    return (
+        pd.concat(curves_parts, ignore_index=True),
+        pd.concat(lifetime_parts, ignore_index=True),
+    )
+
+
+def _compute(states, forecast_months, approximate, survival, memory_budget=None):
+    """Возвращает таблицу метрик и словарь дополнительных таблиц"""
+    if approximate:
+        if survival:
+            raise ValueError("Приближенный режим не поддерживает анализ выживаемости")
+        metrics, forecasts = compute_metrics_approx(states, forecast_months)
+    else:
+        metrics, forecasts = compute_metrics_partials(states, forecast_months)
+
+    tables = {}
+    if forecasts is not None:
+        tables["forecast"] = forecasts
+    if survival:
+        tables["survival"], tables["lifetime"] = compute_survival(states, memory_budget)
+    return metrics, tables
+
+
+def _process_file(
+    path,
+    date_col,
+    client_id_col,
+    segment_col,
+    forecast_months,
+    chunksize,
+    approximate,
+    freq,
+    amount_col,
+    survival,
+    memory_budget=None,
+    spill_dir=None,
+):
+    read = _read_func(
+        date_col,
+        client_id_col,
+        segment_col,
+        chunksize,
+        approximate,
+        freq,
+        amount_col,
+        memory_budget,
+        spill_dir,
+    )
+    metrics, tables = _compute(read(path), forecast_months, approximate, survival, memory_budget)
+    for table in [metrics, *tables.values()]:
+        table.insert(0, "source", os.path.basename(path))
+    return metrics, tables
+
+
+def _map(func, items, jobs):
+    if jobs == 1 or len(items) == 1:
+        return list(map(func, items))
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(func, items))
+
+
+def process_inputs(
+    paths,
+    date_col="date",
+    client_id_col="client_id",
+    segment_col=None,
+    forecast_months=0,
+    per_file=False,
+    jobs=None,
+    chunksize=CHUNK_SIZE,
+    approximate=False,
+    partials_output=None,
+    freq=DEFAULT_FREQ,
+    amount_col=None,
+    survival=False,
+    memory_budget=MEMORY_BUDGET,
+    spill_dir=SPILL_DIR,
+    sketches_output=None,
+):
+    """
+    Считает метрики по списку файлов.
+
+    Возвращает таблицу метрик и словарь дополнительных таблиц: "forecast"
+    (прогноз, если forecast_months > 0), "survival" и "lifetime" (кривые
+    выживаемости и время жизни по когортам, если survival=True).
+
+    По умолчанию файлы считаются частями одной выгрузки: каждый файл
+    сворачивается в отдельном процессе, затем результаты объединяются.
+    С per_file=True метрики считаются для каждого файла отдельно.
+
+    Файлы сворачиваются в частичные агрегаты (app/partials.py). На вход можно
+    передавать и ранее сохраненные агрегаты (*.partials.npz), а с
+    partials_output объединенные агрегаты сохраняются для следующих запусков.
+    С approximate=True вместо множеств клиентов строятся скетчи HyperLogLog;
+    ранее сохраненные скетчи (*.sketches.npz) тоже можно передавать на вход,
+    а с sketches_output объединенные скетчи сохраняются.
+    freq задает гранулярность периодов (D, W, M или Q), amount_col - колонку
+    с суммой для метрик выручки (NRR, GRR, расширение и сокращение).
+
+    memory_budget (байты или строка вида "6G") ограничивает память группировки:
+    после превышения бюджета агрегаты сбрасываются в spill_dir и метрики
+    считаются внешней сортировкой (app/spill.py).
+    """
+    jobs = jobs or os.cpu_count() or 1
+    memory_budget = parse_size(memory_budget)
+    # Файлы читаются параллельно, поэтому бюджет делится между процессами
+    workers = 1 if jobs == 1 else min(jobs, len(paths))
+    job_budget = memory_budget // workers if memory_budget is not None else None
+
+    with spill_directory(memory_budget, spill_dir) as directory:
+        if per_file:
+            func = partial(
+                _process_file,
+                date_col=date_col,
+                client_id_col=client_id_col,
+                segment_col=segment_col,
+                forecast_months=forecast_months,
+                chunksize=chunksize,
+                approximate=approximate,
+                freq=freq,
+                amount_col=amount_col,
+                survival=survival,
+                memory_budget=job_budget,
+                spill_dir=directory,
+            )
+            results = _map(func, paths, jobs)
+            metrics = pd.concat([r[0] for r in results], ignore_index=True)
+            tables = {
+                name: pd.concat([r[1][name] for r in results], ignore_index=True)
+                for name in results[0][1]
+            }
+            return metrics, tables
+
+        states = merge_segment_states(
+            _map(
+                _read_func(
+                    date_col,
+                    client_id_col,
+                    segment_col,
+                    chunksize,
+                    approximate,
+                    freq,
+                    amount_col,
+                    job_budget,
+                    directory,
+                ),
+                paths,
+                jobs,
+            ),
+            memory_budget,
+            directory,
+        )
+        if partials_output:
+            if approximate:
+                raise ValueError("Частичные агрегаты поддерживаются только в точном режиме")
+            if any(isinstance(state, ExternalAggregate) for state in states.values()):
+                raise ValueError(
+                    "Агрегаты не помещаются в бюджет памяти и сброшены на диск, "
+                    "сохранение частичных агрегатов недоступно: увеличьте бюджет памяти"
+                )
+            save_partials(partials_output, states)
+        if sketches_output:
+            if not approximate:
+                raise ValueError("Скетчи сохраняются только в приближенном режиме (--approximate)")
+            save_sketches(sketches_output, states)
+        return _compute(states, forecast_months, approximate, survival, memory_budget)
+
+
+def write_table(df, path):
+    """Сохраняет таблицу в формате по расширению файла: parquet, json или csv"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    name = path.lower()
+    if name.endswith((".parquet", ".pq")):
+        df.to_parquet(path, index=False)
+    elif name.endswith(".json"):
+        df.to_json(path, orient="records", force_ascii=False, indent=2)
+    else:
+        df.to_csv(path, index=False)
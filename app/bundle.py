@@ -0,0 +1,188 @@
+"""
+Модуль для сохранения результатов расчета в один файл (бандл)
+
+Бандл - сжатый .npz без pickle:
+
+- header - JSON с версией формата, исходным именем файла, датой создания
+  и описанием таблиц (колонки и типы);
+- tables/<таблица>/<тип> - таблицы метрик всех гранулярностей, прогнозов,
+  кривых выживаемости и времени жизни; колонки одного типа хранятся одним
+  двумерным массивом, как блоки pandas;
+- index/* - агрегат клиентов по дням (app/partials.py), из которого можно
+  пересчитать метрики любой гранулярности без исходных транзакций.
+
+Таблицы читаются без загрузки индекса клиентов (массивы .npz читаются
+по отдельности), поэтому бандл открывается за миллисекунды.
+
+Копии бандлов в BUNDLES_DIR хранятся не дольше BUNDLE_TTL_HOURS и не больше
+MAX_BUNDLES последних, лишние удаляются при сохранении нового бандла.
+"""
+
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from app.datasets import DATA_DIR, cleanup_expired, is_valid_id, new_id
+from app.partials import partials_arrays, partials_from_arrays
+
+BUNDLE_FORMAT_VERSION = 1
+# Суффикс файлов с результатами расчета
+BUNDLE_SUFFIX = ".metrics.npz"
+# Директория с бандлами, сохраненными при расчете метрик в дашборде
+BUNDLES_DIR = DATA_DIR / "bundles"
+# Время хранения бандлов в часах (0 - без ограничения)
+BUNDLE_TTL_HOURS = float(os.getenv("BUNDLE_TTL_HOURS", "24"))
+# Сколько последних бандлов хранится (0 - без ограничения)
+MAX_BUNDLES = int(os.getenv("MAX_BUNDLES", "100"))
+
+_TABLES_PREFIX = "tables/"
+_INDEX_PREFIX = "index/"
+
+
+def _encode_column(series: pd.Series):
+    """Колонка таблицы в массив numpy и название типа для восстановления"""
+    if isinstance(series.dtype, pd.PeriodDtype):
+        return series.array.asi8, series.dtype.name
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        return series.to_numpy(dtype="datetime64[ns]"), "datetime64[ns]"
+    if series.dtype == object:
+        # Строки сохраняются как строки numpy, чтобы не требовать pickle
+        return series.astype(str).to_numpy(dtype=str), "object"
+    return series.to_numpy(), series.dtype.name
+
+
+def _decode_column(values: np.ndarray, dtype: str):
+    if dtype.startswith("period"):
+        # period[M], period[W-SUN] ...
+        return pd.PeriodIndex.from_ordinals(values, freq=dtype[len("period["):-1])
+    if dtype == "object":
+        return values.astype(object)
+    return values
+
+
+def bundle_path(bundle_id: str):
+    """Путь к бандлу, сохраненному в BUNDLES_DIR"""
+    if not is_valid_id(bundle_id):
+        raise ValueError(f"Некорректный идентификатор результатов: {bundle_id}")
+    return BUNDLES_DIR / f"{bundle_id}{BUNDLE_SUFFIX}"
+
+
+def save_bundle(file, tables: dict, partials=None, filename=""):
+    """
+    Сохраняет таблицы {name: DataFrame} и агрегат {segment: PartialAggregate}
+    в сжатый .npz. file - путь или открытый на запись бинарный файл.
+    """
+    arrays = {}
+    header = {
+        "version": BUNDLE_FORMAT_VERSION,
+        "filename": filename,
+        "created_at": datetime.now().isoformat(),
+        "tables": {},
+    }
+    for name, df in tables.items():
+        # Чтение каждого массива .npz имеет накладные расходы, поэтому
+        # колонки одного типа объединяются в один массив
+        blocks, dtypes = {}, []
+        for column in df.columns:
+            values, dtype = _encode_column(df[column])
+            blocks.setdefault(dtype, []).append(values)
+            dtypes.append(dtype)
+        for dtype, columns in blocks.items():
+            arrays[f"{_TABLES_PREFIX}{name}/{dtype}"] = np.stack(columns)
+        header["tables"][name] = {"columns": [str(c) for c in df.columns], "dtypes": dtypes}
+    if partials:
+        for key, values in partials_arrays(partials).items():
+            arrays[f"{_INDEX_PREFIX}{key}"] = values
+
+    np.savez_compressed(
+        file, header=np.array(json.dumps(header, ensure_ascii=False)), **arrays
+    )
+
+
+def cleanup_bundles():
+    """Удаляет бандлы старше BUNDLE_TTL_HOURS и самые старые сверх MAX_BUNDLES"""
+    cleanup_expired(BUNDLES_DIR, BUNDLE_TTL_HOURS)
+    if MAX_BUNDLES <= 0 or not BUNDLES_DIR.exists():
+        return
+    bundles = []
+    for path in BUNDLES_DIR.glob(f"*{BUNDLE_SUFFIX}"):
+        try:
+            bundles.append((path.stat().st_mtime, path))
+        except OSError:
+            # Файл мог удалить другой процесс
+            continue
+    bundles.sort()
+    for _, path in bundles[: max(len(bundles) - MAX_BUNDLES, 0)]:
+        path.unlink(missing_ok=True)
+
+
+def store_bundle(tables: dict, partials=None, filename="") -> str:
+    """Сохраняет бандл в BUNDLES_DIR и возвращает его идентификатор"""
+    bundle_id = new_id()
+    BUNDLES_DIR.mkdir(parents=True, exist_ok=True)
+    save_bundle(bundle_path(bundle_id), tables, partials, filename=filename)
+    cleanup_bundles()
+    return bundle_id
+
+
+def store_bundle_bytes(data: bytes) -> str:
+    """Сохраняет в BUNDLES_DIR копию загруженного бандла и возвращает ее идентификатор"""
+    bundle_id = new_id()
+    BUNDLES_DIR.mkdir(parents=True, exist_ok=True)
+    bundle_path(bundle_id).write_bytes(data)
+    cleanup_bundles()
+    return bundle_id
+
+
+def load_bundle(file, with_index=False) -> dict:
+    """
+    Загружает бандл: {"filename", "created_at", "tables": {name: DataFrame},
+    "index": {segment: PartialAggregate} или None}.
+
+    Индекс клиентов читается только с with_index=True.
+    """
+    try:
+        data = np.load(file, allow_pickle=False)
+    except ValueError:
+        data = None
+    if not isinstance(data, np.lib.npyio.NpzFile) or "header" not in data.files:
+        raise ValueError("Файл не является файлом результатов расчета")
+
+    with data:
+        header = json.loads(str(data["header"]))
+        if header.get("version") != BUNDLE_FORMAT_VERSION:
+            raise ValueError(
+                f"Неподдерживаемая версия файла результатов: {header.get('version')}"
+            )
+
+        tables = {}
+        for name, spec in header["tables"].items():
+            blocks = {
+                dtype: iter(data[f"{_TABLES_PREFIX}{name}/{dtype}"])
+                for dtype in dict.fromkeys(spec["dtypes"])
+            }
+            tables[name] = pd.DataFrame(
+                {
+                    column: _decode_column(next(blocks[dtype]), dtype)
+                    for column, dtype in zip(spec["columns"], spec["dtypes"])
+                }
+            )
+
+        index = None
+        if with_index:
+            arrays = {
+                key[len(_INDEX_PREFIX):]: data[key]
+                for key in data.files
+                if key.startswith(_INDEX_PREFIX)
+            }
+            index = partials_from_arrays(arrays) if arrays else None
+
+    return {
+        "filename": header.get("filename", ""),
+        "created_at": header.get("created_at"),
+        "tables": tables,
+        "index": index,
+    }
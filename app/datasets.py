@@ -0,0 +1,163 @@
+"""
+Модуль для хранения загруженных наборов данных на сервере
+
+Каждый набор данных хранится в отдельной директории DATASETS_DIR/<id>:
+файл с данными (data.csv, data.parquet или data.xlsx) и meta.json
+с исходным именем файла и списком колонок. В Dash callbacks передается
+только идентификатор набора. Наборы старше DATASET_TTL_HOURS удаляются
+при создании новых (cleanup_expired).
+"""
+
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+# Корневая директория для данных сервера
+DATA_DIR = Path(os.getenv("DATA_DIR", "data"))
+# Директория с наборами данных
+DATASETS_DIR = DATA_DIR / "datasets"
+# Количество строк для предпросмотра в таблице
+PREVIEW_ROWS = 1000
+# Время хранения наборов данных и незавершенных загрузок (в часах)
+DATASET_TTL_HOURS = float(os.getenv("DATASET_TTL_HOURS", "24"))
+
+_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+_FORMAT_SUFFIXES = {"csv": ".csv", "parquet": ".parquet", "excel": ".xlsx"}
+
+
+def new_id() -> str:
+    """Генерирует идентификатор набора данных или загрузки"""
+    return uuid.uuid4().hex
+
+
+def is_valid_id(value) -> bool:
+    """Проверяет формат идентификатора (защита от обхода путей)"""
+    return isinstance(value, str) and bool(_ID_RE.match(value))
+
+
+def detect_format(filename: str) -> str:
+    """Определяет формат файла по имени (без учета сжатия)"""
+    name = filename.lower()
+    for suffix in (".gz", ".gzip", ".zst", ".zstd"):
+        if name.endswith(suffix):
+            name = name[: -len(suffix)]
+    if name.endswith((".parquet", ".pq")):
+        return "parquet"
+    if name.endswith((".xls", ".xlsx")):
+        return "excel"
+    return "csv"
+
+
+def dataset_dir(dataset_id: str) -> Path:
+    if not is_valid_id(dataset_id):
+        raise ValueError(f"Некорректный идентификатор набора данных: {dataset_id}")
+    return DATASETS_DIR / dataset_id
+
+
+def dataset_path(dataset_id: str) -> Path:
+    """Возвращает путь к файлу с данными набора"""
+    meta = load_meta(dataset_id)
+    return dataset_dir(dataset_id) / f"data{_FORMAT_SUFFIXES[meta['format']]}"
+
+
+def load_meta(dataset_id: str) -> dict:
+    """Загружает метаданные набора данных"""
+    meta_path = dataset_dir(dataset_id) / "meta.json"
+    if not meta_path.exists():
+        raise FileNotFoundError(f"Набор данных {dataset_id} не найден")
+    with open(meta_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def read_columns(path, file_format: str) -> list:
+    """Читает список колонок без загрузки данных"""
+    import pandas as pd
+
+    if file_format == "parquet":
+        import pyarrow.parquet as pq
+
+        return list(pq.ParquetFile(path).schema_arrow.names)
+    if file_format == "excel":
+        return list(pd.read_excel(path, nrows=0).columns)
+    return list(pd.read_csv(path, nrows=0).columns)
+
+
+def create_dataset(write_data, filename: str) -> dict:
+    """
+    Создает набор данных.
+
+    write_data(file_obj) записывает данные в открытый на запись бинарный файл,
+    что позволяет копировать и распаковывать данные потоково.
+    """
+    cleanup_expired(DATASETS_DIR)
+    dataset_id = new_id()
+    file_format = detect_format(filename)
+    directory = dataset_dir(dataset_id)
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"data{_FORMAT_SUFFIXES[file_format]}"
+    try:
+        with open(path, "wb") as f:
+            write_data(f)
+        meta = {
+            "dataset_id": dataset_id,
+            "filename": filename,
+            "format": file_format,
+            "size": path.stat().st_size,
+            "columns": read_columns(path, file_format),
+            "created_at": datetime.now().isoformat(),
+        }
+    except Exception:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
+
+    with open(directory / "meta.json", "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    return meta
+
+
+def read_preview(dataset_id: str, nrows: int = PREVIEW_ROWS):
+    """Читает первые строки набора данных для предпросмотра"""
+    import pandas as pd
+
+    meta = load_meta(dataset_id)
+    path = dataset_path(dataset_id)
+    if meta["format"] == "parquet":
+        import pyarrow.parquet as pq
+
+        batch = next(pq.ParquetFile(path).iter_batches(batch_size=nrows), None)
+        return batch.to_pandas() if batch is not None else pd.DataFrame()
+    if meta["format"] == "excel":
+        return pd.read_excel(path, nrows=nrows)
+    return pd.read_csv(path, nrows=nrows)
+
+
+def delete_dataset(dataset_id: str):
+    """Удаляет набор данных"""
+    shutil.rmtree(dataset_dir(dataset_id), ignore_errors=True)
+
+
+def cleanup_expired(directory: Path, ttl_hours: float = None):
+    """
+    Удаляет файлы и поддиректории directory, которые не изменялись
+    дольше ttl_hours (по умолчанию DATASET_TTL_HOURS)
+    """
+    ttl_hours = DATASET_TTL_HOURS if ttl_hours is None else ttl_hours
+    if ttl_hours <= 0 or not directory.exists():
+        return
+    deadline = time.time() - ttl_hours * 3600
+    for path in directory.iterdir():
+        try:
+            if path.stat().st_mtime >= deadline:
+                continue
+            if path.is_dir():
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                path.unlink(missing_ok=True)
+        except OSError:
+            # Файл мог удалить другой процесс
+            continue
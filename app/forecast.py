@@ -0,0 +1,44 @@
+"""
+Модуль для прогнозирования временных рядов метрик
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def extrapolate_series(ts, months_forward=12, degree=1, freq="MS"):
+    """
+    Экстраполяция временного ряда с помощью полиномиальной аппроксимации
+
+    months_forward - горизонт в периодах, freq - частота pd.date_range
+    для дат начала периодов (см. START_FREQ в app/periods.py).
+    """
+    if len(ts) < 3:
+        return None
+
+    # Убеждаемся, что индекс это DatetimeIndex
+    if not isinstance(ts.index, pd.DatetimeIndex):
+        # Если это не DatetimeIndex, пытаемся преобразовать
+        if hasattr(ts.index, "to_timestamp"):
+            ts_index = ts.index.to_timestamp()
+        else:
+            ts_index = pd.to_datetime(ts.index)
+        ts = pd.Series(ts.values, index=ts_index)
+
+    x = np.arange(len(ts))
+    y = ts.values
+    coeffs = np.polyfit(x, y, degree)
+    poly = np.poly1d(coeffs)
+    x_future = np.arange(len(ts) + months_forward)
+    y_future = poly(x_future)
+
+    # Создаем DatetimeIndex для прогноза
+    start_date = ts.index[0]
+    if isinstance(start_date, pd.Timestamp):
+        idx = pd.date_range(start_date, periods=len(x_future), freq=freq)
+    else:
+        # Если это не Timestamp, преобразуем
+        start_date = pd.to_datetime(start_date)
+        idx = pd.date_range(start_date, periods=len(x_future), freq=freq)
+
+    return pd.Series(y_future, index=idx)
@@ -1,44 +1,141 @@
-from app.utils import clients_intersection_vectorized, clients_intersection, clients_new_vectorized, clients_new
+import numpy as np
 
+from app.utils import clients_intersection, clients_new
+from app.profiling import profiled
+from app.sketches import estimate_counts
 
+# Columns added by calculate_metrics_approx
+APPROX_COLUMNS = [
+    f"{name}{suffix}"
+    for suffix in ("", "_year")
+    for name in ("clients_intersection", "clients_new")
+] + [
+    f"{name}_{suffix}"
+    for suffix in ("month", "year")
+    for name in ("growth_rate", "retention", "churn")
+] + ["retention_period", "new_clients_period"]
+
+
+@profiled()
 def calculate_metrics(df_grouped):
     """
     Calculate the metrics for the data.
+
+    The period counts and overlaps come precomputed from preprocessing_data
+    (clients_prev_count, clients_intersection and their _year variants).
+    Tables built on disk (app/spill.py) have no client sets and carry
+    the overlap of the first and the last period instead.
     """
 
-    df_grouped["clients_intersection"] = clients_intersection_vectorized(
-        df_grouped["clients_prev"], df_grouped["clients"]
+    df_grouped["clients_new"] = df_grouped["clients_count"] - df_grouped["clients_intersection"]
+    df_grouped["growth_rate_month"] = (
+        df_grouped["clients_new"] / df_grouped["clients_prev_count"]
     )
-    df_grouped["clients_new"] = clients_new_vectorized(
-        df_grouped["clients_prev"], df_grouped["clients"]
+    df_grouped["retention_month"] = (
+        df_grouped["clients_intersection"] / df_grouped["clients_prev_count"]
     )
-
-    df_grouped["growth_rate_month"] = df_grouped["clients_new"] / df_grouped[
-        "clients_prev"
-    ].apply(len)
-    df_grouped["retention_month"] = df_grouped["clients_intersection"] / df_grouped[
-        "clients_prev"
-    ].apply(len)
     df_grouped["churn_month"] = 1 - df_grouped["retention_month"]
 
-    df_grouped["clients_intersection_year"] = clients_intersection_vectorized(
-        df_grouped["clients_prev_year"], df_grouped["clients"]
+    df_grouped["clients_new_year"] = (
+        df_grouped["clients_count"] - df_grouped["clients_intersection_year"]
     )
-    df_grouped["clients_new_year"] = clients_new_vectorized(
-        df_grouped["clients_prev_year"], df_grouped["clients"]
+    df_grouped["growth_rate_year"] = (
+        df_grouped["clients_new_year"] / df_grouped["clients_prev_year_count"]
+    )
+    df_grouped["retention_year"] = (
+        df_grouped["clients_intersection_year"] / df_grouped["clients_prev_year_count"]
     )
-    df_grouped["growth_rate_year"] = df_grouped["clients_new_year"] / df_grouped[
-        "clients_prev_year"
-    ].apply(len)
-    df_grouped["retention_year"] = df_grouped["clients_intersection_year"] / df_grouped[
-        "clients_prev_year"
-    ].apply(len)
     df_grouped["churn_year"] = 1 - df_grouped["retention_year"]
-    
-    retention_period = clients_intersection(df_grouped[df_grouped['year_month'] == df_grouped['year_month'].max()]["clients"].values[0], df_grouped[df_grouped['year_month'] == df_grouped['year_month'].min()]["clients"].values[0]) / df_grouped[df_grouped['year_month'] == df_grouped['year_month'].min()]["clients"].apply(len)
-    df_grouped['retention_period'] = retention_period
-
-    new_clients_period = clients_new(df_grouped[df_grouped['year_month'] == df_grouped['year_month'].max()]["clients"].values[0], df_grouped[df_grouped['year_month'] == df_grouped['year_month'].min()]["clients"].values[0]) / df_grouped[df_grouped['year_month'] == df_grouped['year_month'].min()]["clients"].apply(len)
-    df_grouped['new_clients_period'] = new_clients_period
-    
-    return df_grouped
\ No newline at end of file
+
+    if df_grouped.empty:
+        # No completed period (e.g. a short history at a coarse granularity):
+        # the table keeps the metric columns but has no rows
+        df_grouped["retention_period"] = np.nan
+        df_grouped["new_clients_period"] = np.nan
+    elif "clients" in df_grouped.columns:
+        retention_period = clients_intersection(df_grouped[df_grouped['year_month'] == df_grouped['year_month'].max()]["clients"].values[0], df_grouped[df_grouped['year_month'] == df_grouped['year_month'].min()]["clients"].values[0]) / df_grouped[df_grouped['year_month'] == df_grouped['year_month'].min()]["clients"].apply(len)
+        df_grouped['retention_period'] = retention_period
+
+        new_clients_period = clients_new(df_grouped[df_grouped['year_month'] == df_grouped['year_month'].max()]["clients"].values[0], df_grouped[df_grouped['year_month'] == df_grouped['year_month'].min()]["clients"].values[0]) / df_grouped[df_grouped['year_month'] == df_grouped['year_month'].min()]["clients"].apply(len)
+        df_grouped['new_clients_period'] = new_clients_period
+    else:
+        # Table without client sets (app/spill.py): the overlap of the first
+        # and the last period is precomputed in the first row
+        first = df_grouped.iloc[:1]
+        df_grouped["retention_period"] = (
+            first["clients_intersection_period"] / first["clients_count"]
+        )
+        df_grouped["new_clients_period"] = (
+            first["clients_count"] - first["clients_intersection_period"]
+        ) / first["clients_count"]
+
+    if "revenue" in df_grouped.columns:
+        calculate_revenue_metrics(df_grouped)
+
+    return df_grouped
+
+
+def calculate_revenue_metrics(df_grouped):
+    """
+    Calculate the value-weighted metrics from the revenue columns (see app/revenue.py).
+
+    nrr/grr are net and gross revenue retention of the previous period's
+    clients, expansion/contraction/revenue_churn are shares of their revenue.
+    """
+    for suffix, name in (("month", ""), ("year", "_year")):
+        revenue_prev = df_grouped[f"revenue_prev{name}"]
+        df_grouped[f"nrr_{suffix}"] = df_grouped[f"revenue_retained{name}"] / revenue_prev
+        df_grouped[f"expansion_{suffix}"] = df_grouped[f"revenue_expansion{name}"] / revenue_prev
+        df_grouped[f"contraction_{suffix}"] = (
+            df_grouped[f"revenue_contraction{name}"] / revenue_prev
+        )
+        df_grouped[f"revenue_churn_{suffix}"] = df_grouped[f"revenue_churned{name}"] / revenue_prev
+        df_grouped[f"grr_{suffix}"] = (
+            1 - df_grouped[f"contraction_{suffix}"] - df_grouped[f"revenue_churn_{suffix}"]
+        )
+
+    return df_grouped
+
+@profiled()
+def calculate_metrics_approx(df_grouped):
+    """
+    Calculate the metrics from HyperLogLog sketches (approximate mode).
+
+    Intersections are estimated as |A| + |B| - |A | B|, see app/sketches.py
+    for the error bounds.
+    """
+    if df_grouped.empty:
+        for column in APPROX_COLUMNS:
+            df_grouped[column] = np.nan
+        return df_grouped
+
+    clients = np.stack(df_grouped["clients"].to_numpy())
+    clients_count = estimate_counts(clients)
+
+    for prev_col, suffix in (("clients_prev", "month"), ("clients_prev_year", "year")):
+        prev = np.stack(df_grouped[prev_col].to_numpy())
+        prev_count = np.where(prev.any(axis=1), estimate_counts(prev), 0.0)
+        union_count = estimate_counts(np.maximum(prev, clients))
+        intersection = np.clip(prev_count + clients_count - union_count, 0, None)
+        intersection = np.minimum(intersection, np.minimum(prev_count, clients_count))
+        new = clients_count - intersection
+
+        name = "" if suffix == "month" else "_year"
+        df_grouped[f"clients_intersection{name}"] = intersection
+        df_grouped[f"clients_new{name}"] = new
+        with np.errstate(divide="ignore", invalid="ignore"):
+            df_grouped[f"growth_rate_{suffix}"] = new / prev_count
+            df_grouped[f"retention_{suffix}"] = intersection / prev_count
+        df_grouped[f"churn_{suffix}"] = 1 - df_grouped[f"retention_{suffix}"]
+
+    first, last = clients[0], clients[-1]
+    first_count, last_count = estimate_counts(np.stack([first, last]))
+    union_count = estimate_counts(np.maximum(first, last))[0]
+    intersection = min(max(first_count + last_count - union_count, 0), first_count, last_count)
+    df_grouped["retention_period"] = intersection / first_count if first_count else np.nan
+    # Как и в точном расчете: клиенты первого периода, которых нет в последнем
+    df_grouped["new_clients_period"] = (
+        (first_count - intersection) / first_count if first_count else np.nan
+    )
+
+    return df_grouped
@@ -0,0 +1,277 @@
+"""
+Модуль для частичных агрегатов (map-reduce по частям выгрузки)
+
+Частичный агрегат хранит для каждого периода отсортированный массив
+уникальных client_id, а также минимальную и максимальную дату. Агрегаты
+строятся по каждой части выгрузки (месяцу, региону, файлу) независимо,
+объединяются ассоциативно и коммутативно (объединение множеств по периодам)
+и сохраняются в .npz, поэтому части можно считать параллельно или на разных
+машинах. Результат объединения совпадает с агрегатом по всей выгрузке.
+
+Агрегат по дням можно свернуть в недели, месяцы и кварталы (rollup), поэтому
+для смены гранулярности достаточно один раз построить самый мелкий агрегат.
+"""
+
+import numpy as np
+import pandas as pd
+
+from app.periods import DEFAULT_FREQ, ROLLUPS, check_freq, year_lag
+from app.revenue import add_revenue_columns, sum_by_period_client
+
+PARTIALS_FORMAT_VERSION = 1
+# Суффикс файлов с сохраненными частичными агрегатами
+PARTIALS_SUFFIX = ".partials.npz"
+
+
+def _split(ordinals, *arrays):
+    """Разбивает отсортированные по периоду массивы на части по периодам"""
+    periods = np.unique(ordinals)
+    bounds = np.searchsorted(ordinals, np.append(periods, np.iinfo(np.int64).max))
+    return periods, [
+        [array[start:end] for start, end in zip(bounds[:-1], bounds[1:])] for array in arrays
+    ]
+
+
+def _group_pairs(ordinals, values, amounts=None):
+    """
+    Группирует пары (период, клиент) в отсортированные массивы по периодам.
+
+    С amounts суммы по парам считаются в той же группировке.
+    Возвращает периоды, массивы клиентов и массивы сумм (или None).
+    """
+    if amounts is not None:
+        ordinals, values, amounts = sum_by_period_client(ordinals, values, amounts)
+        periods, (clients, sums) = _split(ordinals, values, amounts)
+        return periods, clients, sums
+
+    # drop_duplicates по порядковым номерам int64 намного быстрее, чем по Period.
+    # Транзакции без client_id не относятся ни к одному клиенту
+    pairs = pd.DataFrame({"period": ordinals, "client": values}).dropna(subset=["client"])
+    pairs = pairs.drop_duplicates().sort_values(["period", "client"])
+    periods, (clients,) = _split(pairs["period"].to_numpy(), pairs["client"].to_numpy())
+    return periods, clients, None
+
+
+class PartialAggregate:
+    """
+    Частичный агрегат клиентов по периодам.
+
+    periods - отсортированный PeriodIndex с гранулярностью freq (см.
+    app/periods.py), clients - список отсортированных массивов client_id той же
+    длины. amounts (необязательно) - суммы по тем же клиентам для расчета
+    выручки (app/revenue.py). min_date и max_date нужны, чтобы диапазон
+    периодов совпадал с расчетом по исходным данным в preprocessing_data.
+    """
+
+    def __init__(
+        self, periods, clients, min_date=None, max_date=None, freq=DEFAULT_FREQ, amounts=None
+    ):
+        self.freq = check_freq(freq)
+        self.periods = pd.PeriodIndex(periods, freq=freq)
+        self.clients = list(clients)
+        self.amounts = list(amounts) if amounts is not None else None
+        self.min_date = min_date
+        self.max_date = max_date
+
+    @classmethod
+    def from_frame(
+        cls, df, date_col="date", client_id_col="client_id", freq=DEFAULT_FREQ, amount_col=None
+    ):
+        """Строит агрегат по таблице транзакций за один проход"""
+        dates = pd.to_datetime(df[date_col])
+        periods, clients, amounts = _group_pairs(
+            dates.dt.to_period(check_freq(freq)).array.asi8,
+            df[client_id_col].to_numpy(),
+            df[amount_col].to_numpy(dtype=np.float64) if amount_col else None,
+        )
+        return cls(
+            pd.PeriodIndex.from_ordinals(periods, freq=freq),
+            clients,
+            min_date=dates.min() if len(dates) else None,
+            max_date=dates.max() if len(dates) else None,
+            freq=freq,
+            amounts=amounts,
+        )
+
+    def flat(self):
+        """Возвращает пары (период, клиент) плоскими массивами: ordinals, clients, amounts"""
+        lengths = [len(values) for values in self.clients]
+        ordinals = np.repeat(self.periods.asi8, lengths)
+        clients = np.concatenate(self.clients) if self.clients else np.array([])
+        amounts = None
+        if self.amounts is not None:
+            amounts = np.concatenate(self.amounts) if self.amounts else np.array([])
+        return ordinals, clients, amounts
+
+    def _regroup(self, ordinals, clients, amounts, freq, min_date, max_date):
+        periods, clients, amounts = _group_pairs(ordinals, clients, amounts)
+        return PartialAggregate(
+            pd.PeriodIndex.from_ordinals(periods, freq=freq),
+            clients,
+            min_date=min_date,
+            max_date=max_date,
+            freq=freq,
+            amounts=amounts,
+        )
+
+    def merge(self, other: "PartialAggregate") -> "PartialAggregate":
+        """Объединяет агрегаты (операция ассоциативна и коммутативна)"""
+        return merge_partials([self, other])
+
+    def rollup(self, freq: str) -> "PartialAggregate":
+        """
+        Собирает агрегат более крупной гранулярности объединением множеств
+        клиентов по вложенным периодам, без повторного чтения транзакций.
+        """
+        if freq == self.freq:
+            return self
+        if freq not in ROLLUPS[self.freq]:
+            raise ValueError(f"Гранулярность '{self.freq}' нельзя свернуть в '{freq}'")
+        lengths = [len(values) for values in self.clients]
+        _, clients, amounts = self.flat()
+        return self._regroup(
+            np.repeat(self.periods.asfreq(freq).asi8, lengths),
+            clients,
+            amounts,
+            freq,
+            self.min_date,
+            self.max_date,
+        )
+
+    @property
+    def rows(self) -> int:
+        """Количество пар (период, клиент)"""
+        return sum(len(values) for values in self.clients)
+
+    def to_grouped(self):
+        """
+        Возвращает таблицу в формате preprocessing_data, по которой
+        можно вызвать calculate_metrics. С суммами добавляются колонки выручки.
+        """
+        from app.preprocessing import grouped_from_pairs
+
+        ordinals, clients, amounts = self.flat()
+        df_grouped = grouped_from_pairs(
+            ordinals, clients, self.min_date, self.max_date, freq=self.freq
+        )
+        if self.amounts is not None and len(df_grouped):
+            add_revenue_columns(df_grouped, ordinals, clients, amounts, year_lag(self.freq))
+        return df_grouped
+
+
+def merge_partials(aggregates: list) -> PartialAggregate:
+    """
+    Объединяет список агрегатов за одну сортировку. Попарное объединение
+    каждой новой части с накопленным агрегатом пересортировывает его
+    целиком, поэтому части выгрузки лучше объединять списком.
+    """
+    first = aggregates[0]
+    for other in aggregates[1:]:
+        if other.freq != first.freq:
+            raise ValueError("Нельзя объединить агрегаты с разной гранулярностью")
+        if (other.amounts is None) != (first.amounts is None):
+            raise ValueError("Нельзя объединить агрегаты с суммами и без сумм")
+    if len(aggregates) == 1:
+        return first
+    parts = [aggregate.flat() for aggregate in aggregates]
+    min_dates = [a.min_date for a in aggregates if a.min_date is not None]
+    max_dates = [a.max_date for a in aggregates if a.max_date is not None]
+    return first._regroup(
+        np.concatenate([part[0] for part in parts]),
+        np.concatenate([part[1] for part in parts]),
+        np.concatenate([part[2] for part in parts]) if first.amounts is not None else None,
+        first.freq,
+        min(min_dates) if min_dates else None,
+        max(max_dates) if max_dates else None,
+    )
+
+
+def _encode_values(values: np.ndarray) -> np.ndarray:
+    # Строковые client_id сохраняются как строки numpy, чтобы не требовать pickle
+    if values.dtype == object:
+        return values.astype(str)
+    return values
+
+
+def partials_arrays(partials: dict) -> dict:
+    """
+    Преобразует словарь {segment: PartialAggregate} в массивы для .npz.
+
+    Все периоды всех сегментов хранятся одним массивом client_id со смещениями,
+    суммы (если есть) - параллельным массивом amounts.
+    """
+    segments = list(partials)
+    freqs = {aggregate.freq for aggregate in partials.values()}
+    if len(freqs) > 1:
+        raise ValueError("Все сегменты должны иметь одинаковую гранулярность")
+    with_amounts = {aggregate.amounts is not None for aggregate in partials.values()}
+    if len(with_amounts) > 1:
+        raise ValueError("Суммы должны быть у всех сегментов или ни у одного")
+    periods, values, amounts, dates = [], [], [], []
+    for segment in segments:
+        aggregate = partials[segment]
+        periods.append(aggregate.periods.asi8)
+        values.extend(aggregate.clients)
+        amounts.extend(aggregate.amounts or [])
+        dates.append(
+            [pd.Timestamp(aggregate.min_date).value, pd.Timestamp(aggregate.max_date).value]
+        )
+
+    lengths = np.array([len(v) for v in values], dtype=np.int64)
+    extra = {}
+    if with_amounts == {True}:
+        extra["amounts"] = np.concatenate(amounts) if amounts else np.array([])
+    return dict(
+        version=PARTIALS_FORMAT_VERSION,
+        freq=freqs.pop() if freqs else DEFAULT_FREQ,
+        segments=np.array(segments, dtype=str),
+        period_counts=np.array([len(p) for p in periods], dtype=np.int64),
+        periods=np.concatenate(periods).astype(np.int64) if periods else np.array([], dtype=np.int64),
+        offsets=np.concatenate([[0], np.cumsum(lengths)]),
+        values=_encode_values(np.concatenate(values)) if values else np.array([]),
+        dates=np.array(dates, dtype=np.int64).reshape(-1, 2),
+        **extra,
+    )
+
+
+def partials_from_arrays(data) -> dict:
+    """Восстанавливает словарь {segment: PartialAggregate} из массивов partials_arrays"""
+    if int(data["version"]) != PARTIALS_FORMAT_VERSION:
+        raise ValueError(f"Неподдерживаемая версия частичных агрегатов: {int(data['version'])}")
+    # Файлы без freq сохранены до появления гранулярностей и содержат месяцы
+    freq = str(data["freq"]) if "freq" in data else DEFAULT_FREQ
+    offsets = data["offsets"]
+    values = data["values"]
+    periods = data["periods"]
+    clients = [values[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+    amounts = None
+    if "amounts" in data:
+        sums = data["amounts"]
+        amounts = [sums[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+
+    partials = {}
+    position = 0
+    for segment, count, (min_value, max_value) in zip(
+        data["segments"].tolist(), data["period_counts"].tolist(), data["dates"]
+    ):
+        partials[segment] = PartialAggregate(
+            pd.PeriodIndex.from_ordinals(periods[position:position + count], freq=freq),
+            clients[position:position + count],
+            min_date=None if min_value == pd.NaT.value else pd.Timestamp(min_value),
+            max_date=None if max_value == pd.NaT.value else pd.Timestamp(max_value),
+            freq=freq,
+            amounts=amounts[position:position + count] if amounts is not None else None,
+        )
+        position += count
+    return partials
+
+
+def save_partials(path, partials: dict):
+    """Сохраняет словарь {segment: PartialAggregate} в сжатый .npz"""
+    np.savez_compressed(path, **partials_arrays(partials))
+
+
+def load_partials(path) -> dict:
+    """Загружает словарь {segment: PartialAggregate} из .npz"""
+    with np.load(path) as data:
+        return partials_from_arrays({name: data[name] for name in data.files})
@@ -0,0 +1,113 @@
+"""
+Модуль с индексом клиентов по периодам
+
+Индекс хранит непрерывный диапазон периодов и для каждого периода
+отсортированные коды клиентов в одном массиве со смещениями (как CSR):
+клиенты периода i - codes[offsets[i]:offsets[i + 1]]. Периоды без
+транзакций - записи нулевой длины, поэтому пропуски в данных не требуют
+заполнения. Сравнение с периодом lag назад считается по целочисленным
+ключам position * n_clients + code бинарным поиском, без множеств Python.
+"""
+
+import numpy as np
+import pandas as pd
+
+from app.periods import DEFAULT_FREQ, check_freq
+
+
+def period_range(start, end, freq=DEFAULT_FREQ) -> pd.PeriodIndex:
+    """
+    Диапазон периодов между первой и последней датой транзакций.
+
+    Как и раньше, последний период входит в диапазон, только если он
+    закончился (последняя дата совпадает с концом периода).
+    """
+    if start is None or end is None or pd.isna(start) or pd.isna(end):
+        return pd.PeriodIndex([], freq=freq)
+    return pd.date_range(start=start, end=end, freq=check_freq(freq)).to_period(freq)
+
+
+class ClientPeriodIndex:
+    """
+    Клиенты по непрерывному диапазону периодов.
+
+    periods - PeriodIndex без пропусков, offsets - массив длины
+    len(periods) + 1, codes - коды клиентов (индексы в clients),
+    отсортированные внутри каждого периода.
+    """
+
+    def __init__(self, periods, offsets, codes, clients):
+        self.periods = periods
+        self.offsets = offsets
+        self.codes = codes
+        self.clients = clients
+        positions = np.repeat(np.arange(len(periods), dtype=np.int64), np.diff(offsets))
+        self._keys = positions * max(len(clients), 1) + codes
+
+    @classmethod
+    def from_pairs(cls, ordinals, clients, periods):
+        """
+        Строит индекс по парам (порядковый номер периода, client_id).
+
+        Пары вне диапазона periods и без client_id отбрасываются,
+        повторы схлопываются.
+        """
+        n_periods = len(periods)
+        start = periods[0].ordinal if n_periods else 0
+        positions = np.asarray(ordinals, dtype=np.int64) - start
+        valid = (positions >= 0) & (positions < n_periods)
+        codes, uniques = pd.factorize(np.asarray(clients)[valid])
+        n_clients = max(len(uniques), 1)
+        # Пропущенные client_id получают код -1, ключ с ним попал бы
+        # на последнего клиента предыдущего периода
+        known = codes >= 0
+
+        keys = np.unique(positions[valid][known] * n_clients + codes[known])
+        positions = keys // n_clients
+        offsets = np.concatenate(
+            [[0], np.cumsum(np.bincount(positions, minlength=n_periods))]
+        ).astype(np.int64)
+        return cls(periods, offsets, keys % n_clients, np.asarray(uniques))
+
+    def __len__(self) -> int:
+        return len(self.periods)
+
+    def counts(self) -> np.ndarray:
+        """Количество клиентов в каждом периоде"""
+        return np.diff(self.offsets)
+
+    def lagged_counts(self, lag: int) -> np.ndarray:
+        """Количество клиентов в периоде lag назад (0 до начала данных)"""
+        counts = self.counts()
+        result = np.zeros_like(counts)
+        if lag < len(counts):
+            result[lag:] = counts[: len(counts) - lag]
+        return result
+
+    def overlap(self, lag: int) -> np.ndarray:
+        """Для каждого периода - количество клиентов, активных и lag периодов назад"""
+        n_clients = max(len(self.clients), 1)
+        # Ключи клиентов, сдвинутые на lag периодов вперед
+        shifted = self._keys + lag * n_clients
+        found = np.searchsorted(self._keys, shifted)
+        hit = found < len(self._keys)
+        hit[hit] = self._keys[found[hit]] == shifted[hit]
+        positions = shifted[hit] // n_clients
+        return np.bincount(positions, minlength=len(self)).astype(np.int64)
+
+    def period_codes(self, position: int) -> np.ndarray:
+        """Отсортированные коды клиентов периода"""
+        return self.codes[self.offsets[position]:self.offsets[position + 1]]
+
+    def overlap_between(self, first: int, second: int) -> int:
+        """Количество общих клиентов двух периодов"""
+        return len(
+            np.intersect1d(self.period_codes(first), self.period_codes(second), assume_unique=True)
+        )
+
+    def sets(self) -> list:
+        """Множества client_id по периодам (пустые для периодов без транзакций)"""
+        return [
+            set(self.clients[self.period_codes(position)].tolist())
+            for position in range(len(self))
+        ]
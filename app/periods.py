@@ -0,0 +1,65 @@
+"""
+Модуль с настройками периодов (гранулярности) расчета метрик
+
+Метрики считаются по периодам одной из гранулярностей: день, неделя, месяц
+или квартал. Колонки *_month в таблице метрик означают сравнение
+с предыдущим периодом, *_year - с тем же периодом год назад.
+"""
+
+# Гранулярность по умолчанию
+DEFAULT_FREQ = "M"
+
+# Названия гранулярностей для интерфейса
+GRANULARITY_LABELS = {
+    "D": "День",
+    "W": "Неделя",
+    "M": "Месяц",
+    "Q": "Квартал",
+}
+
+# Сокращения единиц периода для подписей графиков
+GRANULARITY_UNITS = {
+    "D": "дн.",
+    "W": "нед.",
+    "M": "мес.",
+    "Q": "кв.",
+}
+
+# Количество периодов в году: лаг для годовых метрик
+PERIODS_PER_YEAR = {
+    "D": 365,
+    "W": 52,
+    "M": 12,
+    "Q": 4,
+}
+
+# Частота pd.date_range для дат начала периодов (прогнозы)
+START_FREQ = {
+    "D": "D",
+    "W": "W-MON",
+    "M": "MS",
+    "Q": "QS",
+}
+
+# Из каких гранулярностей можно точно собрать более крупную объединением
+# множеств клиентов (недели не вкладываются в месяцы и кварталы)
+ROLLUPS = {
+    "D": ("D", "W", "M", "Q"),
+    "W": ("W",),
+    "M": ("M", "Q"),
+    "Q": ("Q",),
+}
+
+
+def check_freq(freq: str) -> str:
+    """Проверяет код гранулярности"""
+    if freq not in PERIODS_PER_YEAR:
+        raise ValueError(
+            f"Неизвестная гранулярность '{freq}', допустимые: {', '.join(PERIODS_PER_YEAR)}"
+        )
+    return freq
+
+
+def year_lag(freq: str) -> int:
+    """Лаг в периодах для сравнения с тем же периодом год назад"""
+    return PERIODS_PER_YEAR[check_freq(freq)]
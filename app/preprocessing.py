@@ -1,33 +1,110 @@
 import pandas as pd
 import numpy as np
 
+from app.period_index import ClientPeriodIndex, period_range
+from app.periods import DEFAULT_FREQ, check_freq, year_lag
+from app.profiling import profiled
+from app.sketches import DEFAULT_PRECISION, PeriodSketches, estimate_counts
 
-def preprocessing_data(df, date_col="date", client_id_col="client_id"):
+
+@profiled()
+def preprocessing_data(
+    df, date_col="date", client_id_col="client_id", freq=DEFAULT_FREQ, amount_col=None
+):
     """
     Preprocess the data to create a time series of clients.
+
+    freq sets the period granularity (D, W, M or Q, see app/periods.py);
+    the year_month column holds periods of that granularity. With amount_col
+    the per-client per-period sums are added as revenue columns (app/revenue.py).
     """
+    if amount_col:
+        from app.partials import PartialAggregate
+
+        # Client sets and sums come from a single grouping by (period, client)
+        return PartialAggregate.from_frame(
+            df, date_col, client_id_col, freq=freq, amount_col=amount_col
+        ).to_grouped()
 
     df[date_col] = pd.to_datetime(df[date_col])
-    df["year_month"] = df[date_col].dt.to_period("M")
-
-    # Create a time series of periods
-    periods = pd.date_range(
-        start=df[date_col].min(), end=df[date_col].max(), freq="M"
-    ).to_period("M")
-    periods = periods.to_frame(index=False)
-    periods.columns = ["year_month"]
-
-    # Group by year_month and create a time series of clients
-    df_grouped = (
-        df.groupby("year_month", as_index=False)
-        .agg(clients=(client_id_col, set))
-        .sort_values("year_month", ascending=True)
+    return grouped_from_pairs(
+        df[date_col].dt.to_period(check_freq(freq)).array.asi8,
+        df[client_id_col].to_numpy(),
+        df[date_col].min(),
+        df[date_col].max(),
+        freq=freq,
     )
-    df_grouped = periods.merge(df_grouped, on="year_month", how="left")
-    df_grouped["clients_count"] = df_grouped["clients"].apply(len)
-    df_grouped["clients_prev"] = df_grouped["clients"].shift(1, fill_value=set())
-    df_grouped["clients_prev"] = df_grouped["clients_prev"].bfill()
-    df_grouped["clients_prev_year"] = df_grouped["clients"].shift(12, fill_value=set())
-    df_grouped["clients_prev_year"] = df_grouped["clients_prev_year"].bfill()
+
+
+def _shift(values, lag):
+    """Shift a list by lag positions, filling the head with empty sets"""
+    lag = min(lag, len(values))
+    return [set() for _ in range(lag)] + values[: len(values) - lag]
+
+
+def grouped_from_pairs(ordinals, clients, start, end, freq=DEFAULT_FREQ):
+    """
+    Build the time series of clients from (period ordinal, client_id) pairs.
+
+    start and end are the first and last transaction dates. Periods without
+    transactions get empty client sets. The counts of the previous period
+    (clients_prev_count) and of the same period a year earlier
+    (clients_prev_year_count) and the overlaps with them are computed on
+    integer client codes (see app/period_index.py).
+    """
+    index = ClientPeriodIndex.from_pairs(ordinals, clients, period_range(start, end, freq))
+    lag = year_lag(freq)
+
+    clients_sets = index.sets()
+    df_grouped = pd.DataFrame({"year_month": index.periods})
+    df_grouped["clients"] = clients_sets
+    df_grouped["clients_count"] = index.counts()
+    # Lagged columns reference the same set objects, nothing is copied
+    df_grouped["clients_prev"] = _shift(clients_sets, 1)
+    df_grouped["clients_prev_year"] = _shift(clients_sets, lag)
+    return add_count_columns(df_grouped, index, lag)
+
+
+def add_count_columns(df_grouped, index, lag):
+    """
+    Add the counts of the previous period and of the period lag back
+    and the overlaps with them from a client period index.
+    """
+    df_grouped["clients_prev_count"] = index.lagged_counts(1)
+    df_grouped["clients_prev_year_count"] = index.lagged_counts(lag)
+    df_grouped["clients_intersection"] = index.overlap(1)
+    df_grouped["clients_intersection_year"] = index.overlap(lag)
+
+    return df_grouped
+
+
+@profiled()
+def preprocessing_data_approx(
+    df=None, date_col="date", client_id_col="client_id", sketches=None, p=DEFAULT_PRECISION
+):
+    """
+    Preprocess the data into per-month HyperLogLog sketches (approximate mode).
+
+    Either a DataFrame or prebuilt (e.g. merged across file chunks)
+    PeriodSketches can be passed. The clients columns hold sketch registers
+    instead of client sets.
+    """
+    if sketches is None:
+        sketches = PeriodSketches.from_frame(df, date_col, client_id_col, p=p)
+
+    periods = period_range(sketches.min_date, sketches.max_date)
+    registers = sketches.reindex(periods)
+
+    def shifted(lag):
+        result = np.zeros_like(registers)
+        if lag < len(registers):
+            result[lag:] = registers[: len(registers) - lag]
+        return result
+
+    df_grouped = pd.DataFrame({"year_month": periods})
+    df_grouped["clients"] = list(registers)
+    df_grouped["clients_count"] = estimate_counts(registers)
+    df_grouped["clients_prev"] = list(shifted(1))
+    df_grouped["clients_prev_year"] = list(shifted(12))
 
     return df_grouped
@@ -0,0 +1,257 @@
+"""
+Модуль для инструментирования этапов обработки данных
+
+Каждый этап (декодирование, чтение CSV, препроцессинг, расчет метрик,
+сериализация, построение графиков) оборачивается в контекстный менеджер
+`stage` или декоратор `profiled`. Для этапа замеряются время выполнения,
+процессорное время, пик памяти (tracemalloc) и количество строк.
+
+Результаты пишутся в лог в виде JSON и агрегируются для эндпоинта
+/metrics в текстовом формате Prometheus. Когда профилирование выключено,
+обертки сводятся к одной проверке флага.
+"""
+
+import glob
+import json
+import logging
+import os
+import resource
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from functools import wraps
+
+
+def _env_flag(name: str) -> bool:
+    return os.getenv(name, "false").strip().lower() in ("1", "true", "yes", "on")
+
+
+# Включает замеры этапов (по умолчанию выключено)
+PROFILING_ENABLED = _env_flag("PROFILING_ENABLED")
+# Включает замер пика памяти через tracemalloc (заметно замедляет аллокации)
+PROFILING_TRACEMALLOC = _env_flag("PROFILING_TRACEMALLOC")
+# Директория для агрегатов процессов при запуске с несколькими воркерами
+PROFILING_MULTIPROC_DIR = os.getenv("PROFILING_MULTIPROC_DIR")
+
+# Обработчики логгера настраивает приложение (wsgi.py, dash_customer.py, benchmarks)
+logger = logging.getLogger("clients_calculator.profiling")
+
+_lock = threading.Lock()
+_local = threading.local()
+# Агрегированные замеры по этапам: {stage: {calls, wall, cpu, rows, peak}}
+_registry = {}
+
+
+class _NullRecord(dict):
+    """Заглушка для записи замера при выключенном профилировании"""
+
+    def __setitem__(self, key, value):
+        pass
+
+
+_NULL_RECORD = _NullRecord()
+
+
+def enable(tracemalloc_enabled: bool = False):
+    """Включает профилирование в текущем процессе"""
+    global PROFILING_ENABLED, PROFILING_TRACEMALLOC
+    PROFILING_ENABLED = True
+    PROFILING_TRACEMALLOC = tracemalloc_enabled
+
+
+def is_enabled() -> bool:
+    """Проверяет, включено ли профилирование"""
+    return PROFILING_ENABLED
+
+
+def _stack() -> list:
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def peak_rss_bytes() -> int:
+    """Возвращает пиковый RSS процесса в байтах"""
+    # На Linux ru_maxrss измеряется в килобайтах
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _record(record: dict):
+    """Пишет замер в лог и добавляет его в агрегаты"""
+    logger.info(json.dumps(record, ensure_ascii=False))
+    with _lock:
+        agg = _registry.setdefault(
+            record["stage"],
+            {"calls": 0, "wall": 0.0, "cpu": 0.0, "rows": 0, "peak": 0},
+        )
+        agg["calls"] += 1
+        agg["wall"] += record["wall_seconds"]
+        agg["cpu"] += record["cpu_seconds"]
+        agg["rows"] += record.get("rows") or 0
+        agg["peak"] = max(agg["peak"], record.get("peak_memory_bytes") or 0)
+        if PROFILING_MULTIPROC_DIR:
+            _dump_process_stats()
+
+
+def _dump_process_stats():
+    """Сохраняет агрегаты текущего процесса в общую директорию"""
+    os.makedirs(PROFILING_MULTIPROC_DIR, exist_ok=True)
+    path = os.path.join(PROFILING_MULTIPROC_DIR, f"{os.getpid()}.json")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(_registry, f)
+    os.replace(tmp_path, path)
+
+
+def _merge_process_stats() -> dict:
+    """Объединяет агрегаты всех процессов из общей директории"""
+    merged = {}
+    for path in glob.glob(os.path.join(PROFILING_MULTIPROC_DIR, "*.json")):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                stats = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for name, agg in stats.items():
+            total = merged.setdefault(
+                name, {"calls": 0, "wall": 0.0, "cpu": 0.0, "rows": 0, "peak": 0}
+            )
+            for key in ("calls", "wall", "cpu", "rows"):
+                total[key] += agg[key]
+            total["peak"] = max(total["peak"], agg["peak"])
+    return merged
+
+
+@contextmanager
+def stage(name: str, rows: int = None):
+    """
+    Замеряет этап обработки.
+
+    Возвращает словарь замера, в который можно дописать количество строк:
+
+        with stage("read_csv") as rec:
+            df = pd.read_csv(...)
+            rec["rows"] = len(df)
+    """
+    if not PROFILING_ENABLED:
+        yield _NULL_RECORD
+        return
+
+    record = {"stage": name, "rows": rows}
+    trace = PROFILING_TRACEMALLOC
+    if trace and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+    stack = _stack()
+    mem_start = 0
+    if trace:
+        current, peak = tracemalloc.get_traced_memory()
+        # Сохраняем пик родительского этапа перед сбросом счетчика
+        if stack:
+            stack[-1]["_peak_seen"] = max(stack[-1]["_peak_seen"], peak)
+        tracemalloc.reset_peak()
+        mem_start = current
+    record["_peak_seen"] = 0
+    stack.append(record)
+
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        yield record
+    finally:
+        record["wall_seconds"] = time.perf_counter() - wall_start
+        record["cpu_seconds"] = time.process_time() - cpu_start
+        stack.pop()
+        peak_seen = record.pop("_peak_seen")
+        if trace:
+            _, peak = tracemalloc.get_traced_memory()
+            peak_seen = max(peak_seen, peak)
+            record["peak_memory_bytes"] = max(peak_seen - mem_start, 0)
+            if stack:
+                stack[-1]["_peak_seen"] = max(stack[-1]["_peak_seen"], peak_seen)
+        record["max_rss_bytes"] = peak_rss_bytes()
+        _record(record)
+
+
+def profiled(name: str = None):
+    """
+    Декоратор для замера функции как этапа.
+
+    Если функция возвращает таблицу (объект с атрибутом shape),
+    количество ее строк записывается в замер.
+    """
+
+    def decorator(func):
+        stage_name = name or func.__name__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not PROFILING_ENABLED:
+                return func(*args, **kwargs)
+            with stage(stage_name) as rec:
+                result = func(*args, **kwargs)
+                if hasattr(result, "shape"):
+                    rec["rows"] = len(result)
+                return result
+
+        return wrapper
+
+    return decorator
+
+
+def get_stats() -> dict:
+    """
+    Возвращает копию агрегированных замеров по этапам.
+
+    Если задан PROFILING_MULTIPROC_DIR, замеры объединяются по всем процессам.
+    """
+    if PROFILING_MULTIPROC_DIR:
+        return _merge_process_stats()
+    with _lock:
+        return {name: dict(agg) for name, agg in _registry.items()}
+
+
+def reset_stats():
+    """Очищает агрегированные замеры"""
+    with _lock:
+        _registry.clear()
+
+
+def render_prometheus() -> str:
+    """Формирует замеры в текстовом формате Prometheus"""
+    stats = get_stats()
+    metrics = [
+        ("stage_calls_total", "counter", "Количество выполнений этапа", "calls"),
+        ("stage_wall_seconds_total", "counter", "Суммарное время этапа", "wall"),
+        ("stage_cpu_seconds_total", "counter", "Суммарное процессорное время этапа", "cpu"),
+        ("stage_rows_total", "counter", "Суммарное количество обработанных строк", "rows"),
+        ("stage_peak_memory_bytes", "gauge", "Максимальный пик памяти этапа", "peak"),
+    ]
+    lines = []
+    for metric, metric_type, help_text, key in metrics:
+        full_name = f"clients_calculator_{metric}"
+        lines.append(f"# HELP {full_name} {help_text}")
+        lines.append(f"# TYPE {full_name} {metric_type}")
+        for stage_name, agg in sorted(stats.items()):
+            label = stage_name.replace("\\", "\\\\").replace('"', '\\"')
+            lines.append(f'{full_name}{{stage="{label}"}} {agg[key]}')
+    lines.append("# HELP clients_calculator_process_max_rss_bytes Пиковый RSS процесса")
+    lines.append("# TYPE clients_calculator_process_max_rss_bytes gauge")
+    lines.append(f"clients_calculator_process_max_rss_bytes {peak_rss_bytes()}")
+    return "\n".join(lines) + "\n"
+
+
+def register_metrics_endpoint(server, path: str = "/metrics"):
+    """Регистрирует эндпоинт с замерами на Flask сервере"""
+    from flask import Response, abort
+
+    def metrics_endpoint():
+        if not PROFILING_ENABLED:
+            abort(404)
+        return Response(
+            render_prometheus(), mimetype="text/plain; version=0.0.4; charset=utf-8"
+        )
+
+    server.add_url_rule(path, "profiling_metrics", metrics_endpoint)
@@ -0,0 +1,109 @@
+"""
+Модуль для расчета выручки по клиентам и периодам (NRR/GRR)
+
+Сумма по каждой паре (период, клиент) считается одной группировкой по
+факторизованным идентификаторам. Для сравнения с предыдущим периодом пары
+сопоставляются по ключу position * n_clients + client_code бинарным поиском,
+суммы по периодам собираются через np.bincount, без циклов по клиентам.
+
+Для клиентов предыдущего периода (база) считаются:
+- revenue_retained - их выручка в текущем периоде (ушедшие дают 0);
+- revenue_expansion / revenue_contraction - рост и снижение выручки
+  у оставшихся клиентов;
+- revenue_churned - выручка ушедших клиентов в предыдущем периоде.
+NRR = revenue_retained / revenue_prev, GRR = (revenue_prev - contraction - churned) / revenue_prev.
+"""
+
+import numpy as np
+import pandas as pd
+
+def sum_by_period_client(ordinals, clients, amounts):
+    """
+    Суммирует amounts по парам (период, клиент) за одну группировку.
+
+    Группировка идет по целочисленным кодам клиентов. Возвращает порядковые
+    номера периодов, client_id и суммы, отсортированные по периоду и клиенту.
+    Транзакции без client_id отбрасываются, как и в индексе клиентов
+    (app/period_index.py): их выручку нельзя отнести ни к одному клиенту.
+    """
+    client_codes, uniques = pd.factorize(np.asarray(clients), sort=True)
+    # pd.factorize дает пропущенным client_id код -1
+    known = client_codes >= 0
+    grouped = (
+        pd.DataFrame(
+            {
+                "period": np.asarray(ordinals)[known],
+                "client": client_codes[known],
+                "amount": np.asarray(amounts)[known],
+            }
+        )
+        .groupby(["period", "client"], sort=True)["amount"]
+        .sum()
+    )
+    return (
+        grouped.index.get_level_values("period").to_numpy(),
+        np.asarray(uniques)[grouped.index.get_level_values("client").to_numpy()],
+        grouped.to_numpy(dtype=np.float64),
+    )
+
+
+def _lag_components(keys, sums, positions, n_clients, n_periods, lag):
+    """Компоненты выручки для сравнения каждого периода с периодом lag назад"""
+    target = positions + lag
+    in_range = target < n_periods
+    # Ключ той же пары через lag периодов
+    lagged_keys = keys[in_range] + lag * n_clients
+    base = sums[in_range]
+    target = target[in_range]
+
+    found = np.searchsorted(keys, lagged_keys)
+    matched = found < len(keys)
+    matched[matched] = keys[found[matched]] == lagged_keys[matched]
+    current = np.zeros_like(base)
+    current[matched] = sums[found[matched]]
+
+    def total(values):
+        # bincount без пар возвращает int64, колонки выручки всегда float64
+        return np.bincount(target, weights=values, minlength=n_periods).astype(np.float64)
+
+    return {
+        "revenue_prev": total(base),
+        "revenue_retained": total(current),
+        "revenue_expansion": total(np.where(matched, np.maximum(current - base, 0), 0)),
+        "revenue_contraction": total(np.where(matched, np.maximum(base - current, 0), 0)),
+        "revenue_churned": total(np.where(matched, 0, base)),
+    }
+
+
+def add_revenue_columns(df_grouped, ordinals, clients, amounts, year_lag):
+    """
+    Добавляет в таблицу preprocessing_data колонки выручки.
+
+    ordinals, clients, amounts - суммы по парам (период, клиент) из
+    sum_by_period_client. Колонки revenue_* сравнивают с предыдущим периодом,
+    revenue_*_year - с тем же периодом год назад.
+    """
+    n_periods = len(df_grouped)
+    start = df_grouped["year_month"].iloc[0].ordinal if n_periods else 0
+    positions = np.asarray(ordinals, dtype=np.int64) - start
+    client_codes, uniques = pd.factorize(clients)
+    n_clients = max(len(uniques), 1)
+    sums = np.asarray(amounts, dtype=np.float64)
+
+    # Пары вне диапазона периодов и без client_id отбрасываются так же,
+    # как множества клиентов
+    valid = (positions >= 0) & (positions < n_periods) & (client_codes >= 0)
+    positions, client_codes, sums = positions[valid], client_codes[valid], sums[valid]
+
+    keys = positions * n_clients + client_codes
+    order = np.argsort(keys, kind="stable")
+    keys, sums, positions = keys[order], sums[order], positions[order]
+
+    df_grouped["revenue"] = np.bincount(positions, weights=sums, minlength=n_periods).astype(
+        np.float64
+    )
+    for lag, suffix in ((1, ""), (year_lag, "_year")):
+        components = _lag_components(keys, sums, positions, n_clients, n_periods, lag)
+        for name, values in components.items():
+            df_grouped[f"{name}{suffix}"] = values
+    return df_grouped
@@ -0,0 +1,232 @@
+"""
+Модуль для приближенного подсчета уникальных клиентов (HyperLogLog)
+
+Для каждого периода строится скетч фиксированного размера 2**p байт
+(по умолчанию p=14, 16 КБ) независимо от количества клиентов. Скетчи
+объединяются поэлементным максимумом, поэтому их можно строить по частям
+файла или в разных процессах и затем объединять без потери точности.
+Скетчи сохраняются в .npz (save_sketches) и объединяются в следующих
+запусках, как частичные агрегаты (app/partials.py).
+
+Точность (m = 2**p регистров):
+- количество клиентов: стандартная ошибка 1.04 / sqrt(m), для p=14 - 0.81%,
+  без смещения во всем диапазоне (улучшенная оценка Ertl, estimate_counts);
+- пересечение |A & B| = |A| + |B| - |A | B|: абсолютная ошибка порядка
+  1.04 / sqrt(m) * |A | B|, поэтому относительная ошибка удержания
+  растет, когда удержанных клиентов мало по сравнению с объединением
+  (например, при удержании 10% ошибка удержания около 8% от значения).
+"""
+
+import numpy as np
+import pandas as pd
+
+# Точность по умолчанию: 2**14 регистров, ошибка ~0.81%
+DEFAULT_PRECISION = 14
+SKETCH_FORMAT_VERSION = 2
+# Суффикс файлов с сохраненными скетчами
+SKETCHES_SUFFIX = ".sketches.npz"
+
+
+def hash_values(values) -> np.ndarray:
+    """
+    Хеширует идентификаторы клиентов в uint64.
+
+    Хеш зависит от типа значения: client_id 42 и "42" дают разные хеши,
+    поэтому все части данных должны читаться с одинаковым типом колонки.
+    """
+    return pd.util.hash_array(np.asarray(values), categorize=False)
+
+
+def _bit_length(values: np.ndarray) -> np.ndarray:
+    """Векторизованный bit_length для uint64"""
+    hi = (values >> np.uint64(32)).astype(np.float64)
+    lo = (values & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    # frexp точен для 32-битных значений: x = m * 2**e, 0.5 <= m < 1
+    hi_len = np.frexp(hi)[1]
+    lo_len = np.frexp(lo)[1]
+    return np.where(hi > 0, hi_len + 32, lo_len)
+
+
+def register_updates(hashes: np.ndarray, p: int):
+    """Возвращает номера регистров и ранги для хешей"""
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    index = (hashes >> np.uint64(64 - p)).astype(np.int64)
+    rest = hashes & np.uint64((1 << (64 - p)) - 1)
+    rank = (64 - p) - _bit_length(rest) + 1
+    return index, rank.astype(np.uint8)
+
+
+def _sigma(x: float) -> float:
+    """sigma(x) = x + sum(x**(2**k) * 2**(k-1)) из улучшенной оценки Ertl"""
+    if x == 1.0:
+        return np.inf
+    y, z = 1.0, x
+    while True:
+        x *= x
+        previous = z
+        z += x * y
+        y += y
+        if z == previous:
+            return z
+
+
+def _tau(x: float) -> float:
+    """tau(x) = (1 - x - sum((1 - x**(2**-k))**2 * 2**-k)) / 3 из улучшенной оценки Ertl"""
+    if x == 0.0 or x == 1.0:
+        return 0.0
+    y, z = 1.0, 1.0 - x
+    while True:
+        x = np.sqrt(x)
+        previous = z
+        y *= 0.5
+        z -= (1 - x) ** 2 * y
+        if z == previous:
+            return z / 3
+
+
+def estimate_counts(registers: np.ndarray) -> np.ndarray:
+    """
+    Оценивает количество уникальных значений для каждой строки регистров.
+
+    registers - массив (n, m) или (m,). Используется улучшенная оценка
+    Ertl (2017) по гистограмме значений регистров: она не смещена во всем
+    диапазоне количеств, без переключения с линейного подсчета на сырую
+    оценку HyperLogLog и без эмпирических таблиц поправок.
+    """
+    registers = np.atleast_2d(registers)
+    n, m = registers.shape
+    q = 64 - (m.bit_length() - 1)
+    # Гистограммы значений регистров всех строк: counts[i, k] - число регистров,
+    # равных k, в строке i (значения от 0 до q + 1)
+    rows = np.repeat(np.arange(n), m) * (q + 2)
+    counts = np.bincount(rows + registers.ravel(), minlength=n * (q + 2)).reshape(n, q + 2)
+
+    z = m * np.array([_tau(1 - c / m) for c in counts[:, q + 1]])
+    for k in range(q, 0, -1):
+        z = 0.5 * (z + counts[:, k])
+    z += m * np.array([_sigma(c / m) for c in counts[:, 0]])
+    with np.errstate(divide="ignore"):
+        return m * m / (2 * np.log(2) * z)
+
+
+class PeriodSketches:
+    """
+    Скетчи HyperLogLog по периодам.
+
+    periods - отсортированный PeriodIndex, registers - массив
+    (len(periods), 2**p) uint8. min_date и max_date нужны, чтобы диапазон
+    периодов совпадал с точным расчетом в preprocessing_data.
+    """
+
+    def __init__(self, periods, registers, min_date=None, max_date=None, p=DEFAULT_PRECISION):
+        self.periods = pd.PeriodIndex(periods, freq="M")
+        self.registers = registers
+        self.min_date = min_date
+        self.max_date = max_date
+        self.p = p
+
+    @classmethod
+    def from_frame(cls, df, date_col="date", client_id_col="client_id", p=DEFAULT_PRECISION):
+        """Строит скетчи по таблице транзакций за один проход"""
+        dates = pd.to_datetime(df[date_col])
+        period_codes, periods = pd.factorize(dates.dt.to_period("M"), sort=True)
+        # Транзакции без client_id не относятся ни к одному клиенту, как в точном расчете
+        known = df[client_id_col].notna().to_numpy()
+        index, rank = register_updates(hash_values(df[client_id_col].to_numpy()[known]), p)
+
+        m = 1 << p
+        registers = np.zeros(len(periods) * m, dtype=np.uint8)
+        np.maximum.at(registers, period_codes[known].astype(np.int64) * m + index, rank)
+        return cls(
+            periods,
+            registers.reshape(len(periods), m),
+            min_date=dates.min() if len(dates) else None,
+            max_date=dates.max() if len(dates) else None,
+            p=p,
+        )
+
+    def merge(self, other: "PeriodSketches") -> "PeriodSketches":
+        """Объединяет скетчи (операция ассоциативна и коммутативна)"""
+        if self.p != other.p:
+            raise ValueError("Нельзя объединить скетчи с разной точностью")
+        periods = self.periods.union(other.periods).sort_values()
+        registers = np.zeros((len(periods), 1 << self.p), dtype=np.uint8)
+        for sketches in (self, other):
+            positions = periods.get_indexer(sketches.periods)
+            registers[positions] = np.maximum(registers[positions], sketches.registers)
+        dates = [d for d in (self.min_date, other.min_date) if d is not None]
+        max_dates = [d for d in (self.max_date, other.max_date) if d is not None]
+        return PeriodSketches(
+            periods,
+            registers,
+            min_date=min(dates) if dates else None,
+            max_date=max(max_dates) if max_dates else None,
+            p=self.p,
+        )
+
+    def reindex(self, periods) -> np.ndarray:
+        """Возвращает регистры для заданных периодов (пустые для отсутствующих)"""
+        periods = pd.PeriodIndex(periods, freq="M")
+        registers = np.zeros((len(periods), 1 << self.p), dtype=np.uint8)
+        positions = self.periods.get_indexer(periods)
+        found = positions >= 0
+        registers[found] = self.registers[positions[found]]
+        return registers
+
+
+def save_sketches(path, sketches: dict):
+    """
+    Сохраняет словарь {segment: PeriodSketches} в сжатый .npz.
+
+    Регистры всех периодов всех сегментов хранятся одним массивом,
+    period_counts задает количество периодов каждого сегмента.
+    """
+    segments = list(sketches)
+    precisions = {segment_sketches.p for segment_sketches in sketches.values()}
+    if len(precisions) > 1:
+        raise ValueError("Все сегменты должны иметь одинаковую точность")
+    p = precisions.pop() if precisions else DEFAULT_PRECISION
+    np.savez_compressed(
+        path,
+        version=SKETCH_FORMAT_VERSION,
+        p=p,
+        segments=np.array(segments, dtype=str),
+        period_counts=np.array([len(sketches[s].periods) for s in segments], dtype=np.int64),
+        periods=np.concatenate([sketches[s].periods.asi8 for s in segments]).astype(np.int64)
+        if segments
+        else np.array([], dtype=np.int64),
+        registers=np.concatenate([sketches[s].registers for s in segments])
+        if segments
+        else np.zeros((0, 1 << p), dtype=np.uint8),
+        dates=np.array(
+            [
+                [pd.Timestamp(sketches[s].min_date).value, pd.Timestamp(sketches[s].max_date).value]
+                for s in segments
+            ],
+            dtype=np.int64,
+        ).reshape(-1, 2),
+    )
+
+
+def load_sketches(path) -> dict:
+    """Загружает словарь {segment: PeriodSketches} из .npz"""
+    with np.load(path) as data:
+        if int(data["version"]) != SKETCH_FORMAT_VERSION:
+            raise ValueError(f"Неподдерживаемая версия скетчей: {int(data['version'])}")
+        p = int(data["p"])
+        periods = data["periods"]
+        registers = data["registers"]
+        sketches = {}
+        position = 0
+        for segment, count, (min_value, max_value) in zip(
+            data["segments"].tolist(), data["period_counts"].tolist(), data["dates"]
+        ):
+            sketches[segment] = PeriodSketches(
+                pd.PeriodIndex.from_ordinals(periods[position:position + count], freq="M"),
+                registers[position:position + count],
+                min_date=None if min_value == pd.NaT.value else pd.Timestamp(min_value),
+                max_date=None if max_value == pd.NaT.value else pd.Timestamp(max_value),
+                p=p,
+            )
+            position += count
+    return sketches
@@ -0,0 +1,453 @@
+"""
+Модуль для расчета метрик на данных больше оперативной памяти
+
+Пока оценка памяти частичных агрегатов (app/partials.py) укладывается
+в бюджет MEMORY_BUDGET, группировка идет в памяти. После превышения бюджета
+агрегаты сбрасываются на диск сериями (runs): пары (период, клиент),
+отсортированные по периоду и клиенту, в файлах .npy. В конце серии
+сливаются по одному периоду за раз в индекс на диске, и количества клиентов
+и пересечения периодов считаются по отображенным в память файлам (np.memmap),
+поэтому в памяти одновременно находятся только клиенты сравниваемых периодов.
+
+Клиенты в сериях хранятся 64-битными хешами client_id (pd.util.hash_array):
+для целых client_id хеш взаимно однозначен, для строк вероятность коллизии
+пренебрежимо мала. Таблица preprocessing_data на диске не содержит множеств
+клиентов, retention_period считается по пересечению первого и последнего периода.
+"""
+
+import functools
+import os
+import re
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from app.partials import PartialAggregate, merge_partials
+from app.period_index import ClientPeriodIndex, period_range
+from app.periods import DEFAULT_FREQ, ROLLUPS, check_freq, year_lag
+from app.preprocessing import add_count_columns
+
+# Бюджет памяти этапа группировки, например "6G" (пусто - без ограничения)
+MEMORY_BUDGET = os.getenv("MEMORY_BUDGET", "")
+# Каталог для временных файлов (по умолчанию системный)
+SPILL_DIR = os.getenv("SPILL_DIR") or None
+# Оценка памяти на одну пару (период, клиент) при расчете в памяти:
+# массивы агрегата, множества client_id и таблица preprocessing_data
+BYTES_PER_PAIR = 200
+
+_SIZE_UNITS = {"": 1, "K": 2**10, "M": 2**20, "G": 2**30, "T": 2**40}
+
+
+def parse_size(value):
+    """Переводит размер вида 512M, 6G или число байт в байты (None - без ограничения)"""
+    if value is None or isinstance(value, int):
+        return value
+    if not str(value).strip():
+        return None
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMGT]?)B?\s*", str(value).upper())
+    if not match:
+        raise ValueError(f"Некорректный размер '{value}', пример: 512M или 6G")
+    return int(float(match.group(1)) * _SIZE_UNITS[match.group(2)])
+
+
+@contextmanager
+def spill_directory(budget, directory=SPILL_DIR):
+    """Временный каталог для серий, удаляется после расчета (None без бюджета)"""
+    if budget is None:
+        yield None
+        return
+    path = tempfile.mkdtemp(prefix="churn-spill-", dir=directory)
+    try:
+        yield path
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def client_hashes(values) -> np.ndarray:
+    """64-битные хеши client_id, одинаковые во всех процессах"""
+    return pd.util.hash_array(np.asarray(values))
+
+
+def _write_run(directory, ordinals, hashes, amounts=None):
+    """Сортирует пары по (период, хеш клиента) и сохраняет серию в каталог"""
+    order = np.lexsort((hashes, ordinals))
+    ordinals = ordinals[order]
+    periods, starts = np.unique(ordinals, return_index=True)
+    path = tempfile.mkdtemp(prefix="run-", dir=directory)
+    np.save(os.path.join(path, "periods.npy"), periods.astype(np.int64))
+    np.save(os.path.join(path, "offsets.npy"), np.append(starts, len(ordinals)).astype(np.int64))
+    np.save(os.path.join(path, "clients.npy"), hashes[order])
+    if amounts is not None:
+        np.save(os.path.join(path, "amounts.npy"), amounts[order])
+    return path
+
+
+def _load_run(path, with_amounts):
+    def load(name):
+        return np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+
+    return (
+        np.load(os.path.join(path, "periods.npy")),
+        np.load(os.path.join(path, "offsets.npy")),
+        load("clients"),
+        load("amounts") if with_amounts else None,
+    )
+
+
+def _memmap(path, dtype, size):
+    # np.memmap не открывает пустые файлы
+    if size == 0:
+        return np.array([], dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=(size,))
+
+
+class DiskPeriodIndex(ClientPeriodIndex):
+    """
+    Индекс клиентов по периодам (app/period_index.py), codes и amounts
+    которого отображены в память из файлов. Пересечения считаются
+    по одному периоду за раз.
+    """
+
+    def __init__(self, periods, offsets, codes, amounts=None):
+        self.periods = periods
+        self.offsets = offsets
+        self.codes = codes
+        self.amounts = amounts
+        self.clients = None
+
+    @classmethod
+    def merge_runs(cls, runs, freq, directory, with_amounts=False):
+        """
+        Сливает серии в индекс по всем периодам серий: клиенты каждого периода
+        собираются из всех серий, повторы схлопываются (суммы складываются).
+        """
+        loaded = [_load_run(path, with_amounts) for path in runs]
+        ordinals = [run[0] for run in loaded if len(run[0])]
+        first = min(o[0] for o in ordinals) if ordinals else 0
+        last = max(o[-1] for o in ordinals) if ordinals else -1
+        periods = pd.PeriodIndex.from_ordinals(np.arange(first, last + 1), freq=freq)
+        counts = np.zeros(len(periods), dtype=np.int64)
+        path = tempfile.mkdtemp(prefix="index-", dir=directory)
+        clients_path = os.path.join(path, "clients.bin")
+        amounts_path = os.path.join(path, "amounts.bin")
+
+        with open(clients_path, "wb") as clients_file, open(amounts_path, "wb") as amounts_file:
+            for position, ordinal in enumerate(periods.asi8):
+                hashes, sums = [], []
+                for run_periods, offsets, clients, amounts in loaded:
+                    found = np.searchsorted(run_periods, ordinal)
+                    if found == len(run_periods) or run_periods[found] != ordinal:
+                        continue
+                    start, end = offsets[found], offsets[found + 1]
+                    hashes.append(clients[start:end])
+                    if with_amounts:
+                        sums.append(amounts[start:end])
+                if not hashes:
+                    continue
+                if with_amounts:
+                    values, inverse = np.unique(np.concatenate(hashes), return_inverse=True)
+                    totals = np.bincount(
+                        inverse, weights=np.concatenate(sums), minlength=len(values)
+                    )
+                    amounts_file.write(totals.astype(np.float64).tobytes())
+                else:
+                    values = np.unique(np.concatenate(hashes))
+                clients_file.write(values.astype(np.uint64).tobytes())
+                counts[position] = len(values)
+
+        offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        return cls(
+            periods,
+            offsets,
+            _memmap(clients_path, np.uint64, offsets[-1]),
+            _memmap(amounts_path, np.float64, offsets[-1]) if with_amounts else None,
+        )
+
+    def select(self, periods) -> "DiskPeriodIndex":
+        """Индекс по непрерывному поддиапазону periods без копирования данных"""
+        start = self.periods.get_loc(periods[0]) if len(periods) else 0
+        stop = start + len(periods)
+        return DiskPeriodIndex(
+            periods, self.offsets[start:stop + 1], self.codes, self.amounts
+        )
+
+    def period_amounts(self, position: int) -> np.ndarray:
+        """Суммы клиентов периода в порядке period_codes"""
+        return self.amounts[self.offsets[position]:self.offsets[position + 1]]
+
+    def overlap(self, lag: int) -> np.ndarray:
+        result = np.zeros(len(self), dtype=np.int64)
+        for position in range(lag, len(self)):
+            result[position] = self.overlap_between(position, position - lag)
+        return result
+
+    def revenue_components(self, lag: int) -> dict:
+        """
+        Компоненты выручки для сравнения с периодом lag назад, как
+        в app/revenue.py, но по одной паре периодов за раз.
+        """
+        names = ["prev", "retained", "expansion", "contraction", "churned"]
+        totals = {name: np.zeros(len(self)) for name in names}
+        for position in range(lag, len(self)):
+            base = self.period_amounts(position - lag)
+            _, current_idx, base_idx = np.intersect1d(
+                self.period_codes(position),
+                self.period_codes(position - lag),
+                assume_unique=True,
+                return_indices=True,
+            )
+            current = self.period_amounts(position)[current_idx]
+            matched = base[base_idx]
+            totals["prev"][position] = base.sum()
+            totals["retained"][position] = current.sum()
+            totals["expansion"][position] = np.maximum(current - matched, 0).sum()
+            totals["contraction"][position] = np.maximum(matched - current, 0).sum()
+            totals["churned"][position] = base.sum() - matched.sum()
+        return {f"revenue_{name}": values for name, values in totals.items()}
+
+
+class ExternalAggregate:
+    """
+    Частичный агрегат, сброшенный на диск.
+
+    runs - каталоги отсортированных серий, buffer - PartialAggregate с парами,
+    которые еще не записаны на диск. Поддерживает merge и to_grouped
+    так же, как PartialAggregate.
+    """
+
+    def __init__(
+        self,
+        directory,
+        freq=DEFAULT_FREQ,
+        min_date=None,
+        max_date=None,
+        with_amounts=False,
+        runs=(),
+        buffer=None,
+    ):
+        self.directory = directory
+        self.freq = check_freq(freq)
+        self.min_date = min_date
+        self.max_date = max_date
+        self.with_amounts = with_amounts
+        self.runs = list(runs)
+        self.buffer = buffer
+        self._index = None
+
+    @classmethod
+    def spill(cls, state, directory) -> "ExternalAggregate":
+        """Записывает агрегат (или буфер уже сброшенного агрегата) на диск"""
+        if not isinstance(state, cls):
+            state = cls(
+                directory,
+                state.freq,
+                state.min_date,
+                state.max_date,
+                with_amounts=state.amounts is not None,
+                buffer=state,
+            )
+        state.flush()
+        return state
+
+    @property
+    def buffered_rows(self) -> int:
+        """Количество пар в памяти"""
+        return self.buffer.rows if self.buffer is not None else 0
+
+    def flush(self):
+        """Записывает буфер на диск отдельной серией"""
+        if self.buffered_rows:
+            ordinals, clients, amounts = self.buffer.flat()
+            self.runs.append(
+                _write_run(self.directory, ordinals, client_hashes(clients), amounts)
+            )
+        self.buffer = None
+        self._index = None
+
+    def merge(self, other) -> "ExternalAggregate":
+        """Объединяет с PartialAggregate или другим ExternalAggregate"""
+        if self.freq != other.freq:
+            raise ValueError("Нельзя объединить агрегаты с разной гранулярностью")
+        runs = list(self.runs)
+        buffer = other
+        if isinstance(other, ExternalAggregate):
+            with_amounts = other.with_amounts
+            runs += other.runs
+            buffer = other.buffer
+        else:
+            with_amounts = other.amounts is not None
+        if with_amounts != self.with_amounts:
+            raise ValueError("Нельзя объединить агрегаты с суммами и без сумм")
+        if self.buffer is not None:
+            buffer = self.buffer.merge(buffer) if buffer is not None else self.buffer
+
+        min_dates = [d for d in (self.min_date, other.min_date) if d is not None]
+        max_dates = [d for d in (self.max_date, other.max_date) if d is not None]
+        return ExternalAggregate(
+            self.directory,
+            self.freq,
+            min(min_dates) if min_dates else None,
+            max(max_dates) if max_dates else None,
+            with_amounts=self.with_amounts,
+            runs=runs,
+            buffer=buffer,
+        )
+
+    def rollup(self, freq: str) -> "ExternalAggregate":
+        """
+        Агрегат более крупной гранулярности: каждая серия переписывается
+        с периодами freq, повторы клиентов схлопываются при слиянии серий.
+        """
+        if freq == self.freq:
+            return self
+        if freq not in ROLLUPS[self.freq]:
+            raise ValueError(f"Гранулярность '{self.freq}' нельзя свернуть в '{freq}'")
+        runs = []
+        for path in self.runs:
+            periods, offsets, clients, amounts = _load_run(path, self.with_amounts)
+            coarse = pd.PeriodIndex.from_ordinals(periods, freq=self.freq).asfreq(freq).asi8
+            runs.append(
+                _write_run(
+                    self.directory,
+                    np.repeat(coarse, np.diff(offsets)),
+                    np.asarray(clients),
+                    np.asarray(amounts) if amounts is not None else None,
+                )
+            )
+        return ExternalAggregate(
+            self.directory,
+            freq,
+            self.min_date,
+            self.max_date,
+            with_amounts=self.with_amounts,
+            runs=runs,
+            buffer=self.buffer.rollup(freq) if self.buffer is not None else None,
+        )
+
+    def index(self) -> DiskPeriodIndex:
+        """Сливает серии в индекс на диске (один раз)"""
+        if self._index is None:
+            self.flush()
+            self._index = DiskPeriodIndex.merge_runs(
+                self.runs, self.freq, self.directory, self.with_amounts
+            )
+        return self._index
+
+    def flat(self):
+        """
+        Пары (период, хеш клиента) плоскими массивами: ordinals, clients, amounts.
+
+        Массивы загружаются в память (16-24 байта на пару, без множеств).
+        """
+        index = self.index()
+        ordinals = np.repeat(index.periods.asi8, index.counts())
+        amounts = np.asarray(index.amounts) if self.with_amounts else None
+        return ordinals, np.asarray(index.codes), amounts
+
+    def client_lifetimes(self, last_period, memory_budget=None):
+        """
+        Первый и последний период активности клиентов (до last_period
+        включительно) для app/survival.py.
+
+        Клиенты делятся на части по диапазонам хешей так, чтобы пары одной
+        части укладывались в memory_budget; части читаются по очереди из
+        индекса на диске, в каждом периоде хеши отсортированы, поэтому
+        диапазон находится бинарным поиском. Генерирует пары массивов (first, last).
+        """
+        index = self.index()
+        ordinals = index.periods.asi8
+        n_periods = int(np.searchsorted(ordinals, last_period, side="right"))
+        if n_periods == 0:
+            return
+        pairs = int(index.offsets[n_periods])
+        max_pairs = max(memory_budget // BYTES_PER_PAIR, 1) if memory_budget else pairs
+        n_parts = max(-(-pairs // max(max_pairs, 1)), 1)
+        # Границы диапазонов хешей; последняя часть идет до конца периода
+        bounds = [np.uint64((1 << 64) * part // n_parts) for part in range(n_parts)]
+
+        for part in range(n_parts):
+            hashes, periods = [], []
+            for position in range(n_periods):
+                codes = index.period_codes(position)
+                start = np.searchsorted(codes, bounds[part])
+                stop = np.searchsorted(codes, bounds[part + 1]) if part + 1 < n_parts else len(codes)
+                hashes.append(np.asarray(codes[start:stop]))
+                periods.append(np.full(stop - start, ordinals[position]))
+            hashes, periods = np.concatenate(hashes), np.concatenate(periods)
+            # Пары идут по возрастанию периода: первое вхождение хеша -
+            # первый период клиента, первое вхождение с конца - последний
+            _, first = np.unique(hashes, return_index=True)
+            _, last = np.unique(hashes[::-1], return_index=True)
+            yield periods[first], periods[::-1][last]
+
+    def to_grouped(self):
+        """
+        Возвращает таблицу preprocessing_data без колонок с множествами
+        клиентов. В первой строке clients_intersection_period - количество
+        клиентов первого периода, активных и в последнем периоде.
+        """
+        # Как и в preprocessing_data, незаконченный последний период не входит
+        index = self.index().select(period_range(self.min_date, self.max_date, self.freq))
+        lag = year_lag(self.freq)
+        df_grouped = pd.DataFrame({"year_month": index.periods})
+        df_grouped["clients_count"] = index.counts()
+        add_count_columns(df_grouped, index, lag)
+        if len(index):
+            df_grouped["clients_intersection_period"] = np.nan
+            df_grouped.loc[0, "clients_intersection_period"] = index.overlap_between(
+                len(index) - 1, 0
+            )
+
+        if self.with_amounts and len(df_grouped):
+            df_grouped["revenue"] = [
+                index.period_amounts(position).sum() for position in range(len(index))
+            ]
+            for lag_periods, suffix in ((1, ""), (lag, "_year")):
+                for name, values in index.revenue_components(lag_periods).items():
+                    df_grouped[f"{name}{suffix}"] = values
+        return df_grouped
+
+
+def estimate_memory(state) -> int:
+    """Оценка памяти расчета по агрегату в байтах"""
+    if isinstance(state, ExternalAggregate):
+        return state.buffered_rows * BYTES_PER_PAIR
+    if isinstance(state, PartialAggregate):
+        return state.rows * BYTES_PER_PAIR
+    return 0
+
+
+def limit_memory(states: dict, budget, directory) -> dict:
+    """
+    Сбрасывает агрегаты {segment: состояние} на диск, если оценка памяти
+    превышает бюджет. Остальные состояния (скетчи) не меняются.
+    """
+    if budget is None or sum(estimate_memory(s) for s in states.values()) <= budget:
+        return states
+    return {
+        segment: (
+            ExternalAggregate.spill(state, directory)
+            if isinstance(state, (PartialAggregate, ExternalAggregate))
+            else state
+        )
+        for segment, state in states.items()
+    }
+
+
+def merge_states(first, second):
+    """Объединяет состояния; если одно из них на диске, результат тоже на диске"""
+    if isinstance(second, ExternalAggregate) and not isinstance(first, ExternalAggregate):
+        first, second = second, first
+    return first.merge(second)
+
+
+def merge_state_list(states: list):
+    """Объединяет список состояний; PartialAggregate объединяются за одну сортировку"""
+    aggregates = [state for state in states if isinstance(state, PartialAggregate)]
+    others = [state for state in states if not isinstance(state, PartialAggregate)]
+    if len(aggregates) > 1:
+        aggregates = [merge_partials(aggregates)]
+    return functools.reduce(merge_states, others + aggregates)
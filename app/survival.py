@@ -0,0 +1,187 @@
+"""
+Модуль для анализа выживаемости клиентов (Kaplan–Meier)
+
+Для каждого клиента берутся первый и последний периоды, в которых он был
+активен. Когорта - период первой покупки, время жизни - количество периодов
+от первой до последней активности включительно. Клиенты, активные
+в последнем периоде данных, еще не ушли: их время жизни цензурировано.
+
+Кривые строятся для всех когорт сразу: количество ушедших и цензурированных
+клиентов считается через np.bincount по (когорта, время жизни), размер группы
+риска - обратной накопленной суммой, выживаемость - np.cumprod по времени.
+Средняя продолжительность жизни - площадь под кривой в пределах наблюдаемого
+горизонта когорты (restricted mean), поэтому для молодых когорт она занижена.
+Первая когорта включает и клиентов, пришедших до начала данных.
+Как и в calculate_metrics, последний период учитывается, только если он
+закончился (aggregate_survival_tables).
+"""
+
+import numpy as np
+import pandas as pd
+
+from app.period_index import period_range
+
+# Значение колонки cohort для кривой по всем клиентам
+ALL_COHORTS = "all"
+# Колонки таблиц кривых выживаемости и времени жизни
+CURVE_COLUMNS = ["cohort", "period", "at_risk", "churned", "survival"]
+LIFETIME_COLUMNS = ["cohort", "clients", "churned", "mean_lifetime", "median_lifetime"]
+
+
+def client_lifetimes(ordinals, clients):
+    """
+    Возвращает первый и последний период активности каждого клиента
+    (порядковые номера периодов).
+    """
+    bounds = (
+        pd.DataFrame({"period": ordinals, "client": clients})
+        .groupby("client", sort=False)["period"]
+        .agg(["min", "max"])
+    )
+    return bounds["min"].to_numpy(np.int64), bounds["max"].to_numpy(np.int64)
+
+
+def _curves(deaths, totals, horizons):
+    """
+    Kaplan–Meier по строкам матриц deaths и totals (когорта x время жизни).
+
+    Возвращает размер группы риска и выживаемость S(t) = P(T > t), t = 0..max.
+    """
+    # В группе риска на шаге t все клиенты со временем жизни не меньше t
+    at_risk = totals[:, ::-1].cumsum(axis=1)[:, ::-1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        hazard = np.where(at_risk > 0, deaths / at_risk, 0.0)
+    survival = np.cumprod(1 - hazard, axis=1)
+    # За пределами наблюдаемого горизонта когорты выживаемость неизвестна
+    steps = np.arange(totals.shape[1])
+    survival = np.where(steps[None, :] <= horizons[:, None], survival, np.nan)
+    return at_risk, survival
+
+
+def survival_tables(ordinals, clients, freq="M", last_period=None):
+    """
+    Строит кривые выживаемости Kaplan–Meier и время жизни по когортам.
+
+    ordinals, clients - пары (период, клиент), например PartialAggregate.flat().
+    Возвращает две таблицы:
+    - curves: cohort, period (периодов с первой покупки), at_risk, churned, survival;
+    - lifetimes: cohort, clients, churned, mean_lifetime, median_lifetime
+      (в периодах гранулярности freq).
+    Строки с cohort=ALL_COHORTS считаются по всем клиентам.
+
+    last_period - порядковый номер последнего учитываемого периода: пары
+    после него отбрасываются, клиенты, активные в нем, цензурируются.
+    """
+    if last_period is not None:
+        keep = np.asarray(ordinals) <= last_period
+        ordinals, clients = np.asarray(ordinals)[keep], np.asarray(clients)[keep]
+    if len(ordinals) == 0:
+        return pd.DataFrame(columns=CURVE_COLUMNS), pd.DataFrame(columns=LIFETIME_COLUMNS)
+
+    first, last = client_lifetimes(ordinals, clients)
+    end = last.max() if last_period is None else last_period
+    return lifetime_tables([(first, last)], first.min(), end, freq=freq)
+
+
+def lifetime_tables(parts, start, end, freq="M"):
+    """
+    survival_tables по первому и последнему периоду активности клиентов.
+
+    parts - итерируемые пары массивов (first, last) для непересекающихся
+    групп клиентов: матрицы (когорта x время жизни) накапливаются по частям,
+    поэтому все клиенты сразу в памяти не нужны. start и end - порядковые
+    номера первого и последнего периода данных.
+    """
+    if end < start:
+        return pd.DataFrame(columns=CURVE_COLUMNS), pd.DataFrame(columns=LIFETIME_COLUMNS)
+
+    # Когорта - смещение первого периода от start, время жизни не больше горизонта
+    n_cohorts = int(end - start) + 1
+    width = n_cohorts + 1
+    deaths = np.zeros(n_cohorts * width)
+    totals = np.zeros(n_cohorts * width)
+    for first, last in parts:
+        flat = (first - start) * width + (last - first + 1)
+        churned = last < end
+        deaths += np.bincount(flat, weights=churned.astype(np.float64), minlength=len(deaths))
+        totals += np.bincount(flat, minlength=len(totals))
+    deaths = deaths.reshape(n_cohorts, width)
+    totals = totals.reshape(n_cohorts, width)
+
+    # Только когорты с клиентами, время жизни - до наибольшего наблюдаемого
+    present = totals.any(axis=1)
+    if not present.any():
+        return pd.DataFrame(columns=CURVE_COLUMNS), pd.DataFrame(columns=LIFETIME_COLUMNS)
+    cohort_ordinals = start + np.flatnonzero(present)
+    width = int(np.flatnonzero(totals.any(axis=0)).max()) + 1
+    deaths, totals = deaths[present, :width], totals[present, :width]
+    # Максимальное наблюдаемое время жизни для каждой когорты
+    horizons = (end - cohort_ordinals + 1).astype(np.int64)
+
+    # Кривая по всем клиентам - сумма матриц по когортам
+    deaths = np.vstack([deaths, deaths.sum(axis=0)])
+    totals = np.vstack([totals, totals.sum(axis=0)])
+    horizons = np.append(horizons, horizons.max())
+    at_risk, survival = _curves(deaths, totals, horizons)
+
+    labels = np.append(
+        pd.PeriodIndex.from_ordinals(cohort_ordinals, freq=freq).astype(str).to_numpy(),
+        ALL_COHORTS,
+    )
+    steps = np.arange(width)
+    observed = steps[None, :] <= horizons[:, None]
+    rows, cols = np.nonzero(observed)
+    curves = pd.DataFrame(
+        {
+            "cohort": labels[rows],
+            "period": cols,
+            "at_risk": at_risk[rows, cols].astype(np.int64),
+            "churned": deaths[rows, cols].astype(np.int64),
+            "survival": survival[rows, cols],
+        }
+    )
+
+    # Площадь под кривой в пределах горизонта: sum S(t), t = 0..horizon-1
+    within = steps[None, :] < horizons[:, None]
+    mean_lifetime = np.where(within, np.nan_to_num(survival), 0.0).sum(axis=1)
+    below_half = (survival <= 0.5) & observed
+    median_lifetime = np.where(below_half.any(axis=1), below_half.argmax(axis=1), np.nan)
+
+    lifetimes = pd.DataFrame(
+        {
+            "cohort": labels,
+            "clients": totals.sum(axis=1).astype(np.int64),
+            "churned": deaths.sum(axis=1).astype(np.int64),
+            "mean_lifetime": mean_lifetime,
+            "median_lifetime": median_lifetime,
+        }
+    )
+    return curves, lifetimes
+
+
+def aggregate_survival_tables(aggregate, memory_budget=None):
+    """
+    survival_tables по агрегату (PartialAggregate или ExternalAggregate)
+    в тех же периодах, что и calculate_metrics: незавершенный последний
+    период не учитывается.
+
+    Для агрегата на диске первый и последний периоды клиентов считаются
+    частями по диапазонам хешей, каждая часть укладывается в memory_budget.
+    """
+    from app.spill import ExternalAggregate
+
+    periods = period_range(aggregate.min_date, aggregate.max_date, aggregate.freq)
+    # Без завершенных периодов отбрасываются все пары
+    last_period = periods[-1].ordinal if len(periods) else np.iinfo(np.int64).min
+    if isinstance(aggregate, ExternalAggregate):
+        index = aggregate.index()
+        start = index.periods[0].ordinal if len(index) else 0
+        return lifetime_tables(
+            aggregate.client_lifetimes(last_period, memory_budget),
+            start,
+            last_period,
+            freq=aggregate.freq,
+        )
+
+    ordinals, clients, _ = aggregate.flat()
+    return survival_tables(ordinals, clients, freq=aggregate.freq, last_period=last_period)
@@ -0,0 +1,129 @@
+"""
+Модуль для компактной передачи таблиц между сервером и браузером
+
+Вместо списка записей (to_dict("records")), где имена колонок повторяются
+в каждой строке, таблица передается по колонкам:
+
+    {"format": "columnar", "columns": [...], "data": {col: [...]}, "dtypes": {...}}
+
+Колонки Period передаются как целые ordinal-значения, даты - как целые
+наносекунды. Типы числовых колонок и дат передаются в dtypes и
+восстанавливаются при декодировании. В формате "arrow"
+таблица передается как сжатый Arrow IPC в base64.
+"""
+
+import base64
+import os
+
+import numpy as np
+import pandas as pd
+
+# Формат передачи по умолчанию: columnar или arrow
+TRANSPORT_FORMAT = os.getenv("TRANSPORT_FORMAT", "columnar")
+
+
+def _encode_column(series: pd.Series):
+    """Преобразует колонку в JSON-совместимый список и описание типа"""
+    if isinstance(series.dtype, pd.PeriodDtype):
+        values = series.array.asi8
+        mask = series.isna().to_numpy()
+        return _int_list(values, mask), series.dtype.name
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        values = series.to_numpy(dtype="datetime64[ns]").view("int64")
+        return _int_list(values, series.isna().to_numpy()), "datetime64[ns]"
+    if pd.api.types.is_float_dtype(series.dtype):
+        values = series.to_numpy(dtype=float, na_value=np.nan)
+        # NaN и бесконечности не поддерживаются JSON, передаем как null.
+        # Тип нужен, чтобы колонка из одних null не стала object
+        return np.where(np.isfinite(values), values, None).tolist(), series.dtype.name
+    if pd.api.types.is_bool_dtype(series.dtype) or pd.api.types.is_integer_dtype(
+        series.dtype
+    ):
+        if not series.hasnans:
+            return series.tolist(), series.dtype.name
+        # Nullable Int64/boolean с пропусками
+        return series.astype(object).where(series.notna(), None).tolist(), series.dtype.name
+    return series.astype(object).where(series.notna(), None).tolist(), None
+
+
+def _int_list(values, mask):
+    return np.where(mask, None, values).tolist()
+
+
+def _decode_column(values, dtype):
+    if dtype is None:
+        return pd.Series(values)
+    if dtype.startswith("period["):
+        freq = dtype[len("period[") : -1]
+        ordinals = pd.array(values, dtype="Int64").to_numpy(
+            dtype="int64", na_value=pd.NaT.value
+        )
+        return pd.Series(pd.PeriodIndex.from_ordinals(ordinals, freq=freq))
+    if dtype == "datetime64[ns]":
+        ints = pd.array(values, dtype="Int64").to_numpy(
+            dtype="int64", na_value=pd.NaT.value
+        )
+        return pd.Series(ints.view("datetime64[ns]"))
+    return pd.Series(values, dtype=dtype)
+
+
+def encode_frame(df: pd.DataFrame, fmt: str = None) -> dict:
+    """Кодирует DataFrame для передачи в dcc.Store"""
+    fmt = fmt or TRANSPORT_FORMAT
+    if fmt == "arrow":
+        try:
+            return _encode_arrow(df)
+        except Exception:
+            # Колонки со смешанными типами не поддерживаются Arrow
+            pass
+
+    data, dtypes = {}, {}
+    for col in df.columns:
+        data[str(col)], dtype = _encode_column(df[col])
+        if dtype is not None:
+            dtypes[str(col)] = dtype
+    return {
+        "format": "columnar",
+        "columns": [str(col) for col in df.columns],
+        "data": data,
+        "dtypes": dtypes,
+    }
+
+
+def decode_frame(payload) -> pd.DataFrame:
+    """Восстанавливает DataFrame из формата передачи"""
+    if isinstance(payload, list):
+        # Совместимость со списком записей
+        return pd.DataFrame(payload)
+    if payload.get("format") == "arrow":
+        return _decode_arrow(payload)
+
+    dtypes = payload.get("dtypes", {})
+    return pd.DataFrame(
+        {
+            col: _decode_column(payload["data"][col], dtypes.get(col))
+            for col in payload["columns"]
+        },
+        columns=payload["columns"],
+    )
+
+
+def _encode_arrow(df: pd.DataFrame) -> dict:
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    options = pa.ipc.IpcWriteOptions(compression="zstd")
+    with pa.ipc.new_stream(sink, table.schema, options=options) as writer:
+        writer.write_table(table)
+    return {
+        "format": "arrow",
+        "data": base64.b64encode(sink.getvalue().to_pybytes()).decode("ascii"),
+    }
+
+
+def _decode_arrow(payload: dict) -> pd.DataFrame:
+    import pyarrow as pa
+
+    reader = pa.ipc.open_stream(base64.b64decode(payload["data"]))
+    return reader.read_all().to_pandas()
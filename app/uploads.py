@@ -0,0 +1,224 @@
+"""
+Модуль для поблочной загрузки файлов в обход dcc.Upload
+
+Протокол (все запросы проходят общую проверку авторизации):
+
+- POST /upload/init            {"filename": ..., "size": ...} -> {"upload_id": ...}
+- GET  /upload/<upload_id>     -> {"received": <байт принято>} (для докачки)
+- POST /upload/<upload_id>/chunk  multipart: offset, chunk
+- POST /upload/<upload_id>/complete -> метаданные набора данных
+
+Блоки пишутся сразу в файл на диске. При завершении загрузки файлы
+.gz и .zst распаковываются потоково и сохраняются как набор данных
+(см. app/datasets.py).
+"""
+
+import gzip
+import json
+import os
+import shutil
+
+from app.datasets import DATA_DIR, cleanup_expired, create_dataset, is_valid_id, new_id
+
+# Директория для незавершенных загрузок
+UPLOADS_DIR = DATA_DIR / "uploads"
+# Максимальный размер одного блока
+MAX_CHUNK_SIZE = 16 * 1024 * 1024
+# Максимальный размер загружаемого файла (до распаковки)
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", str(10 * 1024**3)))
+# Размер буфера при копировании и распаковке
+COPY_BUFFER_SIZE = 1024 * 1024
+
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+class UploadError(Exception):
+    """Ошибка загрузки с HTTP статусом"""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def _part_path(upload_id: str):
+    if not is_valid_id(upload_id):
+        raise UploadError("Некорректный идентификатор загрузки", 404)
+    return UPLOADS_DIR / f"{upload_id}.part"
+
+
+def _meta_path(upload_id: str):
+    return UPLOADS_DIR / f"{upload_id}.json"
+
+
+def _load_upload(upload_id: str) -> dict:
+    part_path = _part_path(upload_id)
+    meta_path = _meta_path(upload_id)
+    if not meta_path.exists() or not part_path.exists():
+        raise UploadError("Загрузка не найдена", 404)
+    with open(meta_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _parse_size(value):
+    """Проверяет размер файла из запроса клиента"""
+    if value is None:
+        return None
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        raise UploadError("Некорректный размер файла size")
+    if size < 0:
+        raise UploadError("Некорректный размер файла size")
+    if size > MAX_UPLOAD_SIZE:
+        raise UploadError(f"Файл больше {MAX_UPLOAD_SIZE} байт", 413)
+    return size
+
+
+def init_upload(filename: str, size=None) -> str:
+    """Создает новую загрузку и возвращает ее идентификатор"""
+    if not filename or not isinstance(filename, str):
+        raise UploadError("Не указано имя файла")
+    size = _parse_size(size)
+    # Брошенные загрузки удаляются по истечении DATASET_TTL_HOURS
+    cleanup_expired(UPLOADS_DIR)
+    upload_id = new_id()
+    UPLOADS_DIR.mkdir(parents=True, exist_ok=True)
+    _part_path(upload_id).touch()
+    with open(_meta_path(upload_id), "w", encoding="utf-8") as f:
+        json.dump({"filename": filename, "size": size}, f, ensure_ascii=False)
+    return upload_id
+
+
+def received_bytes(upload_id: str) -> int:
+    """Возвращает количество уже принятых байт"""
+    _load_upload(upload_id)
+    return _part_path(upload_id).stat().st_size
+
+
+def append_chunk(upload_id: str, offset: int, stream) -> int:
+    """
+    Дописывает блок в файл загрузки.
+
+    Блок принимается только если offset совпадает с количеством уже принятых
+    байт, поэтому повторная отправка блока после обрыва безопасна.
+    """
+    meta = _load_upload(upload_id)
+    part_path = _part_path(upload_id)
+    received = part_path.stat().st_size
+    if offset != received:
+        raise UploadError(f"Ожидается смещение {received}", 409)
+
+    limit = min(MAX_CHUNK_SIZE, MAX_UPLOAD_SIZE - received)
+    if meta.get("size") is not None:
+        limit = min(limit, meta["size"] - received)
+
+    with open(part_path, "ab") as f:
+        written = 0
+        while True:
+            buf = stream.read(COPY_BUFFER_SIZE)
+            if not buf:
+                break
+            written += len(buf)
+            if written > limit:
+                f.truncate(received)
+                raise UploadError("Блок слишком большой", 413)
+            f.write(buf)
+
+    return received + written
+
+
+def _open_decompressed(path, filename: str):
+    """Открывает файл загрузки с потоковой распаковкой gzip/zstd"""
+    with open(path, "rb") as f:
+        magic = f.read(4)
+    name = filename.lower()
+    if magic.startswith(GZIP_MAGIC) or name.endswith((".gz", ".gzip")):
+        return gzip.open(path, "rb")
+    if magic == ZSTD_MAGIC or name.endswith((".zst", ".zstd")):
+        try:
+            import zstandard
+        except ImportError:
+            raise UploadError("Для файлов .zst требуется пакет zstandard", 415)
+        return zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+    return open(path, "rb")
+
+
+def complete_upload(upload_id: str) -> dict:
+    """Завершает загрузку и сохраняет файл как набор данных"""
+    meta = _load_upload(upload_id)
+    part_path = _part_path(upload_id)
+    received = part_path.stat().st_size
+    if meta.get("size") is not None and received != meta["size"]:
+        raise UploadError(f"Файл загружен не полностью: {received} из {meta['size']}", 409)
+
+    def write_data(dst):
+        with _open_decompressed(part_path, meta["filename"]) as src:
+            shutil.copyfileobj(src, dst, COPY_BUFFER_SIZE)
+
+    try:
+        dataset = create_dataset(write_data, meta["filename"])
+    except UploadError:
+        raise
+    except Exception as e:
+        raise UploadError(f"Ошибка при чтении файла: {e}", 422)
+    finally:
+        part_path.unlink(missing_ok=True)
+        _meta_path(upload_id).unlink(missing_ok=True)
+    return dataset
+
+
+def register_upload_routes(server, prefix: str = "/upload"):
+    """Регистрирует эндпоинты поблочной загрузки на Flask сервере"""
+    from flask import jsonify, request
+
+    def handle(func):
+        def wrapper(*args, **kwargs):
+            try:
+                return jsonify(func(*args, **kwargs))
+            except UploadError as e:
+                return jsonify({"error": str(e)}), e.status
+
+        wrapper.__name__ = func.__name__
+        return wrapper
+
+    @handle
+    def upload_init():
+        payload = request.get_json(silent=True)
+        if not isinstance(payload, dict):
+            raise UploadError("Ожидается JSON с полями filename и size")
+        upload_id = init_upload(payload.get("filename"), payload.get("size"))
+        return {"upload_id": upload_id, "max_chunk_size": MAX_CHUNK_SIZE}
+
+    @handle
+    def upload_status(upload_id):
+        return {"received": received_bytes(upload_id)}
+
+    @handle
+    def upload_chunk(upload_id):
+        chunk = request.files.get("chunk")
+        if chunk is None:
+            raise UploadError("Не передан блок chunk")
+        try:
+            offset = int(request.form.get("offset", ""))
+        except ValueError:
+            raise UploadError("Некорректное смещение offset")
+        return {"received": append_chunk(upload_id, offset, chunk.stream)}
+
+    @handle
+    def upload_complete(upload_id):
+        return complete_upload(upload_id)
+
+    server.add_url_rule(f"{prefix}/init", "upload_init", upload_init, methods=["POST"])
+    server.add_url_rule(
+        f"{prefix}/<upload_id>", "upload_status", upload_status, methods=["GET"]
+    )
+    server.add_url_rule(
+        f"{prefix}/<upload_id>/chunk", "upload_chunk", upload_chunk, methods=["POST"]
+    )
+    server.add_url_rule(
+        f"{prefix}/<upload_id>/complete",
+        "upload_complete",
+        upload_complete,
+        methods=["POST"],
+    )
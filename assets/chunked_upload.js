@@ -0,0 +1,101 @@
+// Поблочная загрузка больших файлов через /upload (см. app/uploads.py).
+// Файл отправляется частями с докачкой после обрыва, в Dash передается
+// только идентификатор набора данных через dcc.Store "chunked-upload-result".
+(function () {
+    var CHUNK_SIZE = 8 * 1024 * 1024;
+    var MAX_RETRIES = 5;
+
+    function setStatus(text) {
+        if (window.dash_clientside && window.dash_clientside.set_props) {
+            window.dash_clientside.set_props("chunked-upload-status", {children: text});
+        }
+    }
+
+    function requestJson(url, options) {
+        return fetch(url, Object.assign({credentials: "same-origin"}, options)).then(
+            function (response) {
+                return response.json().then(function (body) {
+                    if (!response.ok) {
+                        var error = new Error(body.error || response.statusText);
+                        error.status = response.status;
+                        throw error;
+                    }
+                    return body;
+                });
+            }
+        );
+    }
+
+    function sleep(ms) {
+        return new Promise(function (resolve) { setTimeout(resolve, ms); });
+    }
+
+    async function uploadFile(file) {
+        var init = await requestJson("/upload/init", {
+            method: "POST",
+            headers: {"Content-Type": "application/json"},
+            body: JSON.stringify({filename: file.name, size: file.size}),
+        });
+        var uploadId = init.upload_id;
+        var chunkSize = Math.min(CHUNK_SIZE, init.max_chunk_size || CHUNK_SIZE);
+        var offset = 0;
+        var retries = 0;
+
+        while (offset < file.size) {
+            var form = new FormData();
+            form.append("offset", String(offset));
+            form.append("chunk", file.slice(offset, offset + chunkSize), file.name);
+            try {
+                var result = await requestJson("/upload/" + uploadId + "/chunk", {
+                    method: "POST",
+                    body: form,
+                });
+                offset = result.received;
+                retries = 0;
+                setStatus(file.name + ": загружено " + Math.floor(offset * 100 / file.size) + "%");
+            } catch (error) {
+                if (error.status === 401 || error.status === 413 || retries >= MAX_RETRIES) {
+                    throw error;
+                }
+                retries += 1;
+                await sleep(1000 * retries);
+                // Докачка: узнаем, сколько байт сервер уже принял
+                var status = await requestJson("/upload/" + uploadId, {method: "GET"});
+                offset = status.received;
+            }
+        }
+
+        setStatus(file.name + ": обработка файла на сервере...");
+        var dataset = await requestJson("/upload/" + uploadId + "/complete", {method: "POST"});
+        dataset.last_modified = file.lastModified / 1000;
+        return dataset;
+    }
+
+    async function uploadFiles(files) {
+        for (var i = 0; i < files.length; i++) {
+            try {
+                var dataset = await uploadFile(files[i]);
+                setStatus(files[i].name + ": файл загружен");
+                window.dash_clientside.set_props("chunked-upload-result", {data: dataset});
+            } catch (error) {
+                setStatus(files[i].name + ": ошибка загрузки: " + error.message);
+            }
+        }
+    }
+
+    // Кнопка рендерится Dash позже загрузки скрипта, поэтому слушаем клики на document
+    document.addEventListener("click", function (event) {
+        var button = event.target.closest && event.target.closest("#chunked-upload-button");
+        if (!button) {
+            return;
+        }
+        var input = document.createElement("input");
+        input.type = "file";
+        input.multiple = true;
+        input.accept = ".csv,.gz,.zst,.parquet,.xls,.xlsx";
+        input.addEventListener("change", function () {
+            uploadFiles(Array.prototype.slice.call(input.files || []));
+        });
+        input.click();
+    });
+})();
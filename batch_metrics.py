@@ -0,0 +1,151 @@
+"""
+Пакетный расчет метрик клиентов из командной строки
+
+Пример:
+
+    python batch_metrics.py "exports/*.csv" --date-col date --client-id-col client_id \
+        --segment-col region --forecast 12 --output results/metrics.parquet
+"""
+
+import argparse
+import os
+import sys
+
+from app.batch import CHUNK_SIZE, expand_inputs, process_inputs, write_table
+from app.periods import DEFAULT_FREQ, PERIODS_PER_YEAR
+from app.spill import MEMORY_BUDGET, SPILL_DIR
+
+
+# Подписи дополнительных таблиц для сообщений
+TABLE_LABELS = {
+    "forecast": "Прогноз",
+    "survival": "Кривые выживаемости",
+    "lifetime": "Время жизни по когортам",
+}
+
+
+def _table_path(output: str, name: str) -> str:
+    root, ext = os.path.splitext(output)
+    return f"{root}_{name}{ext}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Расчет метрик оттока и притока клиентов без Dash сервера"
+    )
+    parser.add_argument(
+        "inputs",
+        nargs="+",
+        help="Пути или glob-шаблоны файлов CSV/Parquet/Excel, частичных агрегатов "
+        "*.partials.npz или скетчей *.sketches.npz",
+    )
+    parser.add_argument("--date-col", default="date", help="Колонка с датой")
+    parser.add_argument("--client-id-col", default="client_id", help="Колонка с client_id")
+    parser.add_argument("--segment-col", default=None, help="Колонка с сегментом")
+    parser.add_argument(
+        "--amount-col",
+        default=None,
+        help="Колонка с суммой для метрик выручки (NRR, GRR, расширение, сокращение)",
+    )
+    parser.add_argument(
+        "--forecast",
+        type=int,
+        default=0,
+        help="Горизонт прогноза оттока и притока в периодах (0 - без прогноза)",
+    )
+    parser.add_argument(
+        "--survival",
+        action="store_true",
+        help="Сохранить кривые выживаемости Kaplan-Meier и время жизни по когортам",
+    )
+    parser.add_argument(
+        "--granularity",
+        choices=list(PERIODS_PER_YEAR),
+        default=DEFAULT_FREQ,
+        help="Гранулярность периодов: D - день, W - неделя, M - месяц, Q - квартал",
+    )
+    parser.add_argument(
+        "--output",
+        default="metrics.csv",
+        help="Файл результата: .parquet, .json или .csv",
+    )
+    parser.add_argument(
+        "--per-file",
+        action="store_true",
+        help="Считать метрики для каждого файла отдельно",
+    )
+    parser.add_argument(
+        "--jobs", type=int, default=None, help="Количество процессов (по умолчанию все ядра)"
+    )
+    parser.add_argument("--chunksize", type=int, default=CHUNK_SIZE)
+    parser.add_argument(
+        "--save-partials",
+        default=None,
+        help="Сохранить объединенные частичные агрегаты (*.partials.npz) для следующих запусков",
+    )
+    parser.add_argument(
+        "--memory-budget",
+        default=MEMORY_BUDGET,
+        help="Бюджет памяти группировки, например 6G (по умолчанию MEMORY_BUDGET, "
+        "без ограничения); при превышении агрегаты сбрасываются на диск",
+    )
+    parser.add_argument(
+        "--spill-dir",
+        default=SPILL_DIR,
+        help="Каталог для временных файлов при сбросе на диск (по умолчанию SPILL_DIR)",
+    )
+    parser.add_argument(
+        "--approximate",
+        action="store_true",
+        help="Приближенный расчет по скетчам HyperLogLog (ошибка ~1%% для количества клиентов)",
+    )
+    parser.add_argument(
+        "--save-sketches",
+        default=None,
+        help="Сохранить объединенные скетчи (*.sketches.npz) для следующих запусков "
+        "(только с --approximate)",
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        paths = expand_inputs(args.inputs)
+    except FileNotFoundError as e:
+        print(e, file=sys.stderr)
+        return 1
+
+    print(f"Файлов на входе: {len(paths)}", file=sys.stderr)
+    try:
+        metrics, tables = process_inputs(
+            paths,
+            date_col=args.date_col,
+            client_id_col=args.client_id_col,
+            segment_col=args.segment_col,
+            forecast_months=args.forecast,
+            per_file=args.per_file,
+            jobs=args.jobs,
+            chunksize=args.chunksize,
+            approximate=args.approximate,
+            partials_output=args.save_partials,
+            freq=args.granularity,
+            amount_col=args.amount_col,
+            survival=args.survival,
+            memory_budget=args.memory_budget,
+            spill_dir=args.spill_dir,
+            sketches_output=args.save_sketches,
+        )
+    except ValueError as e:
+        # Несовместимые опции и входные файлы
+        print(e, file=sys.stderr)
+        return 1
+
+    write_table(metrics, args.output)
+    print(f"Метрики сохранены в {args.output}", file=sys.stderr)
+    for name, table in tables.items():
+        table_path = _table_path(args.output, name)
+        write_table(table, table_path)
+        print(f"{TABLE_LABELS[name]}: {table_path}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
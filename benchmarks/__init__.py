@@ -0,0 +1,3 @@
+"""
+Бенчмарки конвейера расчета метрик
+"""
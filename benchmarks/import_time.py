@@ -0,0 +1,101 @@
+"""
+Замер времени холодного старта дашборда
+
+Модуль импортируется в отдельном процессе с `python -X importtime`,
+из отчета берется суммарное время импорта и самые медленные модули.
+
+    python -m benchmarks.import_time --module dash_customer --repeat 5 --max-seconds 1.0
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+
+def measure_import(module: str) -> dict:
+    """Импортирует модуль в новом процессе и разбирает отчет -X importtime"""
+    env = dict(os.environ)
+    env.setdefault("USERS", "{}")
+    # app.auth не импортируется без секрета подписи токенов
+    env.setdefault("SESSION_SECRET", "benchmark-secret")
+    code = f"import {module}"
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    modules = {}
+    total_us = 0
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        try:
+            self_us, cumulative_us = int(parts[0]), int(parts[1])
+        except ValueError:
+            # Строка заголовка
+            continue
+        name = parts[2].strip()
+        modules[name] = self_us
+        if name == module:
+            total_us = cumulative_us
+    return {"total_seconds": total_us / 1e6, "modules": modules}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замер времени импорта дашборда")
+    parser.add_argument("--module", default="dash_customer")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="Сколько медленных модулей показать")
+    parser.add_argument(
+        "--max-seconds",
+        type=float,
+        default=None,
+        help="Порог времени импорта; при превышении код возврата 1",
+    )
+    parser.add_argument("--output", default=None, help="Файл для результатов в JSON")
+    args = parser.parse_args(argv)
+
+    runs = [measure_import(args.module) for _ in range(args.repeat)]
+    totals = [run["total_seconds"] for run in runs]
+    median = statistics.median(totals)
+
+    # Медианное собственное время импорта каждого модуля
+    names = set().union(*(run["modules"] for run in runs))
+    self_times = {
+        name: statistics.median(run["modules"].get(name, 0) for run in runs) / 1e6
+        for name in names
+    }
+    slowest = sorted(self_times.items(), key=lambda item: item[1], reverse=True)[: args.top]
+
+    print(f"Импорт {args.module}: медиана {median:.3f} s (мин {min(totals):.3f} s)")
+    for name, seconds in slowest:
+        print(f"  {seconds * 1000:8.1f} ms  {name}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "module": args.module,
+                    "median_seconds": median,
+                    "runs_seconds": totals,
+                    "slowest_modules": dict(slowest),
+                },
+                f,
+                indent=2,
+            )
+
+    if args.max_seconds is not None and median > args.max_seconds:
+        print(f"Превышен порог {args.max_seconds:.3f} s")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,178 @@
+"""
+Нагрузочный тест дашборда под gunicorn с разным количеством воркеров
+
+Для каждого значения --workers запускается gunicorn (wsgi:server),
+после чего параллельные клиенты вызывают callback расчета метрик
+(process_data) на синтетических данных. Выводится пропускная способность
+и задержки, результаты сохраняются в JSON.
+
+    python -m benchmarks.load_test --workers 1,2,4 --rows 100k --concurrency 8
+"""
+
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+from app.transport import encode_frame
+from benchmarks.run import parse_size
+from benchmarks.synthetic import generate_transactions
+
+FILENAME = "load_test.csv"
+
+
+def _component_id(type_: str) -> dict:
+    return {"index": FILENAME, "type": type_}
+
+
+def _prop_id(component_id, prop) -> str:
+    return f"{json.dumps(component_id, sort_keys=True, separators=(',', ':'))}.{prop}"
+
+
+def build_payload(n_rows, seed=0) -> dict:
+    """Формирует тело запроса callback process_data, как его отправляет браузер"""
+    df = generate_transactions(n_rows, seed=seed)
+    df["date"] = df["date"].dt.strftime("%Y-%m-%d")
+    store = {FILENAME: encode_frame(df)}
+    button_id = _component_id("process-btn")
+    outputs = [
+        {"id": _component_id("processing-status"), "property": "children"},
+        {"id": _component_id("metrics-store"), "property": "data"},
+    ]
+    return {
+        # Формат Dash для нескольких выходов с MATCH: "..id1.prop...id2.prop.."
+        "output": ".."
+        + "...".join(
+            _prop_id({**o["id"], "index": ["MATCH"]}, o["property"]) for o in outputs
+        )
+        + "..",
+        "outputs": outputs,
+        "inputs": [{"id": button_id, "property": "n_clicks", "value": 1}],
+        "changedPropIds": [_prop_id(button_id, "n_clicks")],
+        "state": [
+            {"id": "uploaded-data-store", "property": "data", "value": store},
+            {"id": button_id, "property": "id", "value": button_id},
+            {"id": _component_id("date-col-input"), "property": "value", "value": "date"},
+            {
+                "id": _component_id("client-id-col-input"),
+                "property": "value",
+                "value": "client_id",
+            },
+            {"id": _component_id("amount-col-input"), "property": "value", "value": ""},
+        ],
+    }
+
+
+def _wait_ready(url, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            requests.get(f"{url}/_dash-layout", timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError(f"Сервер {url} не запустился за {timeout} с")
+
+
+def start_server(workers, threads, port):
+    """Запускает gunicorn с заданным количеством воркеров"""
+    env = dict(os.environ)
+    env.update(
+        {
+            "GUNICORN_WORKERS": str(workers),
+            "GUNICORN_THREADS": str(threads),
+            "PORT": str(port),
+        }
+    )
+    env.setdefault("USERS", "{}")
+    # app.auth не импортируется без секрета подписи токенов
+    env.setdefault("SESSION_SECRET", "benchmark-secret")
+    return subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "wsgi:server"],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+
+
+def run_load(url, body, requests_total, concurrency):
+    """Отправляет requests_total запросов в concurrency потоков"""
+    headers = {"Content-Type": "application/json"}
+
+    def call(_):
+        start = time.perf_counter()
+        response = requests.post(
+            f"{url}/_dash-update-component", data=body, headers=headers, timeout=600
+        )
+        response.raise_for_status()
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(call, range(requests_total)))
+    elapsed = time.perf_counter() - start
+    return {
+        "requests": requests_total,
+        "seconds": elapsed,
+        "throughput_rps": requests_total / elapsed,
+        "latency_p50": float(np.percentile(latencies, 50)),
+        "latency_p95": float(np.percentile(latencies, 95)),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочный тест дашборда")
+    parser.add_argument("--workers", default="1,2,4", help="Количество воркеров через запятую")
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--rows", default="100k", help="Размер загруженного файла")
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--output", default="load_test.json")
+    args = parser.parse_args(argv)
+
+    body = json.dumps(build_payload(parse_size(args.rows)))
+    url = f"http://127.0.0.1:{args.port}"
+    results = []
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        os.environ["DATA_DIR"] = data_dir
+        for workers in [int(w) for w in args.workers.split(",") if w.strip()]:
+            server = start_server(workers, args.threads, args.port)
+            try:
+                _wait_ready(url)
+                # Прогрев: первый запрос в каждом воркере медленнее
+                run_load(url, body, workers, workers)
+                result = run_load(url, body, args.requests, args.concurrency)
+            finally:
+                os.killpg(server.pid, signal.SIGTERM)
+                server.wait()
+            result.update({"workers": workers, "threads": args.threads})
+            results.append(result)
+            print(
+                f"workers={workers:<3} {result['throughput_rps']:8.2f} req/s "
+                f"p50={result['latency_p50']:.3f}s p95={result['latency_p95']:.3f}s",
+                flush=True,
+            )
+
+    base = results[0]["throughput_rps"] if results else 0
+    for result in results:
+        result["speedup"] = result["throughput_rps"] / base if base else None
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"rows": parse_size(args.rows), "results": results}, f, indent=2)
+    print(f"Результаты сохранены в {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,290 @@
+"""
+Воспроизводимый бенчмарк конвейера расчета метрик
+
+Для каждого размера генерируются синтетические транзакции
+(см. benchmarks/synthetic.py) и замеряются этапы: чтение CSV, препроцессинг,
+расчет метрик и сериализация метрик для браузера.
+
+Запуск замеров (результаты сохраняются в JSON):
+
+    python -m benchmarks.run run --sizes 10k,1m --output bench.json
+
+Сравнение двух запусков (код возврата 1 при найденных регрессиях):
+
+    python -m benchmarks.run compare base.json bench.json --threshold 0.1
+"""
+
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from app import profiling
+from app.metrics import calculate_metrics
+from app.preprocessing import preprocessing_data
+from app.transport import encode_frame
+from benchmarks.synthetic import generate_transactions
+
+SIZE_SUFFIXES = {"k": 1_000, "m": 1_000_000}
+DEFAULT_SIZES = "10k,1m"
+
+
+def parse_size(value: str) -> int:
+    """Преобразует размер вида 10k / 1m / 50M в число строк"""
+    value = value.strip().lower()
+    if value and value[-1] in SIZE_SUFFIXES:
+        return int(float(value[:-1]) * SIZE_SUFFIXES[value[-1]])
+    return int(value)
+
+
+def serialize_metrics(df_metrics):
+    """Сериализует метрики так же, как дашборд перед отправкой в браузер"""
+    payload = encode_frame(
+        df_metrics.drop(
+            columns=["clients", "clients_prev", "clients_prev_year"], errors="ignore"
+        )
+    )
+    return json.dumps(payload)
+
+
+def _measure(name, func, repeat, measure_memory):
+    """
+    Выполняет этап repeat раз и возвращает лучший замер времени.
+
+    Пик памяти замеряется отдельным прогоном, так как tracemalloc
+    искажает время выполнения.
+    """
+    best = None
+    result = None
+    for _ in range(repeat):
+        gc.collect()
+        profiling.enable(tracemalloc_enabled=False)
+        with profiling.stage(name) as rec:
+            result = func()
+        if best is None or rec["wall_seconds"] < best["wall_seconds"]:
+            best = dict(rec)
+
+    if measure_memory:
+        del result
+        gc.collect()
+        profiling.enable(tracemalloc_enabled=True)
+        with profiling.stage(name) as rec:
+            result = func()
+        tracemalloc.stop()
+        best["peak_memory_bytes"] = rec["peak_memory_bytes"]
+    return best, result
+
+
+def run_size(n_rows, args):
+    """Замеряет все этапы конвейера на синтетических данных заданного размера"""
+    df = generate_transactions(
+        n_rows,
+        n_clients=args.clients or None,
+        months=args.months,
+        churn_rate=args.churn_rate,
+        seasonality=args.seasonality,
+        skew=args.skew,
+        seed=args.seed,
+    )
+    results = []
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_path = os.path.join(tmp_dir, "transactions.csv")
+        df.to_csv(csv_path, index=False)
+        del df
+
+        rec, df = _measure(
+            "ingestion", lambda: pd.read_csv(csv_path), args.repeat, args.memory
+        )
+        results.append(rec)
+
+    # Препроцессинг изменяет входной DataFrame, поэтому работаем с копией
+    rec, df_grouped = _measure(
+        "preprocessing_data",
+        lambda: preprocessing_data(df.copy()),
+        args.repeat,
+        args.memory,
+    )
+    results.append(rec)
+    del df
+
+    rec, df_metrics = _measure(
+        "calculate_metrics",
+        lambda: calculate_metrics(df_grouped.copy()),
+        args.repeat,
+        args.memory,
+    )
+    results.append(rec)
+
+    rec, _ = _measure(
+        "serialization",
+        lambda: serialize_metrics(df_metrics),
+        args.repeat,
+        args.memory,
+    )
+    results.append(rec)
+
+    for rec in results:
+        rec["n_rows"] = n_rows
+        rec.pop("max_rss_bytes", None)
+    return results
+
+
+def _git_commit():
+    try:
+        return (
+            subprocess.check_output(
+                ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL
+            )
+            .decode()
+            .strip()
+        )
+    except Exception:
+        return None
+
+
+def command_run(args):
+    profiling.logger.addHandler(logging.StreamHandler())
+    profiling.logger.setLevel(logging.INFO if args.verbose else logging.WARNING)
+    sizes = [parse_size(s) for s in args.sizes.split(",") if s.strip()]
+
+    results = []
+    for n_rows in sizes:
+        print(f"Размер: {n_rows:,} строк", flush=True)
+        for rec in run_size(n_rows, args):
+            memory = rec.get("peak_memory_bytes")
+            memory_str = f"{memory / 2**20:10.1f} MB" if memory is not None else ""
+            print(f"  {rec['stage']:<20} {rec['wall_seconds']:10.3f} s {memory_str}")
+            results.append(rec)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "git_commit": _git_commit(),
+            "python": sys.version.split()[0],
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "params": {
+                "sizes": sizes,
+                "clients": args.clients,
+                "months": args.months,
+                "churn_rate": args.churn_rate,
+                "seasonality": args.seasonality,
+                "skew": args.skew,
+                "seed": args.seed,
+                "repeat": args.repeat,
+                "memory": args.memory,
+            },
+        },
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"Результаты сохранены в {args.output}")
+    return 0
+
+
+def compare_reports(base, new, threshold):
+    """
+    Сравнивает два отчета и возвращает строки сравнения.
+
+    Регрессией считается рост времени или пика памяти больше чем на threshold.
+    """
+    base_index = {(r["n_rows"], r["stage"]): r for r in base["results"]}
+    rows = []
+    for rec in new["results"]:
+        key = (rec["n_rows"], rec["stage"])
+        if key not in base_index:
+            continue
+        old = base_index[key]
+        for metric in ("wall_seconds", "peak_memory_bytes"):
+            old_value, new_value = old.get(metric), rec.get(metric)
+            if not old_value or new_value is None:
+                continue
+            ratio = new_value / old_value
+            rows.append(
+                {
+                    "n_rows": rec["n_rows"],
+                    "stage": rec["stage"],
+                    "metric": metric,
+                    "base": old_value,
+                    "new": new_value,
+                    "ratio": ratio,
+                    "regression": ratio > 1 + threshold,
+                }
+            )
+    return rows
+
+
+def command_compare(args):
+    with open(args.base, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)
+
+    rows = compare_reports(base, new, args.threshold)
+    for row in rows:
+        flag = "РЕГРЕССИЯ" if row["regression"] else ""
+        print(
+            f"{row['n_rows']:>12,} {row['stage']:<20} {row['metric']:<18} "
+            f"{row['base']:>14.4g} {row['new']:>14.4g} {row['ratio']:>7.2f}x {flag}"
+        )
+
+    regressions = [row for row in rows if row["regression"]]
+    if regressions:
+        print(f"Найдено регрессий: {len(regressions)}")
+        return 1
+    print("Регрессий не найдено")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк конвейера расчета метрик")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Запустить замеры")
+    run_parser.add_argument(
+        "--sizes",
+        default=DEFAULT_SIZES,
+        help="Размеры в строках через запятую, например 10k,1m,10m,50m",
+    )
+    run_parser.add_argument("--output", default="bench_output.json")
+    run_parser.add_argument("--clients", type=int, default=0)
+    run_parser.add_argument("--months", type=int, default=24)
+    run_parser.add_argument("--churn-rate", type=float, default=0.05)
+    run_parser.add_argument("--seasonality", type=float, default=0.2)
+    run_parser.add_argument("--skew", type=float, default=1.5)
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--repeat", type=int, default=1)
+    run_parser.add_argument(
+        "--no-memory",
+        dest="memory",
+        action="store_false",
+        help="Не замерять пик памяти (tracemalloc замедляет выполнение)",
+    )
+    run_parser.add_argument("--verbose", action="store_true")
+    run_parser.set_defaults(func=command_run)
+
+    compare_parser = subparsers.add_parser("compare", help="Сравнить два запуска")
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type=float, default=0.1)
+    compare_parser.set_defaults(func=command_compare)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
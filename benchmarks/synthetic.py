@@ -0,0 +1,85 @@
+"""
+Генератор синтетических транзакций для бенчмарков
+
+Модель данных:
+- клиенты приходят равномерно в течение всего периода, часть базы
+  активна с первого месяца;
+- время жизни клиента в месяцах имеет геометрическое распределение
+  с параметром `churn_rate`;
+- частота покупок клиента имеет распределение Парето (параметр `skew`),
+  поэтому небольшая доля клиентов дает большую часть транзакций;
+- количество транзакций по месяцам модулируется годовой сезонностью.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def generate_transactions(
+    n_rows,
+    n_clients=None,
+    months=24,
+    churn_rate=0.05,
+    seasonality=0.2,
+    skew=1.5,
+    start="2020-01-01",
+    seed=0,
+    date_col="date",
+    client_id_col="client_id",
+    amount_col="amount",
+):
+    """
+    Генерирует DataFrame транзакций с колонками даты, client_id и суммы.
+
+    n_rows - количество транзакций
+    n_clients - количество клиентов (по умолчанию n_rows / 10)
+    months - длина истории в месяцах
+    churn_rate - вероятность ухода клиента в каждом месяце
+    seasonality - амплитуда годовой сезонности (0 - без сезонности)
+    skew - параметр распределения Парето для частоты покупок
+           (меньше - сильнее перекос)
+    """
+    rng = np.random.default_rng(seed)
+    n_rows = int(n_rows)
+    n_clients = int(n_clients or max(n_rows // 10, 1))
+
+    # Жизненный цикл клиентов: месяц прихода и месяц ухода
+    first_month = rng.integers(0, months, n_clients)
+    first_month[: n_clients // 5] = 0
+    lifetime = rng.geometric(max(churn_rate, 1e-9), n_clients)
+    last_month = np.minimum(first_month + lifetime - 1, months - 1)
+
+    # Перекос частоты покупок
+    weights = rng.pareto(skew, n_clients) + 1.0
+    weights /= weights.sum()
+
+    # Сезонность: вероятность принять транзакцию в месяце m
+    month_weight = 1.0 + seasonality * np.sin(2 * np.pi * np.arange(months) / 12)
+    accept_prob = month_weight / month_weight.max()
+
+    parts = []
+    remaining = n_rows
+    while remaining > 0:
+        batch = int(remaining / accept_prob.mean() * 1.05) + 1
+        clients = rng.choice(n_clients, size=batch, p=weights)
+        span = last_month[clients] - first_month[clients] + 1
+        month = first_month[clients] + (rng.random(batch) * span).astype(np.int64)
+        keep = rng.random(batch) < accept_prob[month]
+        clients, month = clients[keep][:remaining], month[keep][:remaining]
+        parts.append((clients, month))
+        remaining -= len(clients)
+
+    clients = np.concatenate([p[0] for p in parts])
+    month = np.concatenate([p[1] for p in parts])
+    day = rng.integers(0, 28, len(clients))
+
+    base = np.datetime64(pd.Timestamp(start).to_period("M").start_time.date(), "M")
+    dates = (base + month).astype("datetime64[D]") + day
+
+    return pd.DataFrame(
+        {
+            date_col: dates,
+            client_id_col: clients,
+            amount_col: np.round(rng.lognormal(7, 1, len(clients)), 2),
+        }
+    )
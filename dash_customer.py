@@ -9,68 +9,186 @@ from dash import (
     ctx,
     ALL,
     MATCH,
+    Patch,
     no_update,
 )
-import dash_ag_grid as dag
 
 import base64
 import datetime
 import io
 import os
 
-import pandas as pd
-import numpy as np
-import plotly.graph_objs as go
-
-# Импорты для препроцессинга и расчета метрик
-from app.preprocessing import preprocessing_data
-from app.metrics import calculate_metrics
-from app.auth import validate_session, get_session_username, cleanup_expired_sessions
+# pandas, numpy, plotly и модули расчета метрик импортируются внутри callbacks,
+# чтобы сервер начинал отвечать без их загрузки (см. warmup_imports)
+from app.uploads import register_upload_routes
+from app.auth import SESSION_LIFETIME_HOURS, validate_session, get_session_username
+from app.profiling import stage, profiled, register_metrics_endpoint
 
 external_stylesheets = ["https://codepen.io/chriddyp/pen/bWLwgP.css"]
-
+# Количество последних когорт на графике выживаемости
+SURVIVAL_COHORTS = 12
+# Максимальный горизонт прогноза в периодах: прогноз строится один раз
+# при расчете метрик и хранится в metrics-store вместе с ними
+MAX_FORECAST_PERIODS = 12
+# Цвета наборов данных на графике сравнения
+COMPARE_COLORS = ["#636efa", "#ef553b", "#00cc96", "#ab63fa", "#ffa15a", "#19d3f3"]
+
+# compress=True включает gzip для ответов callbacks, если браузер его поддерживает
 app = Dash(
-    __name__, title="Калькулятор клиентов", external_stylesheets=external_stylesheets
+    __name__,
+    title="Калькулятор клиентов",
+    external_stylesheets=external_stylesheets,
+    compress=True,
 )
 
+# Эндпоинт /metrics с замерами этапов (доступен при PROFILING_ENABLED=true)
+register_metrics_endpoint(app.server)
+# Эндпоинты поблочной загрузки больших файлов
+register_upload_routes(app.server)
+
 
 # Добавляем middleware для проверки авторизации
 @app.server.before_request
 def check_authentication():
     """Проверяет авторизацию перед каждым запросом"""
-    from flask import request, redirect, url_for
+    from flask import g, jsonify, request, redirect
 
-    # Очищаем истекшие сессии
-    cleanup_expired_sessions()
-
-    # Разрешаем доступ к статическим файлам
-    if request.path.startswith("/_dash") or request.path.startswith("/assets"):
+    # Разрешаем доступ к статическим файлам и замерам для Prometheus
+    if (
+        request.path.startswith("/_dash")
+        or request.path.startswith("/assets")
+        or request.path == "/metrics"
+    ):
         return None
 
-    # Получаем токен из cookies или query параметров
-    session_token = request.cookies.get("session_token") or request.args.get("token")
+    # Получаем токен из query параметров (ссылка из Streamlit) или cookies
+    session_token = request.args.get("token") or request.cookies.get("session_token")
 
     # Проверяем валидность токена
     if not validate_session(session_token):
+        # fetch из assets/chunked_upload.js не следует за редиректом на другой домен
+        if request.path.startswith("/upload/"):
+            return jsonify({"error": "Требуется авторизация"}), 401
         # Если токен невалиден, перенаправляем на страницу авторизации
         streamlit_url = os.getenv("STREAMLIT_URL", "http://localhost:8501")
         return redirect(streamlit_url)
 
+    # Токен из ссылки сохраняется в cookie: поблочная загрузка
+    # и последующие запросы передают только cookies
+    if session_token != request.cookies.get("session_token"):
+        g.session_token = session_token
     return None
 
 
+@app.server.after_request
+def set_session_cookie(response):
+    """Устанавливает cookie с токеном, переданным в ссылке"""
+    from flask import g, request
+
+    session_token = g.pop("session_token", None)
+    if session_token:
+        response.set_cookie(
+            "session_token",
+            session_token,
+            max_age=SESSION_LIFETIME_HOURS * 3600,
+            httponly=True,
+            samesite="Lax",
+            secure=request.is_secure,
+        )
+    return response
+
+
 # Функция для получения информации о пользователе
 def get_user_info():
     """Получает информацию о текущем пользователе"""
     from flask import request
 
-    session_token = request.cookies.get("session_token") or request.args.get("token")
+    session_token = request.args.get("token") or request.cookies.get("session_token")
     if session_token and validate_session(session_token):
         username = get_session_username(session_token)
         return username
     return None
 
 
+def render_compare_block():
+    """Блок сравнения: выбор наборов данных, гранулярности и общий график"""
+    from app.periods import DEFAULT_FREQ, GRANULARITY_LABELS
+
+    label_style = {"marginRight": "10px", "fontWeight": "bold"}
+    return html.Div(
+        [
+            html.H4("Сравнение наборов данных"),
+            html.Div(
+                [
+                    html.Label("Наборы данных:", style=label_style),
+                    dcc.Dropdown(
+                        id="compare-datasets",
+                        options=[],
+                        value=[],
+                        multi=True,
+                        style={"minWidth": "400px"},
+                    ),
+                ],
+                style={"display": "flex", "alignItems": "center", "marginBottom": "10px"},
+            ),
+            html.Div(
+                [
+                    html.Label("Гранулярность:", style=label_style),
+                    dcc.RadioItems(
+                        id="compare-granularity",
+                        options=[
+                            {"label": label, "value": freq}
+                            for freq, label in GRANULARITY_LABELS.items()
+                        ],
+                        value=DEFAULT_FREQ,
+                        inline=True,
+                        style={"marginRight": "20px"},
+                    ),
+                    html.Label("Ось времени:", style=label_style),
+                    dcc.RadioItems(
+                        id="compare-align",
+                        options=[
+                            {"label": "Даты", "value": "date"},
+                            {"label": "Периоды от начала данных", "value": "start"},
+                        ],
+                        value="date",
+                        inline=True,
+                        style={"marginRight": "20px"},
+                    ),
+                    html.Label("Прогноз (периодов):", style=label_style),
+                    dcc.Input(
+                        id="compare-forecast",
+                        type="number",
+                        min=0,
+                        max=MAX_FORECAST_PERIODS,
+                        value=MAX_FORECAST_PERIODS,
+                        style={"width": "100px", "padding": "5px"},
+                    ),
+                ],
+                style={"display": "flex", "alignItems": "center", "flexWrap": "wrap"},
+            ),
+            html.Button(
+                "Сравнить",
+                id="compare-btn",
+                n_clicks=0,
+                style={
+                    "marginTop": "10px",
+                    "padding": "10px 20px",
+                    "fontSize": "16px",
+                    "cursor": "pointer",
+                },
+            ),
+            dcc.Loading(
+                id="loading-compare",
+                type="circle",
+                children=html.Div(id="compare-output", style={"marginTop": "10px"}),
+            ),
+        ],
+        id="compare-block",
+        style={"display": "none", "margin": "20px"},
+    )
+
+
 app.layout = html.Div(
     [
         html.Div(
@@ -125,6 +243,50 @@ app.layout = html.Div(
             # Allow multiple files to be uploaded
             multiple=True,
         ),
+        # Поблочная загрузка больших файлов (см. assets/chunked_upload.js)
+        html.Div(
+            [
+                html.Label(
+                    "Большие файлы (CSV, CSV.GZ, CSV.ZST, Parquet):",
+                    style={"marginRight": "10px", "fontWeight": "bold"},
+                ),
+                html.Button(
+                    "Выбрать файл",
+                    id="chunked-upload-button",
+                    n_clicks=0,
+                    style={"cursor": "pointer"},
+                ),
+                html.Div(
+                    id="chunked-upload-status",
+                    style={"marginTop": "5px", "color": "#666"},
+                ),
+            ],
+            style={"margin": "10px"},
+        ),
+        # Store для результата поблочной загрузки (метаданные набора данных)
+        dcc.Store(id="chunked-upload-result"),
+        # Загрузка сохраненных результатов расчета без исходных транзакций
+        dcc.Upload(
+            id="upload-bundle",
+            children=html.Div(
+                [
+                    "Загрузить сохраненные результаты (",
+                    html.A(".metrics.npz"),
+                    ")",
+                ]
+            ),
+            style={
+                "width": "100%",
+                "lineHeight": "40px",
+                "borderWidth": "1px",
+                "borderStyle": "dashed",
+                "borderRadius": "5px",
+                "textAlign": "center",
+                "margin": "10px",
+                "boxSizing": "border-box",
+            },
+        ),
+        html.Div(id="upload-bundle-status", style={"margin": "0 10px", "color": "#666"}),
         # Индикатор загрузки для загрузки файлов
         dcc.Loading(
             id="loading-upload",
@@ -136,31 +298,39 @@ app.layout = html.Div(
         dcc.Store(id="uploaded-data-store"),
         # Блок для вывода результатов метрик
         html.Div(id="metrics-output", style={"margin": "20px", "padding": "10px"}),
+        # Сравнение обработанных наборов данных (показывается, когда их два и больше)
+        render_compare_block(),
     ]
 )
 
 
-def parse_contents(contents, filename, date):
-    content_type, content_string = contents.split(",")
+def warmup_imports():
+    """Загружает тяжелые модули заранее, чтобы первый callback не ждал импорта"""
+    import dash_ag_grid  # noqa: F401
+    import plotly.graph_objs  # noqa: F401
+    import plotly.subplots  # noqa: F401
 
-    decoded = base64.b64decode(content_string)
-    try:
-        if "csv" in filename:
-            # Assume that the user uploaded a CSV file
-            df = pd.read_csv(io.StringIO(decoded.decode("utf-8")))
-        elif "xls" in filename:
-            # Assume that the user uploaded an excel file
-            df = pd.read_excel(io.BytesIO(decoded))
-    except Exception as e:
-        print(e)
-        return html.Div(["There was an error processing this file."])
+    import app.batch  # noqa: F401
+    import app.bundle  # noqa: F401
+    import app.forecast  # noqa: F401
+    import app.metrics  # noqa: F401
+    import app.preprocessing  # noqa: F401
+    import app.transport  # noqa: F401
+
+
+def render_file_block(df, filename, date):
+    """Блок файла: предпросмотр данных, выбор колонок и кнопки обработки"""
+    import dash_ag_grid as dag
+
+    from app.datasets import PREVIEW_ROWS
 
     return html.Div(
         [
             html.H5(filename),
             html.H6(datetime.datetime.fromtimestamp(date)),
+            # Для предпросмотра передаем только первые строки
             dag.AgGrid(
-                rowData=df.to_dict("records"),
+                rowData=df.head(PREVIEW_ROWS).to_dict("records"),
                 columnDefs=[{"field": i} for i in df.columns],
             ),
             html.Br(),
@@ -196,6 +366,21 @@ def parse_contents(contents, filename, date):
                             "padding": "5px",
                         },
                     ),
+                    html.Label(
+                        "Колонка с суммой (для NRR/GRR, необязательно):",
+                        style={"marginRight": "10px", "fontWeight": "bold"},
+                    ),
+                    dcc.Input(
+                        id={"type": "amount-col-input", "index": filename},
+                        type="text",
+                        placeholder="amount",
+                        value="",
+                        style={
+                            "width": "200px",
+                            "marginRight": "20px",
+                            "padding": "5px",
+                        },
+                    ),
                 ],
                 style={
                     "marginTop": "10px",
@@ -229,131 +414,189 @@ def parse_contents(contents, filename, date):
                     style={"marginTop": "10px"},
                 ),
             ),
-            # Store для хранения метрик для этого файла
-            dcc.Store(id={"type": "metrics-store", "index": filename}),
-            html.Br(),
-            # Блок с кнопкой и полем выбора периода (изначально скрыт)
-            html.Div(
-                [
-                    html.Div(
-                        [
-                            html.Label(
-                                "Период экстраполяции (месяцев):",
-                                style={"marginRight": "10px", "fontWeight": "bold"},
-                            ),
-                            dcc.Input(
-                                id={"type": "extrapolation-months", "index": filename},
-                                type="number",
-                                min=1,
-                                max=12,
-                                value=12,
-                                style={
-                                    "width": "100px",
-                                    "marginRight": "20px",
-                                    "padding": "5px",
-                                },
-                            ),
-                        ],
-                        style={
-                            "marginTop": "10px",
-                            "marginBottom": "10px",
-                            "display": "flex",
-                            "alignItems": "center",
-                        },
-                    ),
-                    html.Button(
-                        "Создать графики метрик и прогноза",
-                        id={"type": "plot-btn", "index": filename},
-                        n_clicks=0,
-                        style={
-                            "marginTop": "10px",
-                            "padding": "10px 20px",
-                            "fontSize": "16px",
-                            "cursor": "pointer",
-                            "textAlign": "center",
-                            "display": "flex",
-                            "alignItems": "center",
-                            "justifyContent": "center",
-                        },
-                    ),
-                ],
-                id={"type": "plots-controls", "index": filename},
-                style={"display": "none"},  # Изначально скрыт
-            ),
-            # Индикатор загрузки для графиков
-            dcc.Loading(
-                id={"type": "loading-plots", "index": filename},
-                type="circle",
-                children=html.Div(
-                    id={"type": "plots-output", "index": filename},
-                    style={"marginTop": "10px"},
-                ),
-            ),
+            *render_results(filename),
         ]
     )
 
 
+def render_results(filename, metrics_data=None):
+    """
+    Хранилище метрик файла, кнопки графиков и экспорта результатов.
+
+    metrics_data - метрики, загруженные из файла результатов (без пересчета).
+    """
+    from app.periods import DEFAULT_FREQ, GRANULARITY_LABELS
+
+    return [
+        # Store для хранения метрик для этого файла
+        dcc.Store(id={"type": "metrics-store", "index": filename}, data=metrics_data),
+        html.Br(),
+        # Блок с кнопкой и полем выбора периода (изначально скрыт)
+        html.Div(
+            [
+                html.Div(
+                    [
+                        html.Label(
+                            "Гранулярность:",
+                            style={"marginRight": "10px", "fontWeight": "bold"},
+                        ),
+                        dcc.RadioItems(
+                            id={"type": "granularity", "index": filename},
+                            options=[
+                                {"label": label, "value": freq}
+                                for freq, label in GRANULARITY_LABELS.items()
+                            ],
+                            value=DEFAULT_FREQ,
+                            inline=True,
+                            style={"marginRight": "20px"},
+                        ),
+                        html.Label(
+                            "Период экстраполяции (периодов):",
+                            style={"marginRight": "10px", "fontWeight": "bold"},
+                        ),
+                        dcc.Input(
+                            id={"type": "extrapolation-months", "index": filename},
+                            type="number",
+                            min=1,
+                            max=12,
+                            value=12,
+                            style={
+                                "width": "100px",
+                                "marginRight": "20px",
+                                "padding": "5px",
+                            },
+                        ),
+                    ],
+                    style={
+                        "marginTop": "10px",
+                        "marginBottom": "10px",
+                        "display": "flex",
+                        "alignItems": "center",
+                    },
+                ),
+                html.Div(
+                    [
+                        html.Button(
+                            "Создать графики метрик и прогноза",
+                            id={"type": "plot-btn", "index": filename},
+                            n_clicks=0,
+                            style={
+                                "padding": "10px 20px",
+                                "fontSize": "16px",
+                                "cursor": "pointer",
+                                "marginRight": "10px",
+                            },
+                        ),
+                        # Метрики, прогнозы и индекс клиентов одним файлом
+                        html.Button(
+                            "Скачать результаты",
+                            id={"type": "export-btn", "index": filename},
+                            n_clicks=0,
+                            style={
+                                "padding": "10px 20px",
+                                "fontSize": "16px",
+                                "cursor": "pointer",
+                            },
+                        ),
+                        dcc.Download(id={"type": "export-download", "index": filename}),
+                    ],
+                    style={"marginTop": "10px", "display": "flex", "alignItems": "center"},
+                ),
+            ],
+            id={"type": "plots-controls", "index": filename},
+            style={"display": "none"},  # Изначально скрыт
+        ),
+        # Индикатор загрузки для графиков
+        dcc.Loading(
+            id={"type": "loading-plots", "index": filename},
+            type="circle",
+            children=html.Div(
+                id={"type": "plots-output", "index": filename},
+                style={"marginTop": "10px"},
+            ),
+        ),
+    ]
+
+
 @callback(
     Output("output-data-upload", "children"),
     Output("uploaded-data-store", "data"),
     Input("upload-data", "contents"),
     State("upload-data", "filename"),
     State("upload-data", "last_modified"),
+    State("uploaded-data-store", "data"),
 )
-def update_output(list_of_contents, list_of_names, list_of_dates):
+def update_output(list_of_contents, list_of_names, list_of_dates, previous_data):
+    import pandas as pd
+
+    from app.datasets import delete_dataset, is_valid_id
+    from app.transport import encode_frame
+
     if list_of_contents is not None:
+        # Новые файлы заменяют открытые блоки, наборы данных, загруженные
+        # поблочно, больше не нужны
+        for stored in (previous_data or {}).values():
+            if isinstance(stored, dict) and is_valid_id(stored.get("dataset_id")):
+                delete_dataset(stored["dataset_id"])
+
         children = []
         all_data = {}
         for c, n, d in zip(list_of_contents, list_of_names, list_of_dates):
             content_type, content_string = c.split(",")
-            decoded = base64.b64decode(content_string)
+            with stage("base64_decode") as rec:
+                decoded = base64.b64decode(content_string)
+                rec["bytes"] = len(decoded)
             try:
-                if "csv" in n:
-                    df = pd.read_csv(io.StringIO(decoded.decode("utf-8")))
-                elif "xls" in n:
-                    df = pd.read_excel(io.BytesIO(decoded))
-                else:
-                    continue
-                # Сохраняем данные в store
-                all_data[n] = df.to_dict("records")
+                with stage("read_file") as rec:
+                    if "csv" in n:
+                        df = pd.read_csv(io.StringIO(decoded.decode("utf-8")))
+                    elif "xls" in n:
+                        df = pd.read_excel(io.BytesIO(decoded))
+                    else:
+                        continue
+                    rec["rows"] = len(df)
+                # Сохраняем данные в store в колоночном формате
+                with stage("encode_frame", rows=len(df)):
+                    all_data[n] = encode_frame(df)
             except Exception:
                 continue
-            children.append(parse_contents(c, n, d))
+            children.append(render_file_block(df, n, d))
         return children, all_data
     return None, None
 
 
-def extrapolate_series(ts, months_forward=12, degree=1):
-    """Экстраполяция временного ряда с помощью полиномиальной аппроксимации"""
-    if len(ts) < 3:
-        return None
-
-    # Убеждаемся, что индекс это DatetimeIndex
-    if not isinstance(ts.index, pd.DatetimeIndex):
-        # Если это не DatetimeIndex, пытаемся преобразовать
-        if hasattr(ts.index, "to_timestamp"):
-            ts_index = ts.index.to_timestamp()
-        else:
-            ts_index = pd.to_datetime(ts.index)
-        ts = pd.Series(ts.values, index=ts_index)
+@callback(
+    Output("output-data-upload", "children", allow_duplicate=True),
+    Output("uploaded-data-store", "data", allow_duplicate=True),
+    Input("chunked-upload-result", "data"),
+    prevent_initial_call=True,
+)
+def add_chunked_dataset(dataset):
+    """Добавляет блок для набора данных, загруженного поблочно"""
+    from app.datasets import read_preview
 
-    x = np.arange(len(ts))
-    y = ts.values
-    coeffs = np.polyfit(x, y, degree)
-    poly = np.poly1d(coeffs)
-    x_future = np.arange(len(ts) + months_forward)
-    y_future = poly(x_future)
+    if not dataset or "dataset_id" not in dataset:
+        return no_update, no_update
 
-    # Создаем DatetimeIndex для прогноза
-    start_date = ts.index[0]
-    if isinstance(start_date, pd.Timestamp):
-        idx = pd.date_range(start_date, periods=len(x_future), freq="MS")
-    else:
-        # Если это не Timestamp, преобразуем
-        start_date = pd.to_datetime(start_date)
-        idx = pd.date_range(start_date, periods=len(x_future), freq="MS")
+    filename = dataset["filename"]
+    try:
+        df_preview = read_preview(dataset["dataset_id"])
+    except Exception as e:
+        return (
+            html.Div(f"Ошибка при чтении файла {filename}: {e}", style={"color": "red"}),
+            no_update,
+        )
 
-    return pd.Series(y_future, index=idx)
+    children = Patch()
+    children.append(
+        render_file_block(
+            df_preview, filename, dataset.get("last_modified") or 0
+        )
+    )
+    # В store передается только идентификатор набора данных
+    stored = Patch()
+    stored[filename] = {"dataset_id": dataset["dataset_id"]}
+    return children, stored
 
 
 @callback(
@@ -364,9 +607,20 @@ def extrapolate_series(ts, months_forward=12, degree=1):
     State({"type": "process-btn", "index": MATCH}, "id"),
     State({"type": "date-col-input", "index": MATCH}, "value"),
     State({"type": "client-id-col-input", "index": MATCH}, "value"),
+    State({"type": "amount-col-input", "index": MATCH}, "value"),
     prevent_initial_call=True,
 )
-def process_data(n_clicks, stored_data, button_id, date_col, client_id_col):
+def process_data(n_clicks, stored_data, button_id, date_col, client_id_col, amount_col):
+    from app.batch import ALL_SEGMENTS, SET_COLUMNS, forecast_metrics, read_input_partials
+    from app.bundle import store_bundle
+    from app.datasets import dataset_path, load_meta
+    from app.metrics import calculate_metrics
+    from app.partials import PartialAggregate
+    from app.survival import aggregate_survival_tables
+    from app.periods import DEFAULT_FREQ, GRANULARITY_LABELS
+    from app.spill import MEMORY_BUDGET, SPILL_DIR, parse_size, spill_directory
+    from app.transport import decode_frame
+
     if n_clicks is None or n_clicks == 0:
         return "", no_update
 
@@ -386,67 +640,105 @@ def process_data(n_clicks, stored_data, button_id, date_col, client_id_col):
         )
 
     try:
-        # Восстанавливаем DataFrame из словаря
-        df = pd.DataFrame(stored_data[filename])
+        stored = stored_data[filename]
+        # Набор данных, загруженный поблочно, хранится на сервере
+        dataset_id = stored.get("dataset_id") if isinstance(stored, dict) else None
+        if dataset_id:
+            columns = load_meta(dataset_id)["columns"]
+        else:
+            # Восстанавливаем DataFrame из словаря
+            with stage("restore_dataframe") as rec:
+                df = decode_frame(stored)
+                rec["rows"] = len(df)
+            columns = list(df.columns)
 
         # Проверяем, что указанные колонки существуют
         date_col = date_col.strip() if date_col else "date"
         client_id_col = client_id_col.strip() if client_id_col else "client_id"
+        amount_col = amount_col.strip() if amount_col else None
 
-        if date_col not in df.columns:
-            return html.Div(
-                f"Ошибка: колонка '{date_col}' не найдена в данных. Доступные колонки: {', '.join(df.columns)}",
-                style={"color": "red", "marginTop": "10px"},
-            )
-
-        if client_id_col not in df.columns:
-            return html.Div(
-                f"Ошибка: колонка '{client_id_col}' не найдена в данных. Доступные колонки: {', '.join(df.columns)}",
-                style={"color": "red", "marginTop": "10px"},
-            )
-
-        # Препроцессинг и расчет метрик с указанными названиями колонок
-        df_preprocessed = preprocessing_data(
-            df, date_col=date_col, client_id_col=client_id_col
-        )
-        df_metrics = calculate_metrics(df_preprocessed)
+        for col in filter(None, (date_col, client_id_col, amount_col)):
+            if col not in columns:
+                return (
+                    html.Div(
+                        f"Ошибка: колонка '{col}' не найдена в данных. Доступные колонки: {', '.join(map(str, columns))}",
+                        style={"color": "red", "marginTop": "10px"},
+                    ),
+                    no_update,
+                )
 
-        items = [
-            html.Div(f'Средний месячный отток: {df_metrics["churn_month"].mean():.2%}'),
-            html.Div(f'Примерный годовой отток: {df_metrics["churn_year"].mean():.2%}'),
-            html.Div(f'Выживаемость за год: {df_metrics["retention_year"].mean():.2%}'),
-            html.Div(
-                f'Выживаемость за весь период: {df_metrics["retention_period"].mean():.2%}'
-            ),
-            html.Div(
-                f'Новые клиенты за период: {df_metrics["new_clients_period"].mean():.2%}'
-            ),
-            html.Div(
-                f'Средний месячный прирост: {df_metrics[df_metrics["growth_rate_month"] < np.inf]["growth_rate_month"].mean():.2%}'
-            ),
-            html.Div(
-                f'Примерный годовой прирост: {df_metrics[df_metrics["growth_rate_year"] < np.inf]["growth_rate_year"].mean():.2%}'
-            ),
-        ]
+        # С MEMORY_BUDGET агрегаты больших наборов данных сбрасываются на диск
+        # (app/spill.py), временные файлы удаляются после расчета
+        memory_budget = parse_size(MEMORY_BUDGET)
+        with spill_directory(memory_budget, SPILL_DIR) as spill_dir:
+            # Один раз строим агрегат по дням, недели, месяцы и кварталы
+            # собираются из него объединением множеств клиентов
+            if dataset_id:
+                # Потоково читаем только нужные колонки
+                daily = read_input_partials(
+                    str(dataset_path(dataset_id)),
+                    date_col=date_col,
+                    client_id_col=client_id_col,
+                    freq="D",
+                    amount_col=amount_col,
+                    memory_budget=memory_budget,
+                    spill_dir=spill_dir,
+                )[ALL_SEGMENTS]
+            else:
+                daily = PartialAggregate.from_frame(
+                    df, date_col, client_id_col, freq="D", amount_col=amount_col
+                )
 
-        # Сохраняем метрики в Store для использования в графиках
-        # Преобразуем Period в строку для сериализации
-        df_metrics_clean = df_metrics.copy()
-        if "year_month" in df_metrics_clean.columns:
-            df_metrics_clean["year_month"] = df_metrics_clean["year_month"].astype(str)
-        # Преобразуем множества в списки
-        for col in ["clients", "clients_prev", "clients_prev_year"]:
-            if col in df_metrics_clean.columns:
-                df_metrics_clean[col] = df_metrics_clean[col].apply(
-                    lambda x: list(x) if isinstance(x, set) else []
+            # Гранулярности считаются по отдельности: в короткой истории может не быть
+            # ни одного завершенного квартала или месяца, такие гранулярности пропускаются
+            metrics_by_freq = {}
+            for freq in GRANULARITY_LABELS:
+                aggregate = daily.rollup(freq)
+                metrics = calculate_metrics(aggregate.to_grouped())
+                if len(metrics):
+                    metrics_by_freq[freq] = metrics
+                if freq == DEFAULT_FREQ:
+                    # Кривые выживаемости по месячным когортам
+                    survival_curves, lifetimes = aggregate_survival_tables(
+                        aggregate, memory_budget
+                    )
+            if not metrics_by_freq:
+                return (
+                    html.Div(
+                        "Ошибка: в данных нет ни одного завершенного периода",
+                        style={"color": "red", "marginTop": "10px"},
+                    ),
+                    no_update,
                 )
+            # Прогноз на максимальный горизонт: полином не зависит от горизонта,
+            # поэтому графики и сравнение берут из него первые N периодов
+            forecast_by_freq = {
+                freq: forecast_metrics(metrics, MAX_FORECAST_PERIODS, freq=freq)
+                for freq, metrics in metrics_by_freq.items()
+            }
+
+            # Множества клиентов в браузер и в бандл не передаются
+            tables = {
+                **{
+                    f"metrics/{freq}": metrics.drop(columns=SET_COLUMNS, errors="ignore")
+                    for freq, metrics in metrics_by_freq.items()
+                },
+                **{f"forecast/{freq}": forecast for freq, forecast in forecast_by_freq.items()},
+                "survival": survival_curves,
+                "lifetime": lifetimes,
+            }
+            # Результаты вместе с агрегатом по дням сохраняются одним файлом,
+            # его можно скачать и загрузить позже без исходных транзакций
+            # Агрегат на диске хранит хеши client_id, в бандл он не сохраняется
+            partials = {ALL_SEGMENTS: daily} if isinstance(daily, PartialAggregate) else None
+            with stage("save_bundle", rows=daily.rows if partials else None):
+                bundle_id = store_bundle(tables, partials, filename=filename)
 
-        metrics_data = {
-            filename: df_metrics_clean.to_dict("records"),
-            f"{filename}_year_month": df_metrics["year_month"].astype(str).tolist(),
-        }
+        # Сохраняем метрики в Store для использования в графиках
+        with stage("serialize_metrics", rows=sum(map(len, metrics_by_freq.values()))):
+            metrics_data = {filename: metrics_entry(tables, bundle_id)}
 
-        return html.Div(items), metrics_data
+        return metrics_summary(tables), metrics_data
     except Exception as e:
         return (
             html.Div(
@@ -457,6 +749,176 @@ def process_data(n_clicks, stored_data, button_id, date_col, client_id_col):
         )
 
 
+def metrics_entry(tables, bundle_id=None):
+    """
+    Запись metrics-store для одного файла по таблицам результатов
+    ("metrics/<freq>", "forecast/<freq>", "survival", "lifetime").
+
+    Метрики и прогноз всех гранулярностей передаются сразу, чтобы
+    переключение не требовало пересчета.
+    """
+    from app.transport import encode_frame
+
+    entry = {"metrics": {}, "forecast": {}}
+    for name, df in tables.items():
+        kind, _, freq = name.partition("/")
+        if freq:
+            entry[kind][freq] = encode_frame(df)
+        else:
+            entry[kind] = encode_frame(df)
+    entry["bundle_id"] = bundle_id
+    return entry
+
+
+def metrics_summary(tables):
+    """Сводка по месячным метрикам и времени жизни клиентов"""
+    import numpy as np
+
+    from app.periods import DEFAULT_FREQ
+    from app.survival import ALL_COHORTS
+
+    if f"metrics/{DEFAULT_FREQ}" not in tables:
+        return html.Div(
+            "В данных нет ни одного завершенного месяца, сводка недоступна. "
+            "Графики доступны для более мелкой гранулярности."
+        )
+    df_metrics = tables[f"metrics/{DEFAULT_FREQ}"]
+    lifetimes = tables["lifetime"]
+    lifetime_all = lifetimes[lifetimes["cohort"] == ALL_COHORTS]
+
+    items = [
+        html.Div(f'Средний месячный отток: {df_metrics["churn_month"].mean():.2%}'),
+        html.Div(f'Примерный годовой отток: {df_metrics["churn_year"].mean():.2%}'),
+        html.Div(f'Выживаемость за год: {df_metrics["retention_year"].mean():.2%}'),
+        html.Div(
+            f'Выживаемость за весь период: {df_metrics["retention_period"].mean():.2%}'
+        ),
+        html.Div(
+            f'Новые клиенты за период: {df_metrics["new_clients_period"].mean():.2%}'
+        ),
+        html.Div(
+            f'Средний месячный прирост: {df_metrics[df_metrics["growth_rate_month"] < np.inf]["growth_rate_month"].mean():.2%}'
+        ),
+        html.Div(
+            f'Примерный годовой прирост: {df_metrics[df_metrics["growth_rate_year"] < np.inf]["growth_rate_year"].mean():.2%}'
+        ),
+        html.Div(
+            f'Средняя продолжительность жизни клиента (Kaplan-Meier): {lifetime_all["mean_lifetime"].iloc[0]:.1f} мес.'
+        ),
+    ]
+    # Колонки выручки есть, если при расчете была указана колонка с суммой
+    if "nrr_month" in df_metrics.columns:
+        revenue = df_metrics.replace([np.inf, -np.inf], np.nan)
+        items += [
+            html.Div(f'Средний месячный NRR: {revenue["nrr_month"].mean():.2%}'),
+            html.Div(f'Средний месячный GRR: {revenue["grr_month"].mean():.2%}'),
+            html.Div(f'Годовой NRR: {revenue["nrr_year"].mean():.2%}'),
+            html.Div(
+                f'Расширение / сокращение за месяц: {revenue["expansion_month"].mean():.2%} / {revenue["contraction_month"].mean():.2%}'
+            ),
+        ]
+    return html.Div(items)
+
+
+def cached_forecast(entry, freq, periods):
+    """
+    Первые periods периодов прогноза оттока и притока из metrics-store
+    (индекс - даты начала периодов)
+    """
+    import pandas as pd
+
+    from app.transport import decode_frame
+
+    forecast = decode_frame(entry["forecast"][freq]).head(periods)
+    forecast.index = pd.PeriodIndex(forecast["year_month"], freq=freq).to_timestamp()
+    return forecast
+
+
+@callback(
+    Output({"type": "export-download", "index": MATCH}, "data"),
+    Input({"type": "export-btn", "index": MATCH}, "n_clicks"),
+    State({"type": "metrics-store", "index": MATCH}, "data"),
+    State({"type": "export-btn", "index": MATCH}, "id"),
+    prevent_initial_call=True,
+)
+def export_results(n_clicks, metrics_data, button_id):
+    """Отдает файл с результатами расчета, сохраненный в process_data"""
+    from pathlib import Path
+
+    from app.bundle import BUNDLE_SUFFIX, bundle_path
+
+    filename = button_id.get("index") if isinstance(button_id, dict) else None
+    if not n_clicks or not metrics_data or filename not in metrics_data:
+        return no_update
+
+    bundle_id = metrics_data[filename].get("bundle_id")
+    if not bundle_id or not bundle_path(bundle_id).exists():
+        return no_update
+    return dcc.send_file(
+        str(bundle_path(bundle_id)), filename=f"{Path(filename).stem}{BUNDLE_SUFFIX}"
+    )
+
+
+@callback(
+    Output("output-data-upload", "children", allow_duplicate=True),
+    Output("upload-bundle-status", "children"),
+    Input("upload-bundle", "contents"),
+    State("upload-bundle", "filename"),
+    State({"type": "metrics-store", "index": ALL}, "id"),
+    prevent_initial_call=True,
+)
+def import_results(contents, upload_name, store_ids):
+    """
+    Добавляет блок с результатами из файла .metrics.npz: метрики, прогнозы
+    и кривые выживаемости читаются готовыми, транзакции не нужны
+    """
+    from app.bundle import BUNDLE_SUFFIX, load_bundle, store_bundle_bytes
+
+    if not contents:
+        return no_update, no_update
+
+    try:
+        with stage("base64_decode") as rec:
+            decoded = base64.b64decode(contents.split(",", 1)[1])
+            rec["bytes"] = len(decoded)
+        with stage("load_bundle"):
+            bundle = load_bundle(io.BytesIO(decoded))
+    except Exception as e:
+        return no_update, html.Div(
+            f"Ошибка при чтении файла {upload_name}: {e}", style={"color": "red"}
+        )
+
+    # Копия файла сохраняется на сервере, чтобы результаты можно было снова скачать
+    bundle_id = store_bundle_bytes(decoded)
+
+    # Имя блока должно отличаться от уже открытых файлов
+    name = bundle["filename"] or upload_name.removesuffix(BUNDLE_SUFFIX)
+    existing = {store_id["index"] for store_id in store_ids}
+    unique_name, copy = name, 1
+    while unique_name in existing:
+        copy += 1
+        unique_name = f"{name} ({copy})"
+
+    tables = bundle["tables"]
+    children = Patch()
+    children.append(
+        html.Div(
+            [
+                html.H5(unique_name),
+                html.H6(
+                    f"Результаты расчета от {bundle['created_at'][:19].replace('T', ' ')}"
+                    f" загружены из файла {upload_name}"
+                ),
+                metrics_summary(tables),
+                *render_results(
+                    unique_name, {unique_name: metrics_entry(tables, bundle_id)}
+                ),
+            ]
+        )
+    )
+    return children, ""
+
+
 @callback(
     Output({"type": "plots-controls", "index": MATCH}, "style"),
     Input({"type": "metrics-store", "index": MATCH}, "data"),
@@ -476,12 +938,22 @@ def show_plots_controls(metrics_data):
 @callback(
     Output({"type": "plots-output", "index": MATCH}, "children"),
     Input({"type": "plot-btn", "index": MATCH}, "n_clicks"),
+    Input({"type": "granularity", "index": MATCH}, "value"),
     State({"type": "metrics-store", "index": MATCH}, "data"),
     State({"type": "plot-btn", "index": MATCH}, "id"),
     State({"type": "extrapolation-months", "index": MATCH}, "value"),
     prevent_initial_call=True,
 )
-def create_plots(n_clicks, metrics_data, button_id, months_forward):
+@profiled("build_figures")
+def create_plots(n_clicks, freq, metrics_data, button_id, months_forward):
+    import numpy as np
+    import pandas as pd
+    import plotly.graph_objs as go
+
+    from app.periods import DEFAULT_FREQ, GRANULARITY_LABELS, GRANULARITY_UNITS
+    from app.survival import ALL_COHORTS
+    from app.transport import decode_frame
+
     if n_clicks is None or n_clicks == 0:
         return ""
 
@@ -492,51 +964,37 @@ def create_plots(n_clicks, metrics_data, button_id, months_forward):
         )
 
     try:
-        # metrics_data теперь содержит данные напрямую для этого файла
-        # Структура: {filename: records, f"{filename}_year_month": periods}
+        # metrics_data содержит метрики этого файла: {filename: {"metrics": {freq: ...},
+        # "forecast": {freq: ...}, "survival": ..., "lifetime": ...}}
         filename = button_id.get("index") if isinstance(button_id, dict) else None
 
-        if not filename or not isinstance(metrics_data, dict):
+        if (
+            not filename
+            or not isinstance(metrics_data, dict)
+            or filename not in metrics_data
+        ):
             return html.Div(
                 "Ошибка: метрики для этого файла не найдены", style={"color": "red"}
             )
 
-        # Восстанавливаем DataFrame из словаря
-        if filename in metrics_data:
-            df_metrics = pd.DataFrame(metrics_data[filename])
-        else:
+        # Восстанавливаем DataFrame, year_month восстанавливается как Period
+        freq = freq or DEFAULT_FREQ
+        unit = GRANULARITY_UNITS[freq]
+        if freq not in metrics_data[filename]["metrics"]:
             return html.Div(
-                "Ошибка: метрики для этого файла не найдены", style={"color": "red"}
+                "Недостаточно данных: нет ни одного завершенного периода "
+                f"(гранулярность «{GRANULARITY_LABELS[freq].lower()}»)",
+                style={"color": "red"},
             )
-
-        # Восстанавливаем year_month из Period строк
-        year_month_key = f"{filename}_year_month"
-        if year_month_key in metrics_data:
-            df_metrics["year_month"] = pd.PeriodIndex(
-                metrics_data[year_month_key], freq="M"
+        df_metrics = decode_frame(metrics_data[filename]["metrics"][freq])
+        if "year_month" not in df_metrics.columns:
+            return html.Div(
+                "Ошибка: не найдена колонка year_month в метриках",
+                style={"color": "red"},
             )
-        else:
-            # Если нет, пытаемся восстановить из строк
-            if "year_month" in df_metrics.columns:
-                df_metrics["year_month"] = pd.PeriodIndex(
-                    df_metrics["year_month"].astype(str), freq="M"
-                )
-            else:
-                return html.Div(
-                    "Ошибка: не найдена колонка year_month в метриках",
-                    style={"color": "red"},
-                )
 
         # Преобразуем Period в дату для графиков
-        # Убеждаемся, что dates это DatetimeIndex
-        if isinstance(df_metrics["year_month"].iloc[0], pd.Period):
-            dates = df_metrics["year_month"].dt.to_timestamp()
-        else:
-            dates = pd.to_datetime(df_metrics["year_month"].astype(str))
-
-        # Преобразуем в DatetimeIndex, если это еще не индекс
-        if not isinstance(dates, pd.DatetimeIndex):
-            dates = pd.DatetimeIndex(dates)
+        dates = pd.DatetimeIndex(df_metrics["year_month"].dt.to_timestamp())
 
         # Получаем данные для графиков
         churn_month = df_metrics["churn_month"].fillna(0)
@@ -545,20 +1003,16 @@ def create_plots(n_clicks, metrics_data, button_id, months_forward):
         )
 
         # Устанавливаем период экстраполяции
-        months_forward = int(months_forward) if months_forward else 12
-        months_forward = max(1, min(12, months_forward))  # Ограничиваем от 1 до 12
+        months_forward = int(months_forward) if months_forward else MAX_FORECAST_PERIODS
+        # Ограничиваем от 1 до MAX_FORECAST_PERIODS
+        months_forward = max(1, min(MAX_FORECAST_PERIODS, months_forward))
 
-        # Создаем временные ряды для экстраполяции с DatetimeIndex
+        # Создаем временные ряды с DatetimeIndex
         churn_ts = pd.Series(churn_month.values, index=dates)
         growth_ts = pd.Series(growth_rate_month.values, index=dates)
 
-        # Экстраполяция
-        churn_ext = extrapolate_series(
-            churn_ts, months_forward=months_forward, degree=1
-        )
-        growth_ext = extrapolate_series(
-            growth_ts, months_forward=months_forward, degree=1
-        )
+        # Экстраполяция построена при расчете метрик, берем первые периоды
+        forecast = cached_forecast(metrics_data[filename], freq, months_forward)
 
         # Линии тренда для фактических данных
         # Линейная регрессия для тренда
@@ -636,25 +1090,20 @@ def create_plots(n_clicks, metrics_data, button_id, months_forward):
                 line=dict(color="red", width=2),
             )
         )
-        if churn_ext is not None:
-            # Разделяем фактические и прогнозные данные
-            # Прогнозные данные начинаются после последней фактической даты
-            last_actual_idx = len(dates)
-            forecast_dates = churn_ext.index[last_actual_idx:]
-            forecast_values = churn_ext.values[last_actual_idx:]
-            # Добавляем последнюю фактическую точку для плавного перехода
-            if len(forecast_dates) > 0:
-                fig_churn_forecast.add_trace(
-                    go.Scatter(
-                        x=[dates[-1]] + list(forecast_dates),
-                        y=[churn_month.iloc[-1]] + list(forecast_values),
-                        mode="lines",
-                        name=f"Прогноз оттока ({months_forward} мес.)",
-                        line=dict(color="orange", width=2, dash="dot"),
-                    )
+        if len(forecast) > 0:
+            # Прогнозные данные начинаются после последней фактической даты,
+            # добавляем последнюю фактическую точку для плавного перехода
+            fig_churn_forecast.add_trace(
+                go.Scatter(
+                    x=[dates[-1]] + list(forecast.index),
+                    y=[churn_month.iloc[-1]] + list(forecast["churn_month_forecast"]),
+                    mode="lines",
+                    name=f"Прогноз оттока ({months_forward} {unit})",
+                    line=dict(color="orange", width=2, dash="dot"),
                 )
+            )
         fig_churn_forecast.update_layout(
-            title=f"График прогноза оттока (экстраполяция {months_forward} мес.)",
+            title=f"График прогноза оттока (экстраполяция {months_forward} {unit})",
             xaxis_title="Дата",
             yaxis_title="Доля оттока",
             hovermode="x unified",
@@ -671,42 +1120,274 @@ def create_plots(n_clicks, metrics_data, button_id, months_forward):
                 line=dict(color="green", width=2),
             )
         )
-        if growth_ext is not None:
-            # Разделяем фактические и прогнозные данные
-            # Прогнозные данные начинаются после последней фактической даты
-            last_actual_idx = len(dates)
-            forecast_dates = growth_ext.index[last_actual_idx:]
-            forecast_values = growth_ext.values[last_actual_idx:]
-            # Добавляем последнюю фактическую точку для плавного перехода
-            if len(forecast_dates) > 0:
-                fig_growth_forecast.add_trace(
-                    go.Scatter(
-                        x=[dates[-1]] + list(forecast_dates),
-                        y=[growth_rate_month.iloc[-1]] + list(forecast_values),
-                        mode="lines",
-                        name=f"Прогноз притока ({months_forward} мес.)",
-                        line=dict(color="blue", width=2, dash="dot"),
-                    )
+        if len(forecast) > 0:
+            # Прогнозные данные начинаются после последней фактической даты,
+            # добавляем последнюю фактическую точку для плавного перехода
+            fig_growth_forecast.add_trace(
+                go.Scatter(
+                    x=[dates[-1]] + list(forecast.index),
+                    y=[growth_rate_month.iloc[-1]] + list(forecast["growth_rate_month_forecast"]),
+                    mode="lines",
+                    name=f"Прогноз притока ({months_forward} {unit})",
+                    line=dict(color="blue", width=2, dash="dot"),
                 )
+            )
         fig_growth_forecast.update_layout(
-            title=f"График прогноза притока (экстраполяция {months_forward} мес.)",
+            title=f"График прогноза притока (экстраполяция {months_forward} {unit})",
             xaxis_title="Дата",
             yaxis_title="Доля притока",
             hovermode="x unified",
         )
 
+        graphs = [
+            html.H4("Графики метрик и прогноза", style={"marginTop": "20px"}),
+            dcc.Graph(figure=fig_churn),
+            dcc.Graph(figure=fig_growth),
+            dcc.Graph(figure=fig_churn_forecast),
+            dcc.Graph(figure=fig_growth_forecast),
+        ]
+
+        # График 5: Удержание выручки (если указана колонка с суммой)
+        if "nrr_month" in df_metrics.columns:
+            fig_revenue = go.Figure()
+            for column, name, color in (
+                ("nrr_month", "NRR", "purple"),
+                ("grr_month", "GRR", "gray"),
+                ("expansion_month", "Расширение", "green"),
+                ("contraction_month", "Сокращение", "orange"),
+            ):
+                fig_revenue.add_trace(
+                    go.Scatter(
+                        x=dates,
+                        y=df_metrics[column].replace([np.inf, -np.inf], np.nan),
+                        mode="lines+markers",
+                        name=name,
+                        line=dict(color=color, width=2),
+                    )
+                )
+            fig_revenue.update_layout(
+                title="Удержание выручки",
+                xaxis_title="Дата",
+                yaxis_title="Доля выручки предыдущего периода",
+                hovermode="x unified",
+            )
+            graphs.append(dcc.Graph(figure=fig_revenue))
+
+        # График 6: Кривые выживаемости Kaplan-Meier по когортам
+        if "survival" in metrics_data[filename]:
+            survival_curves = decode_frame(metrics_data[filename]["survival"])
+            cohorts = [c for c in survival_curves["cohort"].unique() if c != ALL_COHORTS]
+            fig_survival = go.Figure()
+            # Показываем последние когорты, чтобы график оставался читаемым
+            for cohort in cohorts[-SURVIVAL_COHORTS:]:
+                curve = survival_curves[survival_curves["cohort"] == cohort]
+                fig_survival.add_trace(
+                    go.Scatter(
+                        x=curve["period"],
+                        y=curve["survival"],
+                        mode="lines",
+                        name=cohort,
+                        line=dict(width=1),
+                        opacity=0.6,
+                    )
+                )
+            curve = survival_curves[survival_curves["cohort"] == ALL_COHORTS]
+            fig_survival.add_trace(
+                go.Scatter(
+                    x=curve["period"],
+                    y=curve["survival"],
+                    mode="lines+markers",
+                    name="Все клиенты",
+                    line=dict(color="black", width=3),
+                )
+            )
+            fig_survival.update_layout(
+                title="Кривые выживаемости (Kaplan-Meier) по месячным когортам",
+                xaxis_title="Месяцев с первой покупки",
+                yaxis_title="Доля оставшихся клиентов",
+                hovermode="x unified",
+            )
+            graphs.append(dcc.Graph(figure=fig_survival))
+
+        return html.Div(graphs)
+    except Exception as e:
         return html.Div(
+            f"Ошибка при создании графиков: {str(e)}",
+            style={"color": "red", "marginTop": "10px"},
+        )
+
+
+@callback(
+    Output("compare-block", "style"),
+    Output("compare-datasets", "options"),
+    Output("compare-datasets", "value"),
+    Input({"type": "metrics-store", "index": ALL}, "data"),
+    State("compare-datasets", "value"),
+)
+def update_compare_datasets(stores, selected):
+    """Список обработанных наборов данных для сравнения"""
+    names = [name for data in stores if data for name in data]
+    if len(names) < 2:
+        return {"display": "none"}, [], []
+    selected = [name for name in selected or [] if name in names]
+    if len(selected) < 2:
+        selected = names
+    return {"display": "block", "margin": "20px"}, names, selected
+
+
+@callback(
+    Output("compare-output", "children"),
+    Input("compare-btn", "n_clicks"),
+    Input("compare-granularity", "value"),
+    Input("compare-align", "value"),
+    State("compare-datasets", "value"),
+    State({"type": "metrics-store", "index": ALL}, "data"),
+    State("compare-forecast", "value"),
+    prevent_initial_call=True,
+)
+@profiled("build_comparison")
+def create_comparison(n_clicks, freq, align, selected, stores, forecast_periods):
+    """
+    Общий график оттока и притока для нескольких наборов данных.
+
+    Метрики и прогнозы берутся из metrics-store каждого набора без пересчета,
+    графики оттока и притока имеют общую ось времени (масштаб связан).
+    """
+    import numpy as np
+    import pandas as pd
+    import plotly.graph_objs as go
+    from plotly.subplots import make_subplots
+
+    from app.periods import DEFAULT_FREQ, GRANULARITY_LABELS, GRANULARITY_UNITS
+    from app.transport import decode_frame
+
+    if not n_clicks:
+        return ""
+
+    cached = {name: entry for data in stores if data for name, entry in data.items()}
+    names = [name for name in selected or [] if name in cached]
+    if not names:
+        return html.Div("Выберите наборы данных для сравнения", style={"color": "red"})
+
+    try:
+        freq = freq or DEFAULT_FREQ
+        unit = GRANULARITY_UNITS[freq]
+        # Наборы без завершенных периодов этой гранулярности не сравниваются
+        names = [name for name in names if freq in cached[name]["metrics"]]
+        if not names:
+            return html.Div(
+                "Недостаточно данных: нет ни одного завершенного периода "
+                f"(гранулярность «{GRANULARITY_LABELS[freq].lower()}»)",
+                style={"color": "red"},
+            )
+        forecast_periods = int(forecast_periods) if forecast_periods is not None else 0
+        forecast_periods = max(0, min(MAX_FORECAST_PERIODS, forecast_periods))
+
+        fig = make_subplots(
+            rows=2,
+            cols=1,
+            shared_xaxes=True,
+            vertical_spacing=0.08,
+            subplot_titles=("Отток", "Приток"),
+        )
+        summary = []
+        for position, name in enumerate(names):
+            color = COMPARE_COLORS[position % len(COMPARE_COLORS)]
+            df_metrics = decode_frame(cached[name]["metrics"][freq])
+            forecast = cached_forecast(cached[name], freq, forecast_periods)
+            dates = pd.DatetimeIndex(df_metrics["year_month"].dt.to_timestamp())
+            if align == "start":
+                # Наборы за разные годы совмещаются по номеру периода
+                x = np.arange(len(dates))
+                x_forecast = np.arange(len(dates), len(dates) + len(forecast))
+            else:
+                x, x_forecast = dates, forecast.index
+
+            # Средние в сводке считаются без пропусков, как в metrics_summary,
+            # нулями пропуски заполняются только для графиков
+            observed = {
+                "churn_month": df_metrics["churn_month"],
+                "growth_rate_month": df_metrics["growth_rate_month"].replace(
+                    [np.inf, -np.inf], np.nan
+                ),
+            }
+            series = {column: values.fillna(0) for column, values in observed.items()}
+            for row, (column, values) in enumerate(series.items(), start=1):
+                fig.add_trace(
+                    go.Scatter(
+                        x=x,
+                        y=values,
+                        mode="lines+markers",
+                        name=name,
+                        legendgroup=name,
+                        showlegend=row == 1,
+                        line=dict(color=color, width=2),
+                    ),
+                    row=row,
+                    col=1,
+                )
+                if len(forecast) > 0 and len(values) > 0:
+                    fig.add_trace(
+                        go.Scatter(
+                            x=[x[-1]] + list(x_forecast),
+                            y=[values.iloc[-1]] + list(forecast[f"{column}_forecast"]),
+                            mode="lines",
+                            name=f"{name} (прогноз)",
+                            legendgroup=name,
+                            showlegend=False,
+                            line=dict(color=color, width=2, dash="dot"),
+                        ),
+                        row=row,
+                        col=1,
+                    )
+
+            summary.append(
+                html.Tr(
+                    [
+                        html.Td(name),
+                        html.Td(f"{observed['churn_month'].mean():.2%}"),
+                        html.Td(f"{observed['growth_rate_month'].mean():.2%}"),
+                        html.Td(
+                            f"{forecast['churn_month_forecast'].iloc[-1]:.2%}"
+                            if len(forecast) > 0
+                            else "—"
+                        ),
+                    ]
+                )
+            )
+
+        fig.update_layout(
+            title=f"Сравнение наборов данных ({GRANULARITY_LABELS[freq].lower()})",
+            hovermode="x unified",
+            height=700,
+        )
+        fig.update_yaxes(title_text="Доля оттока", row=1, col=1)
+        fig.update_yaxes(title_text="Доля притока", row=2, col=1)
+        fig.update_xaxes(
+            title_text=f"Периодов от начала данных ({unit})" if align == "start" else "Дата",
+            row=2,
+            col=1,
+        )
+
+        table = html.Table(
             [
-                html.H4("Графики метрик и прогноза", style={"marginTop": "20px"}),
-                dcc.Graph(figure=fig_churn),
-                dcc.Graph(figure=fig_growth),
-                dcc.Graph(figure=fig_churn_forecast),
-                dcc.Graph(figure=fig_growth_forecast),
+                html.Thead(
+                    html.Tr(
+                        [
+                            html.Th("Набор данных"),
+                            html.Th(f"Средний отток за период ({unit})"),
+                            html.Th(f"Средний прирост за период ({unit})"),
+                            html.Th(f"Прогноз оттока через {forecast_periods} {unit}"),
+                        ]
+                    )
+                ),
+                html.Tbody(summary),
             ]
         )
+        return html.Div([dcc.Graph(figure=fig), table])
     except Exception as e:
         return html.Div(
-            f"Ошибка при создании графиков: {str(e)}",
+            f"Ошибка при сравнении: {str(e)}",
             style={"color": "red", "marginTop": "10px"},
         )
 
@@ -726,4 +1407,7 @@ def update_user_info(_):
 
 
 if __name__ == "__main__":
+    import logging
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     app.run(debug=True, port=8050)
@@ -0,0 +1,52 @@
+"""
+Конфигурация gunicorn для продакшен-запуска дашборда
+
+Настройки задаются переменными окружения:
+- GUNICORN_WORKERS - количество процессов (по умолчанию 2 * CPU + 1)
+- GUNICORN_THREADS - количество потоков в процессе (по умолчанию 2)
+- GUNICORN_TIMEOUT - таймаут запроса в секундах (по умолчанию 300)
+- WARMUP_IMPORTS - загружать pandas/plotly в фоне после старта воркера
+  (по умолчанию true)
+- PORT - порт (по умолчанию 8050)
+
+Процессы не разделяют состояние: загруженные наборы данных хранятся
+в DATA_DIR на диске, замеры профилирования - в PROFILING_MULTIPROC_DIR.
+"""
+
+import multiprocessing
+import os
+import shutil
+import threading
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8050')}"
+workers = int(os.getenv("GUNICORN_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv("GUNICORN_THREADS", "2"))
+# Расчет метрик на больших файлах может занимать минуты
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "300"))
+graceful_timeout = 30
+keepalive = 5
+# Импортируем приложение до форка, чтобы процессы разделяли память модулей
+preload_app = True
+# Пульс воркеров в памяти, а не на диске контейнера
+worker_tmp_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+accesslog = "-"
+errorlog = "-"
+
+# Замеры профилирования объединяются по всем процессам
+os.environ.setdefault(
+    "PROFILING_MULTIPROC_DIR",
+    os.path.join(os.getenv("DATA_DIR", "data"), "profiling"),
+)
+
+
+def on_starting(server):
+    # Очищаем замеры процессов предыдущего запуска
+    shutil.rmtree(os.environ["PROFILING_MULTIPROC_DIR"], ignore_errors=True)
+
+
+def post_worker_init(worker):
+    # Воркер начинает принимать запросы сразу, тяжелые модули загружаются в фоне
+    if os.getenv("WARMUP_IMPORTS", "true").lower() in ("1", "true", "yes", "on"):
+        from dash_customer import warmup_imports
+
+        threading.Thread(target=warmup_imports, daemon=True).start()
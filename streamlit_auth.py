@@ -6,7 +6,7 @@ import streamlit as st
 import os
 import requests
 
-from app.auth import authenticate, create_session, cleanup_expired_sessions
+from app.auth import authenticate, create_session, delete_session
 
 # URL Dash приложения из переменных окружения или по умолчанию
 DASH_URL = os.getenv("DASH_URL", "http://localhost:8050")
@@ -18,9 +18,6 @@ st.set_page_config(
     layout="centered",
 )
 
-# Очистка истекших сессий
-cleanup_expired_sessions()
-
 # Инициализация состояния сессии
 if "authenticated" not in st.session_state:
     st.session_state.authenticated = False
@@ -47,17 +44,12 @@ if st.session_state.authenticated and st.session_state.session_token:
     """
     )
 
-    # JavaScript для автоматической установки cookie (опционально)
-    st.markdown(
-        f"""
-        <script>
-        document.cookie = "session_token={st.session_state.session_token}; path=/; max-age={24*60*60}";
-        </script>
-        """,
-        unsafe_allow_html=True,
-    )
+    # Cookie с токеном устанавливает Dash при переходе по ссылке
+    # (dash_customer.py, set_session_cookie)
 
     if st.button("Выйти"):
+        # Отзываем токен, чтобы по нему нельзя было открыть дашборд
+        delete_session(st.session_state.session_token)
         st.session_state.authenticated = False
         st.session_state.session_token = None
         st.session_state.username = None
@@ -0,0 +1,31 @@
+import os
+
+import numpy as np
+import pytest
+
+from benchmarks.synthetic import generate_transactions
+
+# app.config читает USERS при импорте, секрет нужен для подписи токенов
+os.environ.setdefault("USERS", '{"admin": "8c6976e5b5410415bde908bd4dee15dfb167a9c873fc4bb8a81f6f2ab448a918"}')
+os.environ.setdefault("SESSION_SECRET", "test-secret")
+
+
+@pytest.fixture
+def make_transactions():
+    """
+    Фабрика синтетических транзакций (benchmarks.synthetic) для тестов.
+
+    Даты приходятся на 1-28 число, поэтому последний из months месяцев
+    не завершен и в метрики не входит. С segments добавляется колонка region.
+    """
+
+    def make(n_rows=2000, n_clients=200, months=6, seed=0, segments=False):
+        df = generate_transactions(
+            n_rows, n_clients=n_clients, months=months, start="2024-01-01", seed=seed
+        )
+        if segments:
+            rng = np.random.default_rng(seed)
+            df["region"] = rng.choice(["north", "south"], len(df))
+        return df
+
+    return make
@@ -0,0 +1,97 @@
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+import app.auth as auth
+import dash_customer
+
+
+@pytest.fixture(autouse=True)
+def revoked_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(auth, "REVOKED_SESSIONS_FILE", tmp_path / "revoked_sessions.json")
+    monkeypatch.setattr(auth, "_token_cache", {})
+    monkeypatch.setattr(auth, "_revoked", {"mtime": None, "ids": {}})
+
+
+def test_sign_and_verify():
+    token = auth.create_session("admin")
+    assert auth.validate_session(token)
+    assert auth.get_session_username(token) == "admin"
+
+
+def test_tampered_token_rejected():
+    token = auth.create_session("admin")
+    payload, _, signature = token.partition(".")
+    forged = auth._b64encode(b'{"u":"root","exp":9999999999,"jti":"x"}')
+
+    assert not auth.validate_session(f"{forged}.{signature}")
+    assert not auth.validate_session(f"{payload}.{signature[:-2]}AA")
+    assert not auth.validate_session(payload)
+    assert not auth.validate_session("")
+
+
+def test_token_signed_with_other_secret_rejected(monkeypatch):
+    token = auth.create_session("admin")
+    monkeypatch.setattr(auth, "_token_cache", {})
+    monkeypatch.setattr(auth, "SESSION_SECRET", b"other-secret")
+    assert not auth.validate_session(token)
+
+
+def test_expired_token_rejected(monkeypatch):
+    token = auth.create_session("admin")
+    assert auth.validate_session(token)
+
+    now = time.time()
+    monkeypatch.setattr(
+        auth.time, "time", lambda: now + auth.SESSION_LIFETIME_HOURS * 3600 + 1
+    )
+    assert not auth.validate_session(token)
+
+
+def test_revoked_token_rejected():
+    token = auth.create_session("admin")
+    other = auth.create_session("admin")
+    assert auth.validate_session(token)
+
+    auth.delete_session(token)
+    assert not auth.validate_session(token)
+    assert auth.validate_session(other)
+
+
+def test_revocation_seen_by_other_process(monkeypatch):
+    # Streamlit и Dash - разные процессы: Dash узнает об отзыве только из файла
+    token = auth.create_session("admin")
+    assert auth.validate_session(token)
+
+    auth.delete_session(token)
+    monkeypatch.setattr(auth, "_revoked", {"mtime": None, "ids": {}})
+    monkeypatch.setattr(
+        auth, "_token_cache", {token: ("admin", time.time() + 3600, 0)}
+    )
+    assert not auth.validate_session(token)
+
+
+def test_dash_redirects_after_logout():
+    client = dash_customer.app.server.test_client()
+    token = auth.create_session("admin")
+    client.set_cookie("session_token", token)
+    assert client.get("/").status_code == 200
+
+    auth.delete_session(token)
+    assert client.get("/").status_code == 302
+
+
+def test_missing_secret_fails_at_startup():
+    env = {"USERS": '{"admin": "x"}', "SESSION_SECRET": ""}
+    result = subprocess.run(
+        [sys.executable, "-c", "import app.auth"],
+        env=env,
+        cwd=Path(__file__).resolve().parents[1],
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode != 0
+    assert "RuntimeError: Не задан SESSION_SECRET" in result.stderr
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from app.batch import read_input_partials
+from app.partials import PartialAggregate, merge_partials
+
+
+@pytest.fixture
+def transactions_csv(tmp_path, make_transactions):
+    df = make_transactions(5000, n_clients=500, months=7, segments=True)
+    path = tmp_path / "transactions.csv"
+    df.to_csv(path, index=False)
+    return str(path), df
+
+
+def assert_same(left: PartialAggregate, right: PartialAggregate):
+    assert left.periods.equals(right.periods)
+    for a, b in zip(left.clients, right.clients):
+        np.testing.assert_array_equal(a, b)
+    for a, b in zip(left.amounts, right.amounts):
+        np.testing.assert_allclose(a, b)
+
+
+@pytest.mark.parametrize("chunksize", [100, 700, 10_000])
+def test_chunked_read_matches_single_pass(transactions_csv, chunksize):
+    path, df = transactions_csv
+    states = read_input_partials(
+        path, "date", "client_id", segment_col="region", chunksize=chunksize, amount_col="amount"
+    )
+    expected = PartialAggregate.from_frame(df, amount_col="amount")
+    assert_same(states["all"], expected)
+    assert_same(
+        states["north"],
+        PartialAggregate.from_frame(df[df["region"] == "north"], amount_col="amount"),
+    )
+
+
+def test_merge_partials_matches_pairwise_merge(transactions_csv):
+    _, df = transactions_csv
+    parts = [PartialAggregate.from_frame(part, freq="W") for part in np.array_split(df, 5)]
+    pairwise = parts[0]
+    for part in parts[1:]:
+        pairwise = pairwise.merge(part)
+    merged = merge_partials(parts)
+    assert merged.periods.equals(pairwise.periods)
+    assert merged.min_date == pairwise.min_date and merged.max_date == pairwise.max_date
+    for a, b in zip(merged.clients, pairwise.clients):
+        np.testing.assert_array_equal(a, b)
+
+
+@pytest.mark.parametrize(
+    "options, message",
+    [
+        (["--approximate", "--survival"], "выживаемости"),
+        (["--save-sketches", "out.sketches.npz"], "--approximate"),
+    ],
+    ids=["approximate-survival", "exact-save-sketches"],
+)
+def test_cli_reports_incompatible_options(transactions_csv, tmp_path, capsys, options, message):
+    import batch_metrics
+
+    path, _ = transactions_csv
+    output = str(tmp_path / "metrics.csv")
+    assert batch_metrics.main([path, "--output", output, *options]) == 1
+    assert message in capsys.readouterr().err
@@ -0,0 +1,42 @@
+import os
+import time
+
+import pandas as pd
+import pytest
+
+import app.bundle as bundle
+
+
+@pytest.fixture(autouse=True)
+def bundles_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(bundle, "BUNDLES_DIR", tmp_path / "bundles")
+
+
+def store(n):
+    tables = {"metrics/M": pd.DataFrame({"clients": [n]})}
+    return bundle.store_bundle(tables, filename=f"{n}.csv")
+
+
+def test_bundles_limited_by_count(monkeypatch):
+    monkeypatch.setattr(bundle, "MAX_BUNDLES", 2)
+    ids = []
+    for n in range(4):
+        ids.append(store(n))
+        # Порядок бандлов определяется временем изменения
+        os.utime(bundle.bundle_path(ids[-1]), (time.time() - 10 + n,) * 2)
+
+    kept = sorted(path.name for path in bundle.BUNDLES_DIR.iterdir())
+    assert kept == sorted(bundle.bundle_path(i).name for i in ids[-2:])
+    assert bundle.load_bundle(bundle.bundle_path(ids[-1]))["filename"] == "3.csv"
+
+
+def test_expired_bundles_removed():
+    old = store(0)
+    expired = time.time() - (bundle.BUNDLE_TTL_HOURS + 1) * 3600
+    os.utime(bundle.bundle_path(old), (expired, expired))
+
+    data = bundle.bundle_path(store(1)).read_bytes()
+    imported = bundle.store_bundle_bytes(data)
+
+    assert not bundle.bundle_path(old).exists()
+    assert bundle.load_bundle(bundle.bundle_path(imported))["filename"] == "1.csv"
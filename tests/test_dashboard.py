@@ -0,0 +1,90 @@
+import pandas as pd
+import pytest
+
+import app.bundle
+import dash_customer
+from app.transport import decode_frame, encode_frame
+
+
+@pytest.fixture(autouse=True)
+def bundles_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(app.bundle, "BUNDLES_DIR", tmp_path / "bundles")
+
+
+def process(df, filename="data.csv", amount_col=""):
+    return dash_customer.process_data(
+        1,
+        {filename: encode_frame(df)},
+        {"type": "process-btn", "index": filename},
+        "date",
+        "client_id",
+        amount_col,
+    )
+
+
+@pytest.fixture
+def two_months(make_transactions):
+    # Январь и февраль завершены; даты приходят строками, как из загруженного файла
+    df = make_transactions(500, n_clients=50, months=3)
+    return df.assign(date=df["date"].dt.strftime("%Y-%m-%d"))
+
+
+def test_short_history_processed_without_quarters(two_months):
+    status, metrics_data = process(two_months)
+    assert "Ошибка" not in str(status)
+
+    entry = metrics_data["data.csv"]
+    assert set(entry["metrics"]) == {"D", "W", "M"}
+    assert len(decode_frame(entry["metrics"]["M"])) == 2
+
+    button = {"type": "plot-btn", "index": "data.csv"}
+    assert "Недостаточно данных" in str(
+        dash_customer.create_plots(1, "Q", metrics_data, button, 3)
+    )
+    assert "Недостаточно данных" not in str(
+        dash_customer.create_plots(1, "M", metrics_data, button, 3)
+    )
+
+
+def test_memory_budget_spills_chunked_dataset(tmp_path, monkeypatch, two_months):
+    import app.datasets
+    import app.spill
+
+    monkeypatch.setattr(app.datasets, "DATASETS_DIR", tmp_path / "datasets")
+    df = two_months
+    meta = app.datasets.create_dataset(
+        lambda f: f.write(df.to_csv(index=False).encode()), "data.csv"
+    )
+    stored = {"data.csv": {"dataset_id": meta["dataset_id"]}}
+
+    def run():
+        button = {"type": "process-btn", "index": "data.csv"}
+        _, metrics_data = dash_customer.process_data(
+            1, stored, button, "date", "client_id", "amount"
+        )
+        return metrics_data["data.csv"]
+
+    expected = run()
+    monkeypatch.setattr(app.spill, "MEMORY_BUDGET", "1")
+    monkeypatch.setattr(app.spill, "SPILL_DIR", str(tmp_path / "spill"))
+    (tmp_path / "spill").mkdir()
+    spilled = run()
+
+    assert set(spilled["metrics"]) == set(expected["metrics"])
+    for freq in expected["metrics"]:
+        pd.testing.assert_frame_equal(
+            decode_frame(spilled["metrics"][freq]), decode_frame(expected["metrics"][freq])
+        )
+    assert list((tmp_path / "spill").iterdir()) == []
+
+
+def test_comparison_summary_skips_missing_periods(two_months):
+    _, metrics_data = process(two_months)
+    metrics = decode_frame(metrics_data["data.csv"]["metrics"]["D"])
+    assert metrics["churn_month"].isna().any()
+
+    comparison = str(
+        dash_customer.create_comparison(1, "D", "date", ["data.csv"], [metrics_data], 0)
+    )
+    assert f"{metrics['churn_month'].mean():.2%}" in comparison
+    assert f"{metrics['churn_month'].fillna(0).mean():.2%}" not in comparison
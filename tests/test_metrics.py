@@ -0,0 +1,39 @@
+import pandas as pd
+import pytest
+
+from app.batch import forecast_metrics
+from app.metrics import calculate_metrics, calculate_metrics_approx
+from app.partials import PartialAggregate
+from app.preprocessing import preprocessing_data_approx
+from app.sketches import PeriodSketches
+
+
+@pytest.mark.parametrize("amount_col", [None, "amount"])
+def test_short_history_has_no_quarters(make_transactions, amount_col):
+    # Январь и февраль завершены, март - нет
+    df = make_transactions(500, n_clients=50, months=3)
+    assert df["date"].max() < pd.Timestamp("2024-03-31")
+    daily = PartialAggregate.from_frame(df, freq="D", amount_col=amount_col)
+
+    monthly = calculate_metrics(daily.rollup("M").to_grouped())
+    assert len(monthly) == 2
+
+    quarterly = calculate_metrics(daily.rollup("Q").to_grouped())
+    assert quarterly.empty
+    assert {"churn_month", "retention_period", "new_clients_period"} <= set(quarterly.columns)
+    forecast = forecast_metrics(quarterly, 12, freq="Q")
+    assert forecast.empty
+    assert list(forecast.columns) == [
+        "year_month",
+        "churn_month_forecast",
+        "growth_rate_month_forecast",
+    ]
+
+
+def test_approx_metrics_without_complete_month(make_transactions):
+    df = make_transactions(500, n_clients=50, months=1)
+    metrics = calculate_metrics_approx(
+        preprocessing_data_approx(sketches=PeriodSketches.from_frame(df))
+    )
+    assert metrics.empty
+    assert "churn_month" in metrics.columns
@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.period_index import ClientPeriodIndex, period_range
+from app.preprocessing import preprocessing_data
+from app.sketches import PeriodSketches
+
+
+@pytest.fixture
+def transactions(make_transactions):
+    df = make_transactions(3000, n_clients=150, months=16)
+    # Два месяца без транзакций и транзакции без client_id
+    gaps = df["date"].dt.to_period("M").isin(pd.PeriodIndex(["2024-03", "2024-04"], freq="M"))
+    df = df[~gaps].reset_index(drop=True)
+    df["client_id"] = df["client_id"].astype(float)
+    df.loc[::13, "client_id"] = np.nan
+    return df
+
+
+def reference_sets(df, periods):
+    """Множества client_id по периодам без пропущенных идентификаторов"""
+    known = df.dropna(subset=["client_id"])
+    grouped = known.groupby(known["date"].dt.to_period("M"))["client_id"].agg(set)
+    return [grouped.get(period, set()) for period in periods]
+
+
+def test_index_matches_sets(transactions):
+    periods = period_range(transactions["date"].min(), transactions["date"].max(), "M")
+    index = ClientPeriodIndex.from_pairs(
+        transactions["date"].dt.to_period("M").array.asi8,
+        transactions["client_id"].to_numpy(),
+        periods,
+    )
+    expected = reference_sets(transactions, periods)
+
+    assert [set(values) for values in index.sets()] == expected
+    np.testing.assert_array_equal(index.counts(), [len(s) for s in expected])
+    for lag in (1, 2, 12):
+        np.testing.assert_array_equal(
+            index.overlap(lag),
+            [len(s & expected[i - lag]) if i >= lag else 0 for i, s in enumerate(expected)],
+        )
+        np.testing.assert_array_equal(
+            index.lagged_counts(lag),
+            [len(expected[i - lag]) if i >= lag else 0 for i in range(len(expected))],
+        )
+
+
+def test_missing_client_not_attached_to_previous_period():
+    df = pd.DataFrame(
+        {
+            "date": pd.to_datetime(["2024-01-05", "2024-01-06", "2024-02-03", "2024-02-29"]),
+            "client_id": [1, 2, np.nan, 3],
+        }
+    )
+    grouped = preprocessing_data(df)
+    assert grouped["clients"].tolist() == [{1.0, 2.0}, {3.0}]
+    assert grouped["clients_count"].tolist() == [2, 1]
+    assert grouped["clients_intersection"].tolist() == [0, 0]
+
+
+def test_sketches_ignore_missing_clients(transactions):
+    known = transactions.dropna(subset=["client_id"])
+    with_missing = PeriodSketches.from_frame(transactions)
+    expected = PeriodSketches.from_frame(known)
+    assert with_missing.periods.equals(expected.periods)
+    np.testing.assert_array_equal(with_missing.registers, expected.registers)
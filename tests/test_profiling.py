@@ -0,0 +1,113 @@
+import json
+import tracemalloc
+
+import pytest
+from flask import Flask
+
+from app import profiling
+
+
+@pytest.fixture(autouse=True)
+def profiling_state(monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILING_ENABLED", True)
+    monkeypatch.setattr(profiling, "PROFILING_TRACEMALLOC", False)
+    monkeypatch.setattr(profiling, "PROFILING_MULTIPROC_DIR", None)
+    profiling.reset_stats()
+    yield
+    profiling.reset_stats()
+    tracemalloc.stop()
+
+
+def test_stage_records_rows_and_calls():
+    for rows in (10, 5):
+        with profiling.stage("read") as rec:
+            rec["rows"] = rows
+
+    stats = profiling.get_stats()["read"]
+    assert stats["calls"] == 2
+    assert stats["rows"] == 15
+    assert stats["wall"] >= 0 and stats["cpu"] >= 0
+
+
+def test_nested_peak_propagates_to_parent(monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILING_TRACEMALLOC", True)
+    with profiling.stage("outer"):
+        with profiling.stage("inner"):
+            block = bytearray(8 * 2**20)
+        del block
+
+    stats = profiling.get_stats()
+    assert stats["inner"]["peak"] >= 8 * 2**20
+    # Пик вложенного этапа входит в пик родителя, хотя счетчик сбрасывался
+    assert stats["outer"]["peak"] >= stats["inner"]["peak"]
+
+
+def test_disabled_fast_path(monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILING_ENABLED", False)
+
+    @profiling.profiled("decorated")
+    def compute():
+        return 42
+
+    with profiling.stage("skipped") as rec:
+        rec["rows"] = 1
+    assert rec is profiling._NULL_RECORD
+    assert "rows" not in rec
+    assert compute() == 42
+    assert profiling.get_stats() == {}
+
+
+def test_profiled_counts_table_rows():
+    @profiling.profiled()
+    def table():
+        import pandas as pd
+
+        return pd.DataFrame({"a": range(7)})
+
+    table()
+    assert profiling.get_stats()["table"]["rows"] == 7
+
+
+def test_prometheus_format():
+    with profiling.stage('load "csv"', rows=3):
+        pass
+
+    lines = profiling.render_prometheus().splitlines()
+    assert "# TYPE clients_calculator_stage_calls_total counter" in lines
+    assert "# TYPE clients_calculator_stage_peak_memory_bytes gauge" in lines
+    assert 'clients_calculator_stage_calls_total{stage="load \\"csv\\""} 1' in lines
+    assert 'clients_calculator_stage_rows_total{stage="load \\"csv\\""} 3' in lines
+    assert any(line.startswith("clients_calculator_process_max_rss_bytes ") for line in lines)
+
+
+def test_process_stats_merged(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILING_MULTIPROC_DIR", str(tmp_path))
+    with profiling.stage("metrics", rows=4):
+        pass
+    # Замеры другого воркера и поврежденный файл
+    (tmp_path / "1.json").write_text(
+        json.dumps({"metrics": {"calls": 2, "wall": 1.0, "cpu": 0.5, "rows": 6, "peak": 100}})
+    )
+    (tmp_path / "2.json").write_text("{")
+
+    stats = profiling.get_stats()["metrics"]
+    assert stats["calls"] == 3
+    assert stats["rows"] == 10
+    assert stats["peak"] == 100
+    assert stats["wall"] >= 1.0
+
+
+def test_metrics_endpoint(monkeypatch):
+    server = Flask(__name__)
+    profiling.register_metrics_endpoint(server)
+    client = server.test_client()
+    with profiling.stage("plot"):
+        pass
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    assert 'stage="plot"' in response.get_data(as_text=True)
+
+    monkeypatch.setattr(profiling, "PROFILING_ENABLED", False)
+    assert client.get("/metrics").status_code == 404
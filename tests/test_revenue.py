@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.metrics import calculate_metrics
+from app.partials import PartialAggregate
+
+
+def reference_revenue(df, periods, lag):
+    """Компоненты выручки перебором по словарям {client_id: сумма}"""
+    known = df.dropna(subset=["client_id"])
+    sums = known.groupby([known["date"].dt.to_period("M"), "client_id"])["amount"].sum()
+    by_period = {period: sums.loc[period].to_dict() for period in sums.index.levels[0]}
+
+    rows = []
+    for position, period in enumerate(periods):
+        current = by_period.get(period, {})
+        base = by_period.get(periods[position - lag], {}) if position >= lag else {}
+        rows.append(
+            {
+                "revenue": sum(current.values()),
+                "revenue_prev": sum(base.values()),
+                "revenue_retained": sum(current.get(c, 0) for c in base),
+                "revenue_expansion": sum(
+                    max(current[c] - v, 0) for c, v in base.items() if c in current
+                ),
+                "revenue_contraction": sum(
+                    max(v - current[c], 0) for c, v in base.items() if c in current
+                ),
+                "revenue_churned": sum(v for c, v in base.items() if c not in current),
+            }
+        )
+    return pd.DataFrame(rows)
+
+
+@pytest.fixture
+def transactions(make_transactions):
+    df = make_transactions(3000, n_clients=150, months=16)
+    # Месяц без транзакций и транзакции без client_id
+    df = df[df["date"].dt.to_period("M") != pd.Period("2024-05", "M")].reset_index(drop=True)
+    df["client_id"] = df["client_id"].astype(float)
+    df.loc[::17, "client_id"] = np.nan
+    return df
+
+
+def test_revenue_matches_brute_force(transactions):
+    grouped = PartialAggregate.from_frame(transactions, freq="M", amount_col="amount").to_grouped()
+    periods = list(grouped["year_month"])
+    assert pd.Period("2024-05", "M") in periods
+
+    for lag, suffix in ((1, ""), (12, "_year")):
+        expected = reference_revenue(transactions, periods, lag)
+        for column in expected:
+            name = column if column == "revenue" else f"{column}{suffix}"
+            np.testing.assert_allclose(grouped[name], expected[column], err_msg=name)
+
+
+def test_revenue_ratios(transactions):
+    metrics = calculate_metrics(
+        PartialAggregate.from_frame(transactions, freq="M", amount_col="amount").to_grouped()
+    )
+    expected = reference_revenue(transactions, list(metrics["year_month"]), 1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        prev = expected["revenue_prev"].to_numpy()
+        np.testing.assert_allclose(metrics["nrr_month"], expected["revenue_retained"] / prev)
+        np.testing.assert_allclose(
+            metrics["expansion_month"], expected["revenue_expansion"] / prev
+        )
+        np.testing.assert_allclose(
+            metrics["contraction_month"], expected["revenue_contraction"] / prev
+        )
+        np.testing.assert_allclose(
+            metrics["grr_month"],
+            (prev - expected["revenue_contraction"] - expected["revenue_churned"]) / prev,
+        )
@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+
+from app.batch import process_inputs
+from app.sketches import (
+    DEFAULT_PRECISION,
+    PeriodSketches,
+    estimate_counts,
+    load_sketches,
+    register_updates,
+    save_sketches,
+)
+
+
+def test_save_load_round_trip(tmp_path, make_transactions):
+    df = make_transactions(segments=True)
+    sketches = {
+        "all": PeriodSketches.from_frame(df),
+        "north": PeriodSketches.from_frame(df[df["region"] == "north"]),
+    }
+    path = tmp_path / "part.sketches.npz"
+    save_sketches(path, sketches)
+    loaded = load_sketches(path)
+
+    assert list(loaded) == ["all", "north"]
+    for segment, original in sketches.items():
+        assert loaded[segment].periods.equals(original.periods)
+        np.testing.assert_array_equal(loaded[segment].registers, original.registers)
+        assert loaded[segment].min_date == original.min_date
+        assert loaded[segment].max_date == original.max_date
+
+
+def test_saved_sketches_merge_across_runs(tmp_path, make_transactions):
+    paths = []
+    for seed in range(2):
+        path = tmp_path / f"part{seed}.csv"
+        make_transactions(seed=seed, segments=True).to_csv(path, index=False)
+        paths.append(str(path))
+    options = dict(approximate=True, segment_col="region", jobs=1)
+
+    sketch_paths = []
+    for i, path in enumerate(paths):
+        sketch_path = str(tmp_path / f"part{i}.sketches.npz")
+        process_inputs([path], sketches_output=sketch_path, **options)
+        sketch_paths.append(sketch_path)
+
+    direct, _ = process_inputs(paths, **options)
+    merged, _ = process_inputs(sketch_paths, **options)
+    pd.testing.assert_frame_equal(merged, direct)
+
+
+def test_estimate_unbiased_across_ranges():
+    # Раньше при переходе с линейного подсчета на сырую оценку (2.5m - 5m)
+    # смещение было около +1.5%
+    m = 1 << DEFAULT_PRECISION
+    rng = np.random.default_rng(0)
+    for n in (1000, 40_000, 50_000, 200_000):
+        registers = np.zeros((30, m), dtype=np.uint8)
+        for row in registers:
+            index, rank = register_updates(rng.integers(0, 2**64, n, dtype=np.uint64), DEFAULT_PRECISION)
+            np.maximum.at(row, index, rank)
+        errors = estimate_counts(registers) / n - 1
+        assert abs(errors.mean()) < 0.004, n
+        assert errors.std() < 0.012, n
+
+    assert estimate_counts(np.zeros(m, dtype=np.uint8))[0] == 0
@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+
+from app.metrics import calculate_metrics
+from app.partials import PartialAggregate
+from app.survival import ALL_COHORTS, aggregate_survival_tables, survival_tables
+
+
+def test_survival_uses_metrics_periods(make_transactions):
+    # Последний месяц (май) не завершен и не входит в метрики
+    df = make_transactions(3000, n_clients=300, months=5)
+    assert df["date"].max() < pd.Timestamp("2024-05-31")
+    monthly = PartialAggregate.from_frame(df, freq="M")
+    metrics = calculate_metrics(monthly.to_grouped())
+    curves, lifetimes = aggregate_survival_tables(monthly)
+
+    cohorts = lifetimes.loc[lifetimes["cohort"] != ALL_COHORTS, "cohort"].tolist()
+    assert cohorts == metrics["year_month"].astype(str).tolist()
+    assert curves.loc[curves["cohort"] == ALL_COHORTS, "period"].max() == len(metrics)
+
+
+def test_survival_without_completed_period(make_transactions):
+    monthly = PartialAggregate.from_frame(make_transactions(months=1), freq="M")
+    curves, lifetimes = aggregate_survival_tables(monthly)
+    assert curves.empty and lifetimes.empty
+
+
+def test_clients_active_in_last_period_are_censored():
+    # Клиент 1 активен в периодах 0..2, клиент 2 - только в периоде 0
+    ordinals = np.array([0, 1, 2, 0, 3])
+    clients = np.array([1, 1, 1, 2, 2])
+    _, lifetimes = survival_tables(ordinals, clients, last_period=2)
+    overall = lifetimes[lifetimes["cohort"] == ALL_COHORTS].iloc[0]
+    assert overall["clients"] == 2
+    assert overall["churned"] == 1
+
+
+def test_spilled_survival_in_parts_matches_memory(tmp_path, make_transactions):
+    from app.spill import BYTES_PER_PAIR, ExternalAggregate
+
+    df = make_transactions(3000, n_clients=300, months=8)
+    expected = aggregate_survival_tables(PartialAggregate.from_frame(df, freq="M"))
+    external = ExternalAggregate.spill(PartialAggregate.from_frame(df, freq="M"), str(tmp_path))
+
+    budget = 200 * BYTES_PER_PAIR
+    last_period = pd.Period("2024-07", "M").ordinal
+    parts = list(external.client_lifetimes(last_period, budget))
+    assert len(parts) > 1
+    assert sum(len(first) for first, _ in parts) == expected[1]["clients"].iloc[-1]
+
+    for table, reference in zip(aggregate_survival_tables(external, budget), expected):
+        pd.testing.assert_frame_equal(table, reference)
@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.transport import decode_frame, encode_frame
+
+
+@pytest.mark.parametrize(
+    "series",
+    [
+        pd.Series([np.nan, np.nan], dtype="float64"),
+        pd.Series([], dtype="float64"),
+        pd.Series([1.5, np.nan], dtype="float32"),
+        pd.Series([1, 2], dtype="int64"),
+        pd.Series([], dtype="int64"),
+        pd.Series([True, False]),
+        pd.Series([1, None], dtype="Int64"),
+        pd.Series([0.5, None], dtype="Float64"),
+        pd.Series(pd.period_range("2024-01", periods=2, freq="M")),
+        pd.Series(pd.to_datetime(["2024-01-01", None])),
+        pd.Series(["a", None]),
+    ],
+)
+def test_columnar_round_trip(series):
+    df = pd.DataFrame({"value": series})
+    pd.testing.assert_frame_equal(decode_frame(encode_frame(df, "columnar")), df)
+
+
+def test_infinity_sent_as_null():
+    df = pd.DataFrame({"value": [np.inf, 1.0]})
+    decoded = decode_frame(encode_frame(df, "columnar"))
+    assert decoded["value"].isna().tolist() == [True, False]
+
+
+def test_records_payload_supported():
+    decoded = decode_frame([{"a": 1}, {"a": 2}])
+    assert decoded["a"].tolist() == [1, 2]
@@ -0,0 +1,120 @@
+import io
+import os
+import time
+
+import pytest
+from flask import Flask
+
+from app import datasets, uploads
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(datasets, "DATASETS_DIR", tmp_path / "datasets")
+    monkeypatch.setattr(uploads, "UPLOADS_DIR", tmp_path / "uploads")
+    return tmp_path
+
+
+@pytest.fixture
+def client(data_dir):
+    server = Flask(__name__)
+    uploads.register_upload_routes(server)
+    return server.test_client()
+
+
+def upload(client, data: bytes, filename="data.csv"):
+    upload_id = client.post(
+        "/upload/init", json={"filename": filename, "size": len(data)}
+    ).get_json()["upload_id"]
+    response = client.post(
+        f"/upload/{upload_id}/chunk",
+        data={"offset": "0", "chunk": (io.BytesIO(data), filename)},
+    )
+    assert response.status_code == 200
+    return client.post(f"/upload/{upload_id}/complete").get_json()
+
+
+def test_upload_creates_dataset(client):
+    dataset = upload(client, b"date,client_id\n2024-01-01,1\n")
+    assert dataset["columns"] == ["date", "client_id"]
+    assert datasets.dataset_path(dataset["dataset_id"]).exists()
+
+
+@pytest.mark.parametrize(
+    "payload",
+    [
+        None,
+        {"size": 10},
+        {"filename": "data.csv", "size": "abc"},
+        {"filename": "data.csv", "size": -1},
+        {"filename": "data.csv", "size": [1]},
+    ],
+)
+def test_init_rejects_bad_input(client, payload):
+    response = client.post("/upload/init", json=payload)
+    assert response.status_code == 400
+
+
+def test_init_rejects_too_large_file(client, monkeypatch):
+    monkeypatch.setattr(uploads, "MAX_UPLOAD_SIZE", 100)
+    response = client.post("/upload/init", json={"filename": "data.csv", "size": 101})
+    assert response.status_code == 413
+
+
+def test_chunks_limited_by_max_upload_size(client, monkeypatch):
+    monkeypatch.setattr(uploads, "MAX_UPLOAD_SIZE", 10)
+    upload_id = client.post("/upload/init", json={"filename": "data.csv"}).get_json()[
+        "upload_id"
+    ]
+    response = client.post(
+        f"/upload/{upload_id}/chunk",
+        data={"offset": "0", "chunk": (io.BytesIO(b"x" * 11), "data.csv")},
+    )
+    assert response.status_code == 413
+    assert client.get(f"/upload/{upload_id}").get_json()["received"] == 0
+
+
+def test_chunk_rejects_bad_offset(client):
+    upload_id = client.post("/upload/init", json={"filename": "data.csv"}).get_json()[
+        "upload_id"
+    ]
+    response = client.post(
+        f"/upload/{upload_id}/chunk",
+        data={"offset": "abc", "chunk": (io.BytesIO(b"x"), "data.csv")},
+    )
+    assert response.status_code == 400
+
+
+def test_expired_datasets_removed(client, data_dir):
+    old = upload(client, b"date,client_id\n2024-01-01,1\n")
+    old_dir = datasets.dataset_dir(old["dataset_id"])
+    stale = time.time() - (datasets.DATASET_TTL_HOURS + 1) * 3600
+    os.utime(old_dir, (stale, stale))
+
+    new = upload(client, b"date,client_id\n2024-01-01,1\n")
+    assert not old_dir.exists()
+    assert datasets.dataset_dir(new["dataset_id"]).exists()
+
+
+def test_delete_dataset(client):
+    dataset = upload(client, b"date,client_id\n2024-01-01,1\n")
+    datasets.delete_dataset(dataset["dataset_id"])
+    with pytest.raises(FileNotFoundError):
+        datasets.load_meta(dataset["dataset_id"])
+
+
+def test_upload_through_dashboard_after_token_link(data_dir):
+    import dash_customer
+    from app.auth import create_session
+
+    client = dash_customer.app.server.test_client()
+    assert client.post("/upload/init", json={"filename": "a.csv", "size": 1}).status_code == 401
+
+    # Переход по ссылке из Streamlit сохраняет токен в cookie
+    response = client.get(f"/?token={create_session('admin')}")
+    assert response.status_code == 200
+    cookie = response.headers["Set-Cookie"]
+    assert "session_token=" in cookie and "HttpOnly" in cookie
+
+    dataset = upload(client, b"date,client_id\n2024-01-01,1\n")
+    assert dataset["columns"] == ["date", "client_id"]
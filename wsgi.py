@@ -0,0 +1,16 @@
+"""
+WSGI точка входа для продакшен-запуска Dash приложения
+
+    gunicorn -c gunicorn.conf.py wsgi:server
+"""
+
+import logging
+
+from dash_customer import app
+
+# JSON-замеры профилирования пишутся в stderr вместе с логами gunicorn
+profiling_logger = logging.getLogger("clients_calculator.profiling")
+profiling_logger.addHandler(logging.StreamHandler())
+profiling_logger.setLevel(logging.INFO)
+
+server = app.server